@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Apr 17 17:02:51 2021
+
+@author: GIANG Cécile, KHALFAT Célina
+"""
+
+##################### IMPORTATION DES FICHIERS EXTERNES ####################
+
+import os
+import sys
+import time
+from collections import Counter
+import re
+import numpy as np
+import porter
+import Parser as parser
+import Indexer as indexer
+import IRModel as irmodel
+import Query as query
+import textRepresenter as tr
+from Compression import CompressedPostings
+
+
+############################ FONCTIONS UTILITAIRES ###########################
+
+def chrono(f, repeat=3):
+    """ Renvoie le meilleur temps d'exécution (en secondes) de f sur repeat essais.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def dictSize(index_inverse):
+    """ Taille mémoire (octets) d'un index inversé dict(str, dict(int, int)):
+        dictionnaires, clés et valeurs (les petits entiers partagés par Python
+        sont comptés comme les autres).
+    """
+    size = sys.getsizeof(index_inverse)
+    for stem, postings in index_inverse.items():
+        size += sys.getsizeof(stem) + sys.getsizeof(postings)
+        size += sum( sys.getsizeof(idDoc) + sys.getsizeof(tf) for idDoc, tf in postings.items() )
+    return size
+
+
+########################## BENCHMARK: COMPRESSION ###########################
+
+def benchCompression(filename):
+    """ Compare, sur l'index inversé de la collection filename, la place
+        occupée par posting et le débit de décodage de:
+            * l'ancienne représentation dict(str, dict(int, int))
+            * les tableaux CSR non compressés de IndexerSimple
+            * l'index compressé par blocs (cf Compression)
+    """
+    p = parser.Parser(filename)
+    i = indexer.IndexerSimple(p)
+    nbPostings = len(i.post_rows)
+    nbTerms = len(i.terms)
+
+    index_inverse = { stem : i.getTfsForStem(stem) for stem in i.terms }
+    cpostings = CompressedPostings.encode(i.post_off, i.post_rows, i.post_tfs)
+
+    sizes = { 'dict' : dictSize(index_inverse),
+              'csr' : i.post_off.nbytes + i.post_rows.nbytes + i.post_tfs.nbytes,
+              'compressé' : cpostings.getNbBytes() + i.post_off.nbytes }
+
+    times = { 'dict' : chrono(lambda: [ list(index_inverse[stem].items()) for stem in i.terms ]),
+              'csr' : chrono(lambda: [ i.getMainPostings(t) for t in range(nbTerms) ]),
+              'compressé' : chrono(lambda: [ cpostings.decode(t) for t in range(nbTerms) ]) }
+
+    print('%d termes, %d postings' % (nbTerms, nbPostings))
+    print('%-10s %16s %22s' % ('', 'octets/posting', 'décodage (postings/s)'))
+    for name in sizes:
+        print('%-10s %16.2f %22.0f' % (name, sizes[name] / nbPostings, nbPostings / times[name]))
+
+
+########################### BENCHMARK: STEMMING #############################
+
+def stemUncached(ps, text):
+    """ Représentation d'un texte sans cache des stems (ancienne version de
+        PorterStemmer.getTextRepresentation), pour comparaison.
+    """
+    tab = [ i.lower() for i in re.findall(r"\w+", text, re.UNICODE) ]
+    return { porter.stem(a) : b for (a, b) in Counter(tab).items() if a not in ps.stopWords }
+
+class UncachedAnalyzer(tr.Analyzer):
+    """ Analyseur sans cache des stems ni stemming en batch (porter.stem sur
+        chaque mot distinct de chaque texte), pour comparaison.
+    """
+    def getTextRepresentation(self, text):
+        return { porter.stem(a) : b for (a, b) in self.analyze(text).items() if a not in self.stopWords }
+    
+    def getTextRepresentations(self, texts):
+        return [ self.getTextRepresentation(text) for text in texts ]
+
+def benchStemming(filename):
+    """ Compare, sur les documents de la collection filename, le temps de
+        représentation des textes (tokenisation et stemming) et le temps
+        d'indexation complet:
+            * sans cache: porter.stem sur chaque mot distinct de chaque document
+            * cache: getTextRepresentation avec le cache partagé (vidé avant
+              chaque essai)
+            * batch: getTextRepresentations, chaque forme de la collection est
+              stemmée une seule fois (mode utilisé par l'indexation)
+    """
+    p = parser.Parser(filename)
+    texts = [ document.getTexte() for document in p.getCollection().values() ]
+    documents = [ ( document.getId(), document.getTexte() ) for document in p.getCollection().values() ]
+    ps = tr.PorterStemmer()
+    
+    def cached():
+        tr.stem.cache_clear()
+        return [ ps.getTextRepresentation(text) for text in texts ]
+    
+    def batch():
+        tr.stem.cache_clear()
+        return ps.getTextRepresentations(texts)
+    
+    def indexUncached():
+        # Indexation avec l'ancienne représentation des textes
+        tr.stem.cache_clear()
+        indexer.indexShard(documents, UncachedAnalyzer())
+    
+    def indexBatch():
+        tr.stem.cache_clear()
+        indexer.indexShard(documents)
+    
+    nbTokens = sum( len(re.findall(r"\w+", text, re.UNICODE)) for text in texts )
+    nbForms = len( set( i.lower() for text in texts for i in re.findall(r"\w+", text, re.UNICODE) ) )
+    print('%d documents, %d mots, %d formes distinctes' % (len(texts), nbTokens, nbForms))
+    
+    print('%-12s %18s' % ('', 'représentation (s)'))
+    for name, f in [ ('sans cache', lambda: [ stemUncached(ps, text) for text in texts ]), ('cache', cached), ('batch', batch) ]:
+        print('%-12s %18.3f' % (name, chrono(f)))
+    
+    uncached, batched = chrono(indexUncached), chrono(indexBatch)
+    print('indexation: %.3f s sans cache, %.3f s en batch (x%.1f)' % (uncached, batched, uncached / batched))
+
+
+########################### BENCHMARK: PARSING ##############################
+
+def benchParsing(filename):
+    """ Temps de parsing de la collection filename en séquentiel et en 
+        parallèle (cf Parser.parse), selon le nombre de processus.
+    """
+    print('%d coeurs' % os.cpu_count())
+    print('%-10s %12s' % ('processus', 'parsing (s)'))
+    for workers in [1, 2, 4, 8]:
+        print('%-10d %12.3f' % (workers, chrono(lambda: parser.Parser(filename, workers))))
+
+
+########################### BENCHMARK: PRUNING ##############################
+
+def benchPruning(filename):
+    """ Compare, pour le top-k de Okapi sur les requêtes de la collection
+        (fichiers .qry et .rel à côté de filename), l'évaluation exhaustive et
+        l'élagage Block-Max WAND: nombre de postings évalués et temps moyen
+        par requête. Les bornes de score sont calculées avant la mesure.
+    """
+    base = os.path.splitext(filename)[0]
+    queries = [ q.getText() for q in query.QueryParser(base + '.qry', base + '.rel').getCollection().values() ]
+    i = indexer.IndexerSimple(parser.Parser(filename))
+    models = { 'exhaustif' : irmodel.Okapi(i), 'wand' : irmodel.Okapi(i, pruning=True) }
+    for q in queries: models['wand'].getRanking(q, 1)
+    
+    def scored(model, k):
+        total = 0
+        for q in queries:
+            model.getRanking(q, k)
+            total += model.scored
+        return total
+    
+    print('%d requêtes' % len(queries))
+    print('%-6s %-10s %20s %16s' % ('k', '', 'postings évalués', 'ms/requête'))
+    for k in [10, 100, 1000]:
+        for name, model in models.items():
+            t = chrono(lambda: [ model.getRanking(q, k) for q in queries ])
+            print('%-6d %-10s %20d %16.2f' % (k, name, scored(model, k), 1000 * t / len(queries)))
+
+
+##############################################################################
+
+BENCHMARKS = { 'compression' : benchCompression,
+               'stemming' : benchStemming,
+               'parsing' : benchParsing,
+               'pruning' : benchPruning }
+
+if __name__ == '__main__':
+    # Exemple: python Benchmark.py compression data/cacm/cacm.txt
+    if len(sys.argv) != 3 or sys.argv[1] not in BENCHMARKS:
+        print('usage: python Benchmark.py (%s) fichier' % '|'.join(BENCHMARKS))
+        sys.exit(1)
+    BENCHMARKS[ sys.argv[1] ](sys.argv[2])
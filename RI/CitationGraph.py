@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Apr 18 10:21:45 2021
+
+@author: GIANG Cécile, KHALFAT Célina
+"""
+
+##################### IMPORTATION DES LIBRAIRIES UTILES ####################
+
+import numpy as np
+from Sparse import SparseMatrix
+
+
+########################## CLASSE CITATIONGRAPH #############################
+
+class CitationGraph:
+    """ Graphe des citations (balise .X) de la collection, stocké une seule fois
+        dans des tableaux NumPy. Les noeuds sont les identifiants (.I) des
+        documents; un lien cité plusieurs fois par un document apparaît
+        plusieurs fois (multiplicités).
+            * liens sortants (CSR): les documents cités par d sont aux positions
+              out_off[d] à out_off[d+1] de out_ids, dans l'ordre de la balise .X
+            * liens entrants (CSC): les documents qui citent d sont aux positions
+              in_off[d] à in_off[d+1] de in_ids, dans l'ordre de la collection
+        Attributs:
+            * self.out_off, self.out_ids: array, liens sortants
+            * self.in_off, self.in_ids: array, liens entrants
+    """
+    def __init__(self, out_off, out_ids, in_off=None, in_ids=None):
+        """ Constructeur de la classe CitationGraph.
+            @param out_off, out_ids: array, liens sortants au format CSR
+            @param in_off, in_ids: array, liens entrants (calculés par
+                                   transposition s'ils ne sont pas donnés)
+        """
+        self.out_off = out_off
+        self.out_ids = out_ids
+
+        if in_off is None:
+            # Transposition stable: les documents citant d restent dans l'ordre
+            sources = np.repeat( np.arange(len(out_off) - 1, dtype=np.int32), np.diff(out_off) )
+            order = np.argsort(out_ids, kind='stable')
+            in_off = np.zeros(len(out_off), dtype=np.int64)
+            in_off[1:] = np.cumsum( np.bincount(out_ids, minlength=len(out_off) - 1) )
+            in_ids = sources[order]
+        self.in_off = in_off
+        self.in_ids = in_ids
+
+    @classmethod
+    def fromLinks(cls, ids, links):
+        """ Construit le graphe à partir des liens de chaque document.
+            @param ids: list(int), identifiants des documents
+            @param links: list(list(int)), documents cités par chaque document
+                          (None si le document n'a pas de balise .X)
+            @return : CitationGraph
+        """
+        links = [ liens if liens != None else [] for liens in links ]
+        nbNodes = max( max(ids, default=-1), max( ( max(liens) for liens in links if liens ), default=-1 ) ) + 1
+
+        degrees = np.zeros(nbNodes, dtype=np.int64)
+        degrees[ids] = [ len(liens) for liens in links ]
+        out_off = np.zeros(nbNodes + 1, dtype=np.int64)
+        out_off[1:] = np.cumsum(degrees)
+
+        # Liens de chaque document rangés à la position de son identifiant
+        out_ids = np.zeros(out_off[-1], dtype=np.int32)
+        for idDoc, liens in zip(ids, links):
+            out_ids[ out_off[idDoc] : out_off[idDoc + 1] ] = liens
+
+        return cls(out_off, out_ids)
+
+    @classmethod
+    def fromDocuments(cls, documents):
+        """ @param documents: iterable(Document), documents de la collection
+            @return : CitationGraph
+        """
+        documents = list(documents)
+        return cls.fromLinks([ document.getId() for document in documents ], [ document.getLiens() for document in documents ])
+
+    def getNbNodes(self):
+        return len(self.out_off) - 1
+
+    def getLinksFrom(self, idDoc):
+        """ @return : int array, documents cités par idDoc (vue sans copie)
+        """
+        if not 0 <= idDoc < self.getNbNodes(): return self.out_ids[:0]
+        return self.out_ids[ self.out_off[idDoc] : self.out_off[idDoc + 1] ]
+
+    def getLinksTo(self, idDoc):
+        """ @return : int array, documents qui citent idDoc, répétés autant de
+                      fois qu'ils le citent (vue sans copie)
+        """
+        if not 0 <= idDoc < self.getNbNodes(): return self.in_ids[:0]
+        return self.in_ids[ self.in_off[idDoc] : self.in_off[idDoc + 1] ]
+
+    def getTransitions(self, nbNodes=None):
+        """ Matrice de transitions du graphe (marche aléatoire sur les liens):
+            P[i, j] = nombre de liens de i vers j / nombre de liens sortants
+            de i. Les lignes des documents sans lien sortant sont vides.
+            @param nbNodes: int, nombre de lignes et de colonnes (au moins
+                            getNbNodes(), pour inclure des documents
+                            d'identifiant plus grand sans lien)
+            @return : SparseMatrix
+        """
+        if nbNodes == None: nbNodes = self.getNbNodes()
+        degrees = np.diff(self.out_off)
+        sources = np.repeat( np.arange(self.getNbNodes(), dtype=np.int64), degrees )
+        return SparseMatrix.fromCoords(sources, self.out_ids, 1 / degrees[sources], nbNodes, nbNodes)
+
+    def save(self, writer):
+        """ Ecrit le graphe dans les sections graph_* d'un IndexWriter.
+        """
+        writer.addArray('graph_out_off', self.out_off)
+        writer.addArray('graph_out_ids', self.out_ids)
+        writer.addArray('graph_in_off', self.in_off)
+        writer.addArray('graph_in_ids', self.in_ids)
+
+    @classmethod
+    def load(cls, reader):
+        """ Relit (sans copie) le graphe écrit par save dans un IndexReader.
+        """
+        return cls( reader.getArray('graph_out_off'), reader.getArray('graph_out_ids'),
+                    reader.getArray('graph_in_off'), reader.getArray('graph_in_ids') )
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Apr 19 09:12:37 2021
+
+@author: GIANG Cécile, KHALFAT Célina
+"""
+
+##################### IMPORTATION DES LIBRAIRIES UTILES ####################
+
+import numpy as np
+from Weighter import WeightMatrix
+
+
+def frozen(values, dtype):
+    """ Copie de values en lecture seule.
+    """
+    values = np.array(values, dtype=dtype)
+    values.flags.writeable = False
+    return values
+
+
+######################### CLASSE COLLECTIONSTATS ############################
+
+class CollectionStats:
+    """ Statistiques de la collection indexée, calculées une seule fois pour
+        une version donnée de l'index et partagées par tous les weighters et
+        modèles (cf IndexerSimple.getStats). L'objet n'est jamais modifié:
+        quand l'index change, l'indexer en construit un nouveau à partir de
+        ses compteurs (df, cf, longueurs), tenus à jour incrémentalement: le
+        coût ne dépend que du nombre de termes et de lignes, pas de la taille
+        de l'index.
+        Attributs:
+            * self.version: int, version de l'index décrite par ces statistiques
+            * self.nbDocs: int, nombre de documents (vivants)
+            * self.nbRows: int, nombre de lignes de l'index
+            * self.totalLen: int, nombre total d'occurrences dans la collection
+            * self.avgdl: float, longueur moyenne d'un document
+            * self.docLen: int array, longueur de chaque ligne
+            * self.dfs: int array, df de chaque terme
+            * self.idfs: float array, idf de chaque terme
+            * self.cfs: int array, nombre d'occurrences de chaque terme dans
+                        la collection
+    """
+    def __init__(self, indexer, idfs=None):
+        """ Constructeur de la classe CollectionStats.
+            @param indexer: IndexerSimple, index dont on calcule les statistiques
+            @param idfs: float array, idf déjà calculés (index rechargé), None
+                         pour les calculer
+        """
+        self.terms = indexer.terms
+        self.version = indexer.version
+        self.nbDocs = indexer.getNbDocs()
+        self.nbRows = indexer.getNbRows()
+        self.totalLen = indexer.getTotalLength()
+        self.avgdl = self.totalLen / self.nbDocs if self.nbDocs else 0.
+
+        self.docLen = frozen(indexer.docLen, np.int64)
+        self.dfs = frozen(indexer.dfs, np.int32)
+        if idfs is None: idfs = np.log( (1 + self.nbDocs) / (1 + self.dfs) )
+        self.idfs = frozen(idfs, float)
+        self.cfs = frozen(indexer.getCollectionFrequencies(), np.int64)
+
+        # Calculés à la demande
+        self.idf = None
+        self.logProbs = None
+        self.matrices = dict()
+        self.caches = dict()
+
+    def getIdf(self):
+        """ @return idf: dict(str, float), idf de chaque stem
+        """
+        if self.idf == None: self.idf = dict( zip(self.terms, self.idfs.tolist()) )
+        return self.idf
+
+    def getLogProbs(self):
+        """ @return : float array, log p(t|Mc) = log(cf_t / totalLen) de chaque
+                      terme (-inf pour un terme absent des documents vivants)
+        """
+        if self.logProbs is None:
+            with np.errstate(divide='ignore'):
+                self.logProbs = frozen(np.log( self.cfs / max(self.totalLen, 1) ), float)
+        return self.logProbs
+
+    def getWeightMatrix(self, weighter):
+        """ Matrice des poids des documents pour un weighter, construite une
+            fois par classe de weighter: seul le segment delta est recalculé,
+            le segment principal est partagé entre les versions (cf 
+            IndexerSimple.getWeightSegment).
+            @param weighter: Weighter, pondération des documents
+            @return : WeightMatrix
+        """
+        name = type(weighter).__name__
+        if name not in self.matrices:
+            self.matrices[name] = WeightMatrix.fromWeighter(weighter)
+        return self.matrices[name]
+
+    def getNorms(self, weighter):
+        """ Norme des poids des documents pour un weighter, indexée par ligne.
+            @param weighter: Weighter, pondération des documents
+            @return : float array
+        """
+        return self.getWeightMatrix(weighter).norms
+
+    def getCache(self, key):
+        """ Dictionnaire où un modèle range des données dérivées de l'index
+            (par exemple les bornes de score de Okapi), partagé par tous les
+            modèles de même clé et abandonné avec ces statistiques quand
+            l'index change.
+            @param key: clé (hashable) des données, paramètres compris
+            @return : dict
+        """
+        return self.caches.setdefault(key, dict())
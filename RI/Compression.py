@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Apr 17 15:40:08 2021
+
+@author: GIANG Cécile, KHALFAT Célina
+"""
+
+##################### IMPORTATION DES LIBRAIRIES UTILES ####################
+
+import numpy as np
+
+
+########################## COMPRESSION DES POSTINGS ##########################
+
+# Les postings de chaque terme sont découpés en blocs de BLOCK postings. Dans
+# chaque bloc, les lignes des documents sont codées par écarts (delta) avec la
+# ligne précédente, et les écarts comme les tf (moins 1) sont compressés par
+# bit-packing "frame of reference": chaque valeur du bloc est écrite sur le
+# nombre de bits de la plus grande valeur du bloc.
+# Pour chaque bloc, on garde dans un répertoire de blocs:
+#     * last: ligne du dernier posting du bloc (point de départ des écarts
+#       du bloc suivant, permet aussi de sauter un bloc)
+#     * pos: position du bloc dans les données compressées
+#     * wrow, wtf: nombre de bits d'un écart et d'un tf dans le bloc
+
+BLOCK = 128
+
+_ONE = np.uint64(1)
+
+# Rang de chaque valeur dans un bloc (décodage)
+_LANES = np.arange(BLOCK, dtype=np.uint64)
+
+
+def bitWidth(values):
+    """ Nombre de bits nécessaires pour écrire la plus grande valeur de values.
+        @param values: uint array
+    """
+    if len(values) == 0: return 0
+    return int(values.max()).bit_length()
+
+def pack(values, width):
+    """ Ecrit chaque valeur de values sur width bits (ordre little-endian).
+        @param values: uint array, valeurs à écrire
+        @param width: int, nombre de bits par valeur
+        @return : bytes
+    """
+    if width == 0: return b''
+    bits = ( values[:, None].astype(np.uint64) >> np.arange(width, dtype=np.uint64) ) & 1
+    return np.packbits(bits.astype(np.uint8).ravel(), bitorder='little').tobytes()
+
+def toWords(data):
+    """ Copie des données compressées en mots de 64 bits little-endian, suivis
+        de mots nuls: un bloc peut toujours être relu sur BLOCK valeurs (même
+        au-delà de sa fin) sans sortir du tableau.
+        @param data: uint8 array
+        @return : uint64 array
+    """
+    padded = np.zeros( ( len(data) + 7 ) // 8 * 8 + 8 * ( BLOCK // 2 + 2 ), dtype=np.uint8 )
+    padded[ : len(data) ] = data
+    return padded.view('<u8')
+
+def readBits(words, bitpos, widths):
+    """ Relit les valeurs écrites par pack aux positions bitpos, par décalage
+        et masque des deux mots de 64 bits qui contiennent chacune (une valeur
+        fait au plus 32 bits).
+        @param words: uint64 array, données compressées (cf toWords)
+        @param bitpos: uint64 array, position (en bits) de chaque valeur
+        @param widths: uint64 array (ou scalaire), nombre de bits par valeur
+        @return values: uint64 array
+    """
+    shift = bitpos & np.uint64(63)
+    i = bitpos >> np.uint64(6)
+    # Le second mot est décalé en deux fois (un décalage de 64 bits n'est pas défini)
+    values = ( words[i] >> shift ) | ( ( words[i + _ONE] << _ONE ) << ( np.uint64(63) - shift ) )
+    return values & ( ( _ONE << widths ) - _ONE )
+
+def unpackBlocks(words, bitStart, widths):
+    """ Relit BLOCK valeurs écrites par pack au début de chaque bloc.
+        @param words: uint64 array, données compressées (cf toWords)
+        @param bitStart: int array, position (en bits) de chaque bloc
+        @param widths: int array, nombre de bits par valeur de chaque bloc
+        @return values: uint64 array, une ligne de BLOCK valeurs par bloc
+    """
+    widths = widths.astype(np.uint64)[:, None]
+    return readBits(words, bitStart.astype(np.uint64)[:, None] + _LANES * widths, widths)
+
+def unpack(words, offset, n, width):
+    """ Relit n valeurs (au plus BLOCK) écrites sur width bits par pack.
+        @param words: uint64 array, données compressées (cf toWords)
+        @param offset: int, position (en octets) des valeurs dans les données
+        @param n: int, nombre de valeurs
+        @param width: int, nombre de bits par valeur
+        @return values: int64 array
+    """
+    if width == 0: return np.zeros(n, dtype=np.int64)
+    width = np.uint64(width)
+    return readBits(words, _LANES[:n] * width + np.uint64(offset * 8), width).astype(np.int64)
+
+
+######################## CLASSE COMPRESSEDPOSTINGS ##########################
+
+class CompressedPostings:
+    """ Index inversé compressé par blocs (cf ci-dessus), décodé un bloc à la
+        fois dans des tableaux NumPy.
+        Attributs:
+            * self.blk_off: int64 array, blocs du terme t: blk_off[t] à blk_off[t+1]
+            * self.blk_last, self.blk_pos, self.blk_wrow, self.blk_wtf: array,
+              répertoire des blocs
+            * self.dfs: int array, nombre de postings de chaque terme
+            * self.data: uint8 array, données compressées
+            * self.words: uint64 array, copie des données en mots de 64 bits
+              pour le décodage (cf getWords)
+    """
+    # Nombre de postings décodés ensemble par decodeAll
+    CHUNK = 1 << 14
+
+    def __init__(self, blk_off, blk_last, blk_pos, blk_wrow, blk_wtf, dfs, data):
+        self.blk_off = blk_off
+        self.blk_last = blk_last
+        self.blk_pos = blk_pos
+        self.blk_wrow = blk_wrow
+        self.blk_wtf = blk_wtf
+        self.dfs = dfs
+        self.data = data
+        self.words = None
+
+    @classmethod
+    def encode(cls, post_off, post_rows, post_tfs):
+        """ Compresse un index inversé au format CSR.
+            @param post_off, post_rows, post_tfs: array, index inversé (lignes
+                                                  croissantes pour chaque terme)
+            @return : CompressedPostings
+        """
+        nbTerms = len(post_off) - 1
+        dfs = np.diff(post_off)
+        blk_off = np.zeros(nbTerms + 1, dtype=np.int64)
+        blk_off[1:] = np.cumsum( ( dfs + BLOCK - 1 ) // BLOCK )
+
+        blk_last = np.zeros(blk_off[-1], dtype=np.int32)
+        blk_pos = np.zeros(blk_off[-1], dtype=np.int64)
+        blk_wrow = np.zeros(blk_off[-1], dtype=np.uint8)
+        blk_wtf = np.zeros(blk_off[-1], dtype=np.uint8)
+        chunks = []
+        pos = 0
+
+        for t in range(nbTerms):
+            rows = np.asarray(post_rows[ post_off[t] : post_off[t+1] ], dtype=np.int64)
+            tfs = np.asarray(post_tfs[ post_off[t] : post_off[t+1] ], dtype=np.int64)
+            previous = 0
+            for j, start in enumerate(range(0, len(rows), BLOCK)):
+                b = blk_off[t] + j
+                gaps = np.diff(rows[start : start + BLOCK], prepend=previous)
+                values = tfs[start : start + BLOCK] - 1
+                blk_wrow[b], blk_wtf[b] = bitWidth(gaps), bitWidth(values)
+                blk_last[b] = rows[min(start + BLOCK, len(rows)) - 1]
+                blk_pos[b] = pos
+                chunk = pack(gaps, blk_wrow[b]) + pack(values, blk_wtf[b])
+                chunks.append(chunk)
+                pos += len(chunk)
+                previous = blk_last[b]
+
+        data = np.frombuffer(b''.join(chunks), dtype=np.uint8)
+        return cls(blk_off, blk_last, blk_pos, blk_wrow, blk_wtf, dfs, data)
+
+    def getWords(self):
+        """ Données compressées en mots de 64 bits, copiées au premier décodage
+            (les données relues par load restent projetées en mémoire).
+        """
+        if self.words is None: self.words = toWords(self.data)
+        return self.words
+
+    def getNbBlocks(self, t):
+        return int( self.blk_off[t+1] - self.blk_off[t] )
+
+    def decodeBlock(self, t, j):
+        """ Décode le bloc j des postings du terme t.
+            @return rows: int32 array, lignes des documents du bloc
+            @return tfs: int32 array, tf de chacun de ces documents
+        """
+        b = self.blk_off[t] + j
+        n = min( BLOCK, int(self.dfs[t]) - j * BLOCK )
+        wrow, wtf = int(self.blk_wrow[b]), int(self.blk_wtf[b])
+        previous = int(self.blk_last[b-1]) if j > 0 else 0
+
+        gaps = unpack(self.getWords(), int(self.blk_pos[b]), n, wrow)
+        values = unpack(self.getWords(), int(self.blk_pos[b]) + ( n * wrow + 7 ) // 8, n, wtf)
+        return ( previous + np.cumsum(gaps) ).astype(np.int32), ( values + 1 ).astype(np.int32)
+
+    def decode(self, t):
+        """ Décode tous les blocs des postings du terme t.
+            @return rows: int32 array, lignes des documents contenant t
+            @return tfs: int32 array, tf de t dans chacun de ces documents
+        """
+        nbBlocks = self.getNbBlocks(t)
+        if nbBlocks == 0: return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        if nbBlocks == 1: return self.decodeBlock(t, 0)
+        return self.decodeTerms(t, t + 1)
+
+    def decodeAll(self):
+        """ Décode l'index inversé complet (postings de tous les termes, dans
+            l'ordre des termes), par tranches de termes d'environ CHUNK
+            postings (les tableaux intermédiaires restent en cache).
+            @return rows, tfs: int32 array
+        """
+        nbTerms = len(self.blk_off) - 1
+        ends = np.zeros(nbTerms + 1, dtype=np.int64)
+        ends[1:] = np.cumsum(self.dfs)
+        bounds = np.unique( np.searchsorted( ends, np.arange(0, ends[-1], self.CHUNK), side='right' ) - 1 ).tolist() + [ nbTerms ]
+        chunks = [ self.decodeTerms(t0, t1) for t0, t1 in zip(bounds, bounds[1:]) if t0 < t1 ]
+        return np.concatenate([ np.zeros(0, dtype=np.int32) ] + [ rows for rows, tfs in chunks ]), np.concatenate([ np.zeros(0, dtype=np.int32) ] + [ tfs for rows, tfs in chunks ])
+
+    def decodeTerms(self, t0, t1):
+        """ Décode ensemble tous les blocs des termes t0 à t1 (exclu): chaque
+            bloc est relu sur une ligne de BLOCK valeurs (cf unpackBlocks),
+            puis les valeurs au-delà de la fin des blocs sont écartées. Les 
+            blocs de largeur 0 (écarts de 1 ou tf de 1) ne sont pas lus.
+            @return rows: int32 array, lignes des postings, terme par terme
+            @return tfs: int32 array, tf de chacun de ces postings
+        """
+        b0, b1 = int(self.blk_off[t0]), int(self.blk_off[t1])
+        terms = np.repeat( np.arange(t0, t1), np.diff(self.blk_off[t0 : t1 + 1]) )
+        blocks = np.arange(b0, b1)
+        first = blocks == self.blk_off[terms]
+        sizes = np.minimum( BLOCK, self.dfs[terms] - ( blocks - self.blk_off[terms] ) * BLOCK ).astype(np.int64)
+        wrow = self.blk_wrow[b0:b1].astype(np.int64)
+        wtf = self.blk_wtf[b0:b1].astype(np.int64)
+        pos = self.blk_pos[b0:b1].astype(np.int64) * 8
+
+        def values(bitStart, widths):
+            nonZero = np.flatnonzero(widths)
+            if len(nonZero) == len(widths): return unpackBlocks(self.getWords(), bitStart, widths)
+            out = np.zeros( (len(widths), BLOCK), dtype=np.uint64 )
+            if len(nonZero): out[nonZero] = unpackBlocks(self.getWords(), bitStart[nonZero], widths[nonZero])
+            return out
+
+        # Lignes: somme des écarts depuis le début du bloc, plus la dernière
+        # ligne du bloc précédent du même terme
+        bases = np.where( first, 0, self.blk_last[ np.maximum(blocks - 1, 0) ] ).astype(np.uint64)
+        rows = np.cumsum( values(pos, wrow), axis=1 ) + bases[:, None]
+        tfs = values(pos + ( ( sizes * wrow + 7 ) // 8 ) * 8, wtf) + _ONE
+
+        # Seul le dernier bloc d'un terme est incomplet
+        if t1 == t0 + 1: rows, tfs = rows.ravel()[ : self.dfs[t0] ], tfs.ravel()[ : self.dfs[t0] ]
+        else:
+            valid = _LANES < sizes[:, None].astype(np.uint64)
+            rows, tfs = rows[valid], tfs[valid]
+        return rows.astype(np.int32), tfs.astype(np.int32)
+
+    def getNbBytes(self):
+        """ Taille de l'index compressé (données et répertoire des blocs) en octets.
+        """
+        return self.data.nbytes + self.blk_off.nbytes + self.blk_last.nbytes + self.blk_pos.nbytes + self.blk_wrow.nbytes + self.blk_wtf.nbytes
+
+    def save(self, writer):
+        """ Ecrit l'index compressé dans les sections cpost_* d'un IndexWriter.
+        """
+        writer.addArray('cpost_blk_off', self.blk_off)
+        writer.addArray('cpost_blk_last', self.blk_last)
+        writer.addArray('cpost_blk_pos', self.blk_pos)
+        writer.addArray('cpost_blk_wrow', self.blk_wrow)
+        writer.addArray('cpost_blk_wtf', self.blk_wtf)
+        writer.addArray('cpost_data', self.data)
+
+    @classmethod
+    def load(cls, reader, dfs):
+        """ Relit (sans copie) l'index compressé des sections cpost_* d'un IndexReader.
+            @param dfs: int array, nombre de postings de chaque terme
+        """
+        return cls( reader.getArray('cpost_blk_off'), reader.getArray('cpost_blk_last'), reader.getArray('cpost_blk_pos'),
+                    reader.getArray('cpost_blk_wrow'), reader.getArray('cpost_blk_wtf'), dfs, reader.getArray('cpost_data') )
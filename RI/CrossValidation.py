@@ -96,4 +96,14 @@ class CrossValidation:
             ks = [ k for k , b in metValues.keys() ]
             bs = [ b for k , b in metValues.keys() ]
             
-            return np.mean( ks ) , np.mean( bs )
\ No newline at end of file
+            return np.mean( ks ) , np.mean( bs )
+        
+        if model_name=='dirichlet':
+            mus = list( metValues.keys() )
+            return np.mean( mus )
+        
+        if model_name=='deuxetapes':
+            mus = [ mu for mu , l in metValues.keys() ]
+            lambs = [ l for mu , l in metValues.keys() ]
+            
+            return np.mean( mus ) , np.mean( lambs )
\ No newline at end of file
@@ -20,7 +20,9 @@ class EvalIRModel():
         selon différentes mesures d'évaluation.
         Attributs:
             * self.queries: dict(int, Query), dictionnaire des requêtes
-            * self.models: dict(str, IRModel), dictionnaire des modèles (clé: nom du modèle)
+            * self.models: dict(str, IRModel), dictionnaire des modèles (clé: nom du modèle),
+                           ou de reclassements ayant getRanking et getScoresBatch
+                           (cf PageRank.PersonalizedPageRank)
             * self.metrics: dict(str, Metrics), dictionnaire des métriques
                             d'évalutation.
     """
@@ -32,11 +34,24 @@ class EvalIRModel():
         self.metrics = metrics
 
 
-    def evalQuery(self, idQry, mod_name, met_name):
+    def getRankings(self, mod_name):
+        """ Classements de toutes les requêtes par le modèle mod_name, calculés
+            en un seul batch (cf IRModel.getScoresBatch, et 
+            PersonalizedPageRank.getScoresBatch pour le reclassement par
+            PageRank personnalisé de toutes les requêtes à la fois).
+            @return : dict(int, RankedResult), classement de chaque requête
+        """
+        idQueries = list( self.queries.keys() )
+        rankings = self.models[ mod_name ].getScoresBatch([ self.queries[ idQry ].getText() for idQry in idQueries ])
+        return dict( zip( idQueries, rankings ) )
+
+    def evalQuery(self, idQry, mod_name, met_name, ranking=None):
         """ Renvoie le score d'évaluation du ranking calculé par la métrique met_name
             et le modèle mod_name sur UNE SEULE requête idQry.
+            @param ranking: RankedResult, classement de la requête s'il est déjà
+                            calculé
         """
-        ranking = [ * self.models[ mod_name ].getRanking( self.queries[ idQry ].getText() ) ]
+        if ranking == None: ranking = self.models[ mod_name ].getRanking( self.queries[ idQry ].getText() )
         return self.metrics[ met_name ].evalQuery( ranking, self.queries[ idQry ] )
 
     def evalQueryAllParams(self, idQry):
@@ -46,19 +61,23 @@ class EvalIRModel():
         """
         return { metric : { model : self.evalQuery(idQry, model, metric) for model in self.models } for metric in self.metrics }
 
-    def evalParams(self, mod_name, met_name):
+    def evalParams(self, mod_name, met_name, rankings=None):
         """ Renvoie la moyenne et l'écart-type des évaluations sur l'ensemble
             des requêtes pour un modèle mod_name et une mesure met_name.
+            @param rankings: dict(int, RankedResult), classements des requêtes
+                             (calculés en batch s'ils ne sont pas donnés)
         """
-        evals = [ self.evalQuery(idQry, mod_name, met_name) for idQry in self.queries.keys() ]
+        if rankings == None: rankings = self.getRankings(mod_name)
+        evals = [ self.evalQuery(idQry, mod_name, met_name, rankings[ idQry ]) for idQry in self.queries.keys() ]
         return np.mean( evals ), np.std( evals )
 
     def evalAllParams(self):
         """ Renvoie la moyenne et l'écart-type des évaluations sur l'ensemble
             des requêtes pour tout modèle de self.models et toute mesure
-            de self.metrics.
+            de self.metrics (un seul batch de requêtes par modèle).
         """
-        return {metric : { model: self.evalParams(model, metric) for model in self.models } for metric in self.metrics }
+        rankings = { model : self.getRankings(model) for model in self.models }
+        return {metric : { model: self.evalParams(model, metric, rankings[ model ]) for model in self.models } for metric in self.metrics }
 
     def statsDataFrame(self):
         stats = self.evalAllParams()
@@ -70,7 +89,7 @@ class EvalIRModel():
 # q = QueryParser('data/cisi/cisi.qry', 'data/cisi/cisi.rel')
 #
 # queries = q.getCollection()
-# models = {'langue' : ModeleLangue(i), 'okapi' : Okapi(i)}
+# models = {'langue' : ModeleLangue(i), 'okapi' : Okapi(i), 'pagerank' : PersonalizedPageRank(i, Okapi(i))}
 # metrics = {'precision' : Precision(), 'rappel' : Rappel(), 'fmesure' : FMesure(), 'avgp' : AvgP(), 'rr': RR(), 'dcg' : DCG(), 'ndcg' : NDCG()}
 #
 # eval_ir = EvalIRModel(queries, models, metrics)
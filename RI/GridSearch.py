@@ -108,6 +108,46 @@ class GridSearch:
             
             return self.k, self.b
         
+        if model_name=='dirichlet':
+            # Un seul modèle dont on change mu: les statistiques de l'index
+            # (p(t|Mc), longueurs) ne sont pas recalculées
+            mus = np.linspace(100, 3000, bins)
+            model = ModeleDirichlet(self.index)
+            eir = EvalIRModel(self.train, { model_name : model }, { metric_name : self.metrics[ metric_name ] })
+            evals = dict()
+            for mu in mus:
+                model.setMu(mu)
+                evals[mu] = eir.evalParams(model_name, metric_name)[0]
+            
+            # On récupère le paramètre mu optimal
+            if metric_name=='rr':
+                self.mu = min(evals, key=lambda key: evals[key])
+            else:
+                self.mu = max(evals, key=lambda key: evals[key])
+            
+            return self.mu
+        
+        if model_name=='deuxetapes':
+            # Un modèle par valeur de lambda, dont on change mu
+            mus = np.linspace(100, 3000, bins)
+            lambs = np.linspace(0, 1, bins)
+            metrics = { metric_name : self.metrics[ metric_name ] }
+            models = { l : ModeleDeuxEtapes(self.index, lamb=l) for l in lambs }
+            eir = EvalIRModel(self.train, models, metrics)
+            evals = dict()
+            for mu in mus:
+                for l, model in models.items():
+                    model.setMu(mu)
+                    evals[(mu, l)] = eir.evalParams(l, metric_name)[0]
+            
+            # On récupère les paramètres mu et lambda optimaux
+            if metric_name=='rr':
+                self.mu, self.lamb = min(evals, key=lambda key: evals[key])
+            else:
+                self.mu, self.lamb = max(evals, key=lambda key: evals[key])
+            
+            return self.mu, self.lamb
+        
     def evalTest(self, test = None):
         """ Test des paramètres optimaux sur les requêtes d'évaluation.
         """
@@ -119,4 +159,12 @@ class GridSearch:
         
         if self.model == 'okapi':
             eir = EvalIRModel(test, { self.model : Okapi(self.index, self.k, self.b)}, { self.metric : self.metrics[ self.metric ] })
+            return eir.evalParams(self.model, self.metric)[0]
+        
+        if self.model == 'dirichlet':
+            eir = EvalIRModel(test, { self.model : ModeleDirichlet(self.index, self.mu)}, { self.metric : self.metrics[ self.metric ] })
+            return eir.evalParams(self.model, self.metric)[0]
+        
+        if self.model == 'deuxetapes':
+            eir = EvalIRModel(test, { self.model : ModeleDeuxEtapes(self.index, self.mu, self.lamb)}, { self.metric : self.metrics[ self.metric ] })
             return eir.evalParams(self.model, self.metric)[0]
\ No newline at end of file
@@ -7,8 +7,102 @@ Created on Wed Jan 27 09:29:53 2021
 
 ##################### IMPORTATION DES LIBRAIRIES UTILES ####################
 
-import textRepresenter as tr
+import heapq
+from bisect import bisect_left
 import numpy as np
+from Compression import BLOCK
+from Sparse import SparseMatrix
+
+# Marge relative sur les bornes de score (erreurs d'arrondi des sommes)
+EPS = 1e-9
+
+
+def matchedRows(postings):
+    """ Accumulateur creux pour une requête: numérote localement les documents
+        contenant au moins un terme de la requête, pour que les scores soient
+        accumulés dans un tableau de la taille du nombre de documents trouvés
+        (et non de la collection).
+        @param postings: list((array, array)), lignes et valeurs de chaque
+                         terme de la requête
+        @return rows: int array, lignes distinctes (croissantes) des documents
+        @return positions: list(int array), position dans rows de chaque
+                           ligne des postings de chaque terme
+    """
+    if not postings: return np.zeros(0, dtype=np.int32), []
+    rows = np.unique( np.concatenate([ r for r, values in postings ]) )
+    return rows, [ np.searchsorted(rows, r) for r, values in postings ]
+
+def topK(scores, k=None):
+    """ Positions des k plus grands scores, par score décroissant. A score
+        égal, la plus petite position passe en premier (même ordre qu'un tri
+        stable). Si k est donné, seuls les candidats au top-k (sélectionnés
+        par argpartition) sont triés.
+        @param scores: float array
+        @param k: int, nombre de positions (toutes si None)
+        @return : int array
+    """
+    if k == None or k >= len(scores): return np.argsort(-scores, kind='stable')
+    if k <= 0: return np.zeros(0, dtype=np.int64)
+    
+    # k-ième meilleur score; on garde tous les ex-aequo pour départager par position
+    kth = scores[ np.argpartition(-scores, k - 1)[k - 1] ]
+    candidates = np.flatnonzero(scores >= kth)
+    return candidates[ np.argsort(-scores[candidates], kind='stable')[:k] ]
+
+
+############################ CLASSE RANKEDRESULT ############################
+
+class RankedResult:
+    """ Résultat d'une recherche: documents classés par score décroissant,
+        stockés dans deux tableaux parallèles. S'utilise comme la liste des
+        identifiants classés (len, itération, ranking[i], idDoc in ranking)
+        et donne accès aux scores comme l'ancien dictionnaire (items, values,
+        getScore).
+        Attributs:
+            * self.ids: int array, identifiants (.I) des documents classés
+            * self.scores: float array, score de chacun de ces documents
+    """
+    def __init__(self, ids, scores):
+        self.ids = ids
+        self.scores = scores
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __iter__(self):
+        return iter(self.ids.tolist())
+    
+    def __getitem__(self, i):
+        """ @param i: int, rang (à partir de 0), ou slice (vue RankedResult)
+        """
+        if isinstance(i, slice): return RankedResult(self.ids[i], self.scores[i])
+        return int(self.ids[i])
+    
+    def __contains__(self, idDoc):
+        return bool( ( self.ids == idDoc ).any() )
+    
+    def __repr__(self):
+        return 'RankedResult(%s)' % ', '.join( '%d: %.4g' % item for item in self.items()[:10] ) + ( ', ...' if len(self) > 10 else '' )
+    
+    def keys(self):
+        return self.ids.tolist()
+    
+    def values(self):
+        return self.scores.tolist()
+    
+    def items(self):
+        return list( zip( self.ids.tolist(), self.scores.tolist() ) )
+    
+    def getScore(self, idDoc):
+        """ Score de idDoc, 0 s'il n'est pas classé.
+        """
+        ranks = np.flatnonzero(self.ids == idDoc)
+        return float(self.scores[ ranks[0] ]) if len(ranks) else 0.
+    
+    def toDict(self):
+        """ @return : dict(int, float), scores des documents dans l'ordre du classement
+        """
+        return dict( self.items() )
 
 
 ############################## CLASSE IRMODEL ##############################
@@ -20,7 +114,15 @@ class IRModel:
             * self.ref_index: IndexerSimple, référence de l'indexer
             * self.index: dict(int, int), ensemble des index des Documents de la collection
             * self.index_inv: dict(str, int), ensemble des index des Documents de la collection
+            * self.analyzer: Analyzer, analyseur de l'index (utilisé pour les requêtes)
+            * self.prior: float array, bonus de score de chaque document
+                          (indexé par identifiant) dû au prior, None sans prior
+                          (cf setPrior)
+            * nullScore: float, score d'un document non pertinent (documents
+                         non classés)
     """
+    nullScore = 0.
+    
     def __init__(self, ref_index):
         
         """ Constructeur de la classe IRModel.
@@ -29,23 +131,180 @@ class IRModel:
         self.ref_index = ref_index
         self.index = ref_index.getIndex()
         self.index_inverse = ref_index.getIndexInverse()
+        self.analyzer = ref_index.getAnalyzer()
+        self.prior = None
+    
+    def getParams(self):
+        """ Paramètres dont dépend le classement du modèle (le prior mis à 
+            part), par exemple pour savoir si des classements gardés en cache
+            sont encore valables (cf PageRank.PersonalizedPageRank).
+            @return : tuple
+        """
+        return ()
+    
+    def setPrior(self, prior, weight=1., logLinear=False):
+        """ Combine les scores du modèle avec un prior statique des documents
+            (par exemple le PageRank global, cf PageRank.computePriors), sans
+            coût à la requête autre qu'une lecture par document classé:
+                * combinaison linéaire: score + weight * prior / max(prior)
+                * combinaison log-linéaire: score + weight * log(prior) (pour
+                  les scores en log, cf ModeleLangue)
+            Le prior ne s'applique qu'aux documents que le modèle classe.
+            @param prior: str, nom d'un prior de l'index (cf getPrior), ou 
+                          float array indexé par identifiant; None pour 
+                          retirer le prior
+            @param weight: float, poids du prior
+            @param logLinear: bool, combinaison log-linéaire si True
+        """
+        if isinstance(prior, str):
+            name, prior = prior, self.ref_index.getPrior(prior)
+            if prior is None: raise KeyError("l'index n'a pas de prior %s" % name)
+        if prior is None:
+            self.prior = None
+            return
+        
+        prior = np.asarray(prior, dtype=float)
+        if logLinear:
+            with np.errstate(divide='ignore'):
+                self.prior = weight * np.log( np.maximum( prior, np.min(prior[prior > 0], initial=1.) ) )
+        else:
+            self.prior = weight * prior / max( np.max(prior, initial=0.), EPS )
         
-    def getScores(query):
+        # Bonus des documents absents du prior: celui du document le moins favorisé
+        self.priorMin = np.min(self.prior, initial=0.)
+    
+    def addPrior(self, rows, scores, default):
+        """ Ajoute le bonus du prior aux scores renvoyés par getRowScores. Si
+            les documents ne contenant aucun terme de la requête ont un score
+            (cf ModeleLangue), tous les documents reçoivent le bonus.
+        """
+        if self.prior is None: return rows, scores, default
+        if np.max(default, initial=self.nullScore) > self.nullScore:
+            rows, scores = self.fillRowScores(rows, scores, default)
+        
+        ids = self.ref_index.docIds[rows]
+        inside = ids < len(self.prior)
+        bonus = np.full( len(ids), self.priorMin )
+        bonus[inside] = self.prior[ ids[inside] ]
+        return rows, scores + bonus, self.nullScore
+        
+    def getRowScores(self, query):
+        """ Retourne les scores des Documents contenant au moins un terme de
+            la requête query, indexés par ligne de l'index.
+            @return rows: int array, lignes (croissantes) des documents trouvés
+            @return scores: float array, score de chacun de ces documents
+            @return default: float, score des autres documents (ou float 
+                             array, score de chaque ligne si elle ne contient
+                             aucun terme de la requête)
+        """
+        pass
+    
+    def getAllRowScores(self, query):
+        """ Scores de tous les documents vivants (y compris ceux qui ne
+            contiennent aucun terme de la requête), par ligne croissante.
+            Si le score par défaut est nul (nullScore), seuls les documents 
+            trouvés sont renvoyés.
+        """
+        return self.fillRowScores( *self.addPrior( *self.getRowScores(query) ) )
+    
+    def fillRowScores(self, rows, scores, default):
+        """ Complète les scores des documents trouvés (cf getRowScores) par le
+            score par défaut des autres documents vivants.
+        """
+        if np.isscalar(default):
+            if default == self.nullScore: return rows, scores
+            full = np.full( self.ref_index.getNbRows(), default )
+        else:
+            full = np.array(default, dtype=float)
+        full[rows] = scores
+        rows = np.flatnonzero(self.ref_index.alive)
+        return rows, full[rows]
+    
+    def getScores(self, query):
         """ Retourne les scores de chaque Document de la collection pour la 
             requête query.
+            @return : dict(int, float), score de chaque document (vivant)
         """
-        pass
+        rows, scores = self.getAllRowScores(query)
+        full = np.full( self.ref_index.getNbRows(), self.nullScore )
+        full[rows] = scores
+        return self.ref_index.toDict(full)
     
-    def getRanking(self, query):
+    def getRanking(self, query, k=None):
         """ @param query: str, requête
+            @param k: int, nombre de documents à classer (tous si None)
+            @return : RankedResult, documents de score non nul par score
+                      décroissant (à score égal, par ordre de l'index)
+        """
+        return self.rankRows( *self.getRowScores(query), k )
+    
+    def rankRows(self, rows, scores, default, k=None):
+        """ Classement à partir des scores renvoyés par getRowScores.
+            @param k: int, nombre de documents à classer (tous si None)
+            @return : RankedResult
         """
-        # Récupération des scores pour chaque Document de la collection
+        rows, scores, default = self.addPrior(rows, scores, default)
+        
+        # Les documents de score par défaut ne sont ajoutés que s'ils peuvent
+        # entrer dans le top-k
+        bestDefault = np.max(default, initial=self.nullScore)
+        if bestDefault > self.nullScore and ( k == None or np.count_nonzero(scores > bestDefault) < k ):
+            rows, scores = self.fillRowScores(rows, scores, default)
+        
         # On ne gardera que les documents dont le score n'est pas nul
-        scores = self.getScores(query)
-        scores = { idDoc : weight for idDoc, weight in scores.items() if weight > 0}
+        keep = scores > self.nullScore
+        rows, scores = rows[keep], scores[keep]
+        
+        # Sélection et tri des k meilleurs, identifiants des seuls documents classés
+        order = topK(scores, k)
+        return RankedResult( self.ref_index.docIds[ rows[order] ], scores[order] )
+    
+    def getBatchWeights(self, queries):
+        """ Poids des termes de chaque requête, et valeurs par document de 
+            chaque terme, pour le calcul en batch des scores (cf 
+            getScoresBatch). None si le modèle n'a pas de calcul en batch.
+            @param queries: list(str), requêtes
+            @return queryWeights: list(dict(str, float)), poids des termes de
+                                  chaque requête
+            @return termValues: fonction stem -> (rows, values), valeur de 
+                                chaque posting du terme
+            @return defaults: list(float), score par défaut de chaque requête
+                              (score d'un document ne contenant aucun de ses
+                              termes, ajouté à la somme des valeurs)
+        """
+        return None
+    
+    def getScoresBatch(self, queries, k=None):
+        """ Classement de plusieurs requêtes à la fois: les scores de toutes
+            les requêtes sont le produit de la matrice creuse requêtes-termes
+            (poids des termes dans chaque requête) par la matrice creuse
+            termes-documents (valeur de chaque posting pour le modèle), 
+            restreinte aux termes des requêtes. Les modèles sans calcul en 
+            batch (getBatchWeights) classent les requêtes une à une.
+            @param queries: list(str), requêtes
+            @param k: int, nombre de documents à classer par requête (tous si None)
+            @return : list(RankedResult), classement de chaque requête
+        """
+        queries = list(queries)
+        batch = self.getBatchWeights(queries)
+        if batch == None: return [ self.getRanking(query, k) for query in queries ]
+        queryWeights, termValues, defaults = batch
+        
+        # Numérotation locale des termes des requêtes
+        termIds = dict()
+        for weights in queryWeights:
+            for stem in weights: termIds.setdefault(stem, len(termIds))
+        
+        Q = SparseMatrix.fromRows([ ( [ termIds[stem] for stem in weights ], list(weights.values()) ) for weights in queryWeights ], len(termIds))
+        D = SparseMatrix.fromRows([ termValues(stem) for stem in termIds ], self.ref_index.getNbRows())
+        scores = Q.dot(D)
         
-        # Tri des documents par score décroissant
-        return dict( sorted( scores.items(), reverse=True, key=lambda item: item[1] ) )
+        rankings = []
+        for i, default in enumerate(defaults):
+            rows, values = scores.getRow(i)
+            values = values + ( default if np.isscalar(default) else default[rows] )
+            rankings.append( self.rankRows(rows, values, default, k) )
+        return rankings
         
     
     
@@ -64,39 +323,79 @@ class Vectoriel(IRModel):
         super().__init__(ref_index)
         self.weighters = ref_weighters
         self.normalized = normalized
+    
+    def getParams(self):
+        return ( type(self.weighters).__name__, self.normalized )
+    
+    def getBatchWeights(self, queries):
+        """ Poids des requêtes donnés par le weighter et poids des documents
+            lus dans sa matrice des poids (divisés par les normes pour le 
+            score cosinus).
+        """
+        queryWeights = [ self.weighters.getWeightsForQuery(query) for query in queries ]
+        matrix = self.weighters.getWeightMatrix()
+        
+        if self.normalized:
+            queryWeights = [ self.normalize(query_w) for query_w in queryWeights ]
+        
+        def termValues(qstem):
+            t = self.ref_index.getTermId(qstem)
+            if t < 0: return np.zeros(0, dtype=np.int32), np.zeros(0)
+            rows, w_td = matrix.getRow(t)
+            if self.normalized: return rows, w_td / matrix.norms[rows]
+            return rows, w_td
         
-        # Optimisation: on évite de calculer à chaque requête les normes des documents
-        self.normsDocs = {idDoc : np.linalg.norm( list( self.weighters.getWeightsForDoc(idDoc).values())) for idDoc in self.index.keys()}
+        return queryWeights, termValues, [0.] * len(queries)
     
-    def getScores(self, query):
-        """ @param query: str, requête
+    def normalize(self, query_w):
+        """ Poids de la requête divisés par leur norme.
+        """
+        normQ = np.linalg.norm( list( query_w.values() ) )
+        if normQ == 0: return query_w
+        return { stem : w / normQ for stem, w in query_w.items() }
+    
+    def getNormsDocs(self):
+        """ Renvoie la norme des poids de chaque document, indexée par ligne
+            (calculée une fois par version de l'index et partagée par tous
+            les modèles utilisant la même pondération, cf CollectionStats).
+        """
+        return self.ref_index.getStats().getNorms(self.weighters)
+    
+    def getRowScores(self, query):
+        """ Produit scalaire (ou cosinus) de la requête avec les lignes de la
+            matrice des poids du weighter correspondant à ses termes.
+            @param query: str, requête
         """
         # Poids de chaque terme de la requete
         query_w = self.weighters.getWeightsForQuery(query)
-        # Norme de query
-        normQ = np.linalg.norm( list( query_w.values() ) )
-        
-        scores = {idDoc : 0 for idDoc in self.index.keys()}
+        matrix = self.weighters.getWeightMatrix()
         
-        # Calcul du produit scalaire
-        for qstem in query_w.keys():
-            stem_w = self.weighters.getWeightsForStem(qstem)
-            for idDoc in stem_w.keys():
-                scores[idDoc] += stem_w[idDoc] * query_w[qstem]
+        # Vecteur creux de la requête sur les termes de l'index
+        terms = [ (self.ref_index.getTermId(qstem), w) for qstem, w in query_w.items() ]
+        terms = [ (t, w) for t, w in terms if t >= 0 ]
+        rows, scores = matrix.dotQuery([ t for t, w in terms ], [ w for t, w in terms ])
         
-                # Cas score cosinus
-                if self.normalized:
-                    # Calcul du poids de chaque stem de query dans les Documents de la collection
-                    scores[idDoc] /= np.sqrt(normQ) + np.sqrt(self.normsDocs[idDoc])
+        # Cas score cosinus: produit scalaire / (||q|| * ||d||)
+        if self.normalized:
+            norms = np.linalg.norm( list( query_w.values() ) ) * matrix.norms[rows]
+            scores = np.divide( scores, norms, out=np.zeros(len(scores)), where=norms > 0 )
         
-        return scores
+        return rows, scores, 0.
     
 
 ############################ CLASSE MODELELANGUE ############################
 
 class ModeleLangue(IRModel):
     """ Modèle langue pour le classement de documents (lissage Jelinek-Mercer).
+        Les scores sont des log-vraisemblances: log p(q|d) = somme sur les
+        termes t de la requête de log p(t|d), avec
+            p(t|d) = lambda * tf_td / |d| + (1 - lambda) * p(t|Mc)
+        Ils ne s'annulent pas sur les longues requêtes (pas de produit de
+        probabilités) et classent les documents comme p(q|d). Un document de
+        probabilité nulle a un score de -inf (nullScore).
     """
+    nullScore = -np.inf
+    
     def __init__(self, ref_index, lamb=0.8):
         """ Constructeur de la classe ModeleLangue.
             @param ref_index: IndexerSimple, référence de l'indexer
@@ -104,78 +403,426 @@ class ModeleLangue(IRModel):
         """
         super().__init__(ref_index)
         self.lamb = lamb
-        # Nombre total d'occurrences (tout mot confondu) dans la collection
-        self.tf_coll = sum( [ sum(list(self.index_inverse[stem].values())) for stem in self.index_inverse.keys() ] )
-        # Calcul des longueurs de chaque document
-        self.lenDocs = {idDoc : sum( list( self.index[idDoc].values() ) ) for idDoc in self.index.keys()}
+    
+    def getParams(self):
+        return ( self.lamb, )
         
-    def getScores(self, query):
+    def getRowScores(self, query):
         """ @param query: str, requête
+            Les documents ne contenant aucun terme de la requête ont tous le 
+            même score (somme des log((1 - lambda) * p(t|Mc))), renvoyé comme
+            score par défaut. Seuls les postings des termes de la requête sont
+            parcourus.
         """
         # Récupération des stems des termes de la requête
-        ps = tr.PorterStemmer()
-        query_index = ps.getTextRepresentation(query)
+        query_index = self.analyzer.getTextRepresentation(query)
 
-        # Initialisation des scores
-        scores = {idDoc : 0 for idDoc in self.index.keys()}
+        # Statistiques de la collection: log p(t|Mc) de chaque terme, longueur 
+        # de chaque document (par ligne de l'index)
+        stats = self.ref_index.getStats()
+        logProbs = stats.getLogProbs()
+        lenDocs = stats.docLen
         
+        # Pour tout terme de la requête présent dans la collection: 
+        # log((1 - lambda) * p(t|Mc)) et postings
+        logBackgrounds, postings = [], []
         for qstem in query_index.keys():
-            # Pour tout terme de la requête présent dans la collection
-            if qstem in self.index_inverse.keys():
-                # Calcul de p(t|Mc)
-                tfs_qstem = self.index_inverse[qstem]
-                pt_Mc = sum(tfs_qstem.values()) / self.tf_coll
-                
-                for idDoc in self.index.keys():
-                    if scores[idDoc]==0: scores[idDoc] = 1
-                    if idDoc in tfs_qstem.keys():
-                        # Calcul de p(t|Md)
-                        pt_Md = self.index_inverse[qstem][idDoc] / self.lenDocs[idDoc]
-                        scores[idDoc] *= ( ( 1 - self.lamb ) * pt_Mc + self.lamb * pt_Md )
-                    else:
-                        scores[idDoc] *= ( 1 - self.lamb ) * pt_Mc
+            t = self.ref_index.getTermId(qstem)
+            if t >= 0 and stats.cfs[t] > 0:
+                logBackgrounds.append( np.log( 1 - self.lamb ) + logProbs[t] if self.lamb < 1 else -np.inf )
+                postings.append( self.ref_index.getPostings(qstem) )
+        
+        rows, positions = matchedRows(postings)
+        if not postings: return rows, np.zeros(0), self.nullScore
+        
+        if self.lamb >= 1: return rows, self.getRowScoresUnsmoothed(postings, positions, len(rows)), self.nullScore
+        
+        # Constante de la requête (documents ne contenant aucun terme), puis
+        # pour chaque posting, gain log(p(t|d)) - log((1 - lambda) * p(t|Mc))
+        default = float( np.sum(logBackgrounds) )
+        scores = np.full( len(rows), default )
+        for logBackground, (stem_rows, tfs), pos in zip(logBackgrounds, postings, positions):
+            scores[pos] += np.log1p( self.lamb * tfs / lenDocs[stem_rows] * np.exp(-logBackground) )
      
+        return rows, scores, default
+    
+    def getBatchWeights(self, queries):
+        """ Chaque terme présent dans la collection vaut 1 dans la requête; la
+            valeur d'un posting est son gain log(p(t|d)) - log((1 - lambda) * p(t|Mc)).
+        """
+        if self.lamb >= 1: return None
+        stats = self.ref_index.getStats()
+        logBackgrounds = np.log( 1 - self.lamb ) + stats.getLogProbs()
+        
+        def termValues(qstem):
+            stem_rows, tfs = self.ref_index.getPostings(qstem)
+            logBackground = logBackgrounds[ self.ref_index.getTermId(qstem) ]
+            return stem_rows, np.log1p( self.lamb * tfs / stats.docLen[stem_rows] * np.exp(-logBackground) )
+        
+        queryWeights, defaults = [], []
+        for query_index in self.analyzer.getTextRepresentations(queries):
+            terms = [ self.ref_index.getTermId(qstem) for qstem in query_index.keys() ]
+            terms = [ t for t in terms if t >= 0 and stats.cfs[t] > 0 ]
+            queryWeights.append({ self.ref_index.terms[t] : 1. for t in terms })
+            defaults.append( float( np.sum(logBackgrounds[terms]) ) if terms else self.nullScore )
+        return queryWeights, termValues, defaults
+    
+    def getRowScoresUnsmoothed(self, postings, positions, nbRows):
+        """ Cas lambda = 1 (sans lissage): p(t|d) est nul pour les documents ne
+            contenant pas t. Comme dans l'implémentation historique, le score
+            d'un tel document repart de zéro (log 1) au terme suivant.
+            @return scores: float array, score de chacun des nbRows documents
+        """
+        lenDocs = self.ref_index.getStats().docLen
+        scores = np.zeros(nbRows)
+        for (stem_rows, tfs), pos in zip(postings, positions):
+            logpt_d = np.full(nbRows, -np.inf)
+            logpt_d[pos] = np.log( tfs / lenDocs[stem_rows] )
+            scores[ scores == -np.inf ] = 0
+            scores += logpt_d
         return scores
 
 
+########################## CLASSE MODELEDEUXETAPES ##########################
+
+class ModeleDeuxEtapes(IRModel):
+    """ Modèle langue avec lissage en deux étapes (Zhai et Lafferty): lissage
+        de Dirichlet du modèle du document, puis interpolation avec le modèle
+        de la collection:
+            p(t|d) = (1 - lambda) * (tf_td + mu * p(t|Mc)) / (|d| + mu) + lambda * p(t|Mc)
+        Avec lambda = 0, c'est le lissage de Dirichlet (cf ModeleDirichlet).
+        Comme pour ModeleLangue, les scores sont des log-vraisemblances
+        calculées à partir des seuls postings des termes de la requête: un
+        document ne contenant pas t a p(t|d) = p(t|Mc) * a(d), avec
+            a(d) = (1 - lambda) * mu / (|d| + mu) + lambda
+        Les p(t|Mc) et les longueurs viennent des statistiques partagées de
+        l'index (CollectionStats); seul a(d) dépend de mu (cf setMu).
+    """
+    nullScore = -np.inf
+    
+    def __init__(self, ref_index, mu=2000, lamb=0.5):
+        """ Constructeur de la classe ModeleDeuxEtapes.
+            @param ref_index: IndexerSimple, référence de l'indexer
+            @param mu: float, paramètre du lissage de Dirichlet (mu > 0)
+            @param lamb: float, poids du modèle de la collection
+        """
+        super().__init__(ref_index)
+        self.mu = mu
+        self.lamb = lamb
+        self.smoothing = None
+    
+    def setMu(self, mu):
+        """ Change mu sans reconstruire le modèle ni les statistiques de l'index.
+        """
+        self.mu = mu
+    
+    def getParams(self):
+        return ( self.mu, self.lamb )
+    
+    def getSmoothing(self, stats):
+        """ Renvoie a(d) et log a(d) pour chaque ligne de l'index, recalculés 
+            seulement si mu, lambda ou l'index ont changé.
+        """
+        key = (stats.version, self.mu, self.lamb)
+        if self.smoothing == None or self.smoothing[0] != key:
+            a = ( 1 - self.lamb ) * self.mu / ( stats.docLen + self.mu ) + self.lamb
+            self.smoothing = (key, a, np.log(a))
+        return self.smoothing[1], self.smoothing[2]
+    
+    def getRowScores(self, query):
+        """ @param query: str, requête
+            Le score d'un document ne contenant aucun terme de la requête 
+            dépend de sa longueur: le score par défaut est un tableau indexé 
+            par ligne.
+        """
+        # Récupération des stems des termes de la requête
+        query_index = self.analyzer.getTextRepresentation(query)
+        
+        # Statistiques de la collection: log p(t|Mc), longueurs des documents
+        stats = self.ref_index.getStats()
+        logProbs = stats.getLogProbs()
+        lenDocs = stats.docLen
+        a, logA = self.getSmoothing(stats)
+        
+        # Pour tout terme de la requête présent dans la collection: log p(t|Mc) et postings
+        logPt_Mc, postings = [], []
+        for qstem in query_index.keys():
+            t = self.ref_index.getTermId(qstem)
+            if t >= 0 and stats.cfs[t] > 0:
+                logPt_Mc.append( logProbs[t] )
+                postings.append( self.ref_index.getPostings(qstem) )
+        
+        rows, positions = matchedRows(postings)
+        if not postings: return rows, np.zeros(0), self.nullScore
+        
+        # Score sans aucun terme de la requête: somme des log(p(t|Mc) * a(d))
+        default = float( np.sum(logPt_Mc) ) + len(postings) * logA
+        scores = default[rows]
+        
+        # Gain de chaque posting: log(p(t|d)) - log(p(t|Mc) * a(d))
+        for logP, (stem_rows, tfs), pos in zip(logPt_Mc, postings, positions):
+            scores[pos] += np.log1p( ( 1 - self.lamb ) * tfs / ( ( lenDocs[stem_rows] + self.mu ) * np.exp(logP) * a[stem_rows] ) )
+        
+        return rows, scores, default
+    
+    def getBatchWeights(self, queries):
+        """ Comme pour ModeleLangue, mais le score par défaut de chaque requête
+            est un tableau indexé par ligne.
+        """
+        stats = self.ref_index.getStats()
+        logProbs = stats.getLogProbs()
+        a, logA = self.getSmoothing(stats)
+        
+        def termValues(qstem):
+            stem_rows, tfs = self.ref_index.getPostings(qstem)
+            logP = logProbs[ self.ref_index.getTermId(qstem) ]
+            return stem_rows, np.log1p( ( 1 - self.lamb ) * tfs / ( ( stats.docLen[stem_rows] + self.mu ) * np.exp(logP) * a[stem_rows] ) )
+        
+        queryWeights, defaults = [], []
+        for query_index in self.analyzer.getTextRepresentations(queries):
+            terms = [ self.ref_index.getTermId(qstem) for qstem in query_index.keys() ]
+            terms = [ t for t in terms if t >= 0 and stats.cfs[t] > 0 ]
+            queryWeights.append({ self.ref_index.terms[t] : 1. for t in terms })
+            defaults.append( float( np.sum(logProbs[terms]) ) + len(terms) * logA if terms else self.nullScore )
+        return queryWeights, termValues, defaults
+
+
+########################## CLASSE MODELEDIRICHLET ###########################
+
+class ModeleDirichlet(ModeleDeuxEtapes):
+    """ Modèle langue avec lissage de Dirichlet:
+            p(t|d) = (tf_td + mu * p(t|Mc)) / (|d| + mu)
+    """
+    def __init__(self, ref_index, mu=2000):
+        """ Constructeur de la classe ModeleDirichlet.
+            @param ref_index: IndexerSimple, référence de l'indexer
+            @param mu: float, paramètre du lissage (mu > 0)
+        """
+        super().__init__(ref_index, mu, 0.)
+
+
 ############################ CLASSE OKAPI-BM25 ############################
 
 class Okapi(IRModel):
     """ Modèle probabiliste Okapi-BM25 pour le classement de documents.
+        Sur demande (pruning), le top-k (getRanking avec k) est calculé 
+        document par document avec l'élagage Block-Max WAND: les documents 
+        dont le score ne peut pas dépasser le k-ième meilleur score courant ne
+        sont pas évalués. Ce parcours est écrit en Python: il évalue moins de
+        postings mais reste plus lent que l'évaluation exhaustive vectorisée,
+        utilisée par défaut (cf Benchmark.py pruning).
+        Attributs:
+            * self.pruning: bool, True pour le top-k par Block-Max WAND
+            * self.scored: int, nombre de postings évalués par la dernière requête
     """
-    def __init__(self, ref_index, k=1.2, b=0.75):
+    def __init__(self, ref_index, k=1.2, b=0.75, pruning=False):
         """ Constructeur de la classe Okapi.
             @param ref_index: IndexerSimple, référence de l'indexer
+            @param pruning: bool, élagage du top-k (Block-Max WAND)
         """
         super().__init__(ref_index)
         self.k = k
         self.b = b
-        # Calcul des longueurs de chaque document
-        self.lenDocs = {idDoc : sum( list( self.index[idDoc].values() ) ) for idDoc in self.index.keys()}
-        # Longueur moyenne des documents
-        self.avgdl = np.mean( list( self.lenDocs.values() ) )
-        # Récupération des idf pour la collection
-        self.idf = self.ref_index.getIdf()
+        self.pruning = pruning
+        self.scored = 0
+    
+    def getParams(self):
+        return ( self.k, self.b )
+    
+    def getTermScores(self, qstem, rows, tfs, stats):
+        """ Score BM25 du terme qstem dans chacun des documents qui le contiennent.
+            @param rows, tfs: array, postings de qstem
+            @param stats: CollectionStats, statistiques de la collection
+        """
+        return ( stats.getIdf()[qstem] * tfs ) / ( tfs + self.k * ( 1 - self.b + self.b * stats.docLen[rows]/stats.avgdl ) )
+    
+    def getImpactArrays(self):
+        """ Scores BM25 de tous les postings de l'index et leurs bornes 
+            supérieures par bloc de BLOCK postings et par terme, calculés en 
+            une passe vectorisée une seule fois par version de l'index pour 
+            les paramètres k et b du modèle.
+            @return : dict, tableaux 'off', 'rows', 'scores' (index inversé des
+                      scores au format CSR), 'blockOff', 'blockMax', 'blockLast'
+                      (blocs du terme t aux positions blockOff[t] à 
+                      blockOff[t+1]: score maximal et dernière ligne de chaque
+                      bloc) et 'maxScores' (score maximal de chaque terme)
+        """
+        stats = self.ref_index.getStats()
+        impacts = stats.getCache( ('bm25', self.k, self.b) )
+        if not impacts:
+            off, rows, tfs = self.ref_index.getAllPostings()
+            nbTerms = len(off) - 1
+            lens = np.diff(off)
+            terms = np.repeat( np.arange(nbTerms), lens )
+            scores = ( stats.idfs[terms] * tfs ) / ( tfs + self.k * ( 1 - self.b + self.b * stats.docLen[rows]/stats.avgdl ) )
+            
+            # Blocs de BLOCK postings de chaque terme
+            nbBlocks = ( lens + BLOCK - 1 ) // BLOCK
+            blockOff = np.zeros(nbTerms + 1, dtype=np.int64)
+            blockOff[1:] = np.cumsum(nbBlocks)
+            blockTerms = np.repeat( np.arange(nbTerms), nbBlocks )
+            starts = off[blockTerms] + ( np.arange(blockOff[-1]) - blockOff[blockTerms] ) * BLOCK
+            blockMax = np.maximum.reduceat(scores, starts) if len(starts) else np.zeros(0)
+            blockLast = rows[ np.minimum(starts + BLOCK, off[blockTerms + 1]) - 1 ]
+            
+            maxScores = np.zeros(nbTerms)
+            nonEmpty = nbBlocks > 0
+            if nonEmpty.any(): maxScores[nonEmpty] = np.maximum.reduceat(blockMax, blockOff[:-1][nonEmpty])
+            
+            impacts.update( off=off, rows=rows, scores=scores, blockOff=blockOff, blockMax=blockMax, blockLast=blockLast, maxScores=maxScores )
+        return impacts
+    
+    def getImpacts(self, qstem):
+        """ Scores BM25 des postings de qstem et leurs bornes supérieures (cf
+            getImpactArrays), sous forme de listes parcourues élément par
+            élément par getRankingWAND.
+            @return rows: list(int), lignes des documents contenant qstem
+            @return scores: list(float), score de qstem dans chacun d'eux
+            @return blockMax: list(float), score maximal de chaque bloc
+            @return blockLast: list(int), dernière ligne de chaque bloc
+            @return maxScore: float, score maximal de qstem
+        """
+        impacts = self.getImpactArrays()
+        t = self.ref_index.getTermId(qstem)
+        postings = slice( impacts['off'][t], impacts['off'][t+1] )
+        blocks = slice( impacts['blockOff'][t], impacts['blockOff'][t+1] )
+        return ( impacts['rows'][postings].tolist(), impacts['scores'][postings].tolist(), impacts['blockMax'][blocks].tolist(),
+                 impacts['blockLast'][blocks].tolist(), float(impacts['maxScores'][t]) )
+    
+    def getRanking(self, query, k=None):
+        """ @param query: str, requête
+            @param k: int, nombre de documents à classer (tous si None)
+            @return : RankedResult, identique à celui de l'évaluation exhaustive
+        """
+        # Les bornes de score de WAND ne tiennent pas compte d'un prior
+        if k == None or not self.pruning or self.prior is not None: return super().getRanking(query, k)
+        return self.getRankingWAND(query, k)
+    
+    def getBatchWeights(self, queries):
+        """ Chaque terme de la requête présent dans la collection vaut 1; la
+            valeur d'un posting est son score BM25.
+        """
+        stats = self.ref_index.getStats()
         
-    def getScores(self, query):
+        def termValues(qstem):
+            stem_rows, tfs = self.ref_index.getPostings(qstem)
+            return stem_rows, self.getTermScores(qstem, stem_rows, tfs, stats)
+        
+        queryWeights = [ { qstem : 1. for qstem in query_index.keys() if qstem in self.index_inverse } for query_index in self.analyzer.getTextRepresentations(queries) ]
+        return queryWeights, termValues, [0.] * len(queryWeights)
+    
+    def getRankingWAND(self, query, k):
+        """ Top-k document par document (Block-Max WAND). Chaque terme de la
+            requête a un curseur sur ses postings; on cherche le pivot, premier
+            document pour lequel la somme des bornes des termes dont le curseur
+            est avant lui dépasse le seuil (k-ième score du tas). Si les
+            maxima des blocs contenant le pivot ne dépassent pas non plus le 
+            seuil, on saute jusqu'à la fin du plus proche de ces blocs.
+            Les scores sont sommés dans l'ordre des termes de la requête, comme
+            dans getRowScores: le classement est exactement le même.
+            @param query: str, requête
+            @param k: int, nombre de documents à classer
+            @return : RankedResult
+        """
+        query_index = self.analyzer.getTextRepresentation(query)
+        impacts = [ self.getImpacts(qstem) for qstem in query_index.keys() if qstem in self.index_inverse ]
+        impacts = [ impact for impact in impacts if len(impact[0]) ]
+        
+        # Curseur de chaque terme: position dans les postings et ligne courante
+        end = self.ref_index.getNbRows()
+        n = len(impacts)
+        pos = [0] * n
+        cur = [ rows[0] for rows, scores, blockMax, blockLast, maxScore in impacts ]
+        
+        def moveTo(i, row):
+            """ Avance le curseur du terme i au premier document >= row.
+            """
+            rows = impacts[i][0]
+            pos[i] = bisect_left(rows, row, pos[i])
+            cur[i] = rows[ pos[i] ] if pos[i] < len(rows) else end
+        
+        # Tas des k meilleurs (score, -ligne): à score égal, le document de
+        # plus grande ligne est le moins bon
+        heap = []
+        threshold = 0.
+        self.scored = 0
+        
+        while k > 0:
+            order = sorted(range(n), key=lambda i: cur[i])
+            
+            # Recherche du pivot
+            bound, p = 0., -1
+            for j, i in enumerate(order):
+                if cur[i] == end: break
+                bound += impacts[i][4]
+                if bound * ( 1 + EPS ) > threshold:
+                    p = j
+                    break
+            if p < 0: break
+            pivot = cur[ order[p] ]
+            # Les termes positionnés sur le pivot contribuent aussi à son score
+            while p + 1 < n and cur[ order[p + 1] ] == pivot: p += 1
+            
+            # Borne par blocs: blocs des termes order[:p+1] contenant le pivot
+            # (aucun si tous les postings du terme sont avant le pivot)
+            blocks = [ ( i, bisect_left(impacts[i][3], pivot) ) for i in order[ : p + 1 ] ]
+            blocks = [ (i, b) for i, b in blocks if b < len(impacts[i][3]) ]
+            blockBound = sum( impacts[i][2][b] for i, b in blocks )
+            
+            if blockBound * ( 1 + EPS ) > threshold:
+                if cur[ order[0] ] == pivot:
+                    # Evaluation complète du pivot (dans l'ordre de la requête)
+                    score = 0.
+                    for i in sorted(order[ : p + 1 ]):
+                        score += impacts[i][1][ pos[i] ]
+                        moveTo(i, pivot + 1)
+                    self.scored += p + 1
+                    
+                    if len(heap) < k: heapq.heappush(heap, (score, -pivot))
+                    elif score > threshold: heapq.heapreplace(heap, (score, -pivot))
+                    if len(heap) == k: threshold = heap[0][0]
+                else:
+                    # Les termes avant le pivot sont avancés jusqu'au pivot
+                    for i in order[ : p ]:
+                        if cur[i] < pivot: moveTo(i, pivot)
+            else:
+                # Aucun document avant la fin du plus proche bloc (ni avant le
+                # terme suivant) ne peut entrer dans le top-k
+                target = min( impacts[i][3][b] for i, b in blocks ) + 1
+                if p + 1 < n: target = min( target, cur[ order[p + 1] ] )
+                for i in order[ : p + 1 ]: moveTo(i, max(target, pivot + 1))
+        
+        # Tri final: score décroissant, puis ligne croissante
+        heap = [ (score, -row) for score, row in heap if score > 0 ]
+        heap.sort(key=lambda item: (-item[0], item[1]))
+        rows = np.array([ row for score, row in heap ], dtype=np.int64)
+        return RankedResult( self.ref_index.docIds[rows], np.array([ score for score, row in heap ]) )
+    
+    def getRowScores(self, query):
         """ @param query: str, requête
         """
         # Récupération des stems des termes de la requête
-        ps = tr.PorterStemmer()
-        query_index = ps.getTextRepresentation(query)
+        query_index = self.analyzer.getTextRepresentation(query)
+        
+        # Longueurs de chaque document (par ligne de l'index), longueur moyenne
+        # et idf de la collection
+        stats = self.ref_index.getStats()
+        lenDocs = stats.docLen
+        avgdl = stats.avgdl
+        idf = stats.getIdf()
+        
+        # Récupération des tf de chaque terme de la requête pour les Documents qui le contiennent
+        qstems = [ qstem for qstem in query_index.keys() if qstem in self.index_inverse ]
+        postings = [ self.ref_index.getPostings(qstem) for qstem in qstems ]
+        rows, positions = matchedRows(postings)
         
         # Initialisation des scores
-        scores = {idDoc : 0 for idDoc in self.index.keys()}
+        scores = np.zeros( len(rows) )
         
-        for qstem in query_index.keys():
-            if qstem in self.index_inverse.keys():
-                
-                # Récupération des tf de qstem pour chaque Document de la collection
-                tfs = self.index_inverse[qstem]
-                
-                for idDoc in tfs.keys():
-                    scores[idDoc] += ( self.idf[qstem] * tfs[idDoc] ) / ( tfs[idDoc] + self.k * ( 1 - self.b + self.b * self.lenDocs[idDoc]/self.avgdl ) )
+        for qstem, (stem_rows, tfs), pos in zip(qstems, postings, positions):
+            scores[pos] += self.getTermScores(qstem, stem_rows, tfs, stats)
+        self.scored = sum( len(stem_rows) for stem_rows, tfs in postings )
                     
-        return scores
+        return rows, scores, 0.
     
 # query = 'Une requête nekora assez banale store, ainsi qu\'une requête plus extraordinaire nekora'
\ No newline at end of file
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Apr 10 10:12:37 2021
+
+@author: GIANG Cécile, KHALFAT Célina
+"""
+
+##################### IMPORTATION DES LIBRAIRIES UTILES ####################
+
+import os
+import json
+import mmap
+import struct
+import numpy as np
+
+
+############################ FORMAT DU FICHIER ##############################
+
+# Format binaire versionné d'un index sur disque:
+#     * en-tête: MAGIC (8 octets) + version (uint32) + réservé (uint32)
+#     * sections: tableaux NumPy contigus, alignés sur ALIGN octets
+#     * table des matières (JSON utf-8): pour chaque section son nom, son
+#       dtype, son nombre d'éléments et sa position dans le fichier, ainsi
+#       que les métadonnées scalaires de l'index
+#     * pied de fichier: position (uint64) et taille (uint64) de la table
+#       des matières, suivies de MAGIC
+# La table des matières étant écrite à la fin, les sections peuvent être
+# écrites les unes après les autres, par morceaux (construction en flux).
+
+# Versions:
+#     * 1: postings stockés par identifiant de document
+#     * 2: postings stockés par ligne de document (cf IndexerSimple)
+MAGIC = b'RIINDEX\x00'
+VERSION = 2
+ALIGN = 64
+
+_HEADER = struct.Struct('<8sII')
+_FOOTER = struct.Struct('<QQ8s')
+
+
+class IndexFormatError(Exception):
+    """ Erreur levée lorsqu'un fichier n'est pas un index valide, ou que sa
+        version n'est pas supportée.
+    """
+    pass
+
+
+############################ CLASSE INDEXWRITER #############################
+
+class IndexWriter:
+    """ Classe permettant d'écrire un fichier index section par section.
+        Le fichier est écrit dans un fichier temporaire, renommé en path à la
+        fermeture: un index à moitié écrit n'est jamais visible.
+        Attributs:
+            * self.path: str, chemin du fichier index
+            * self.sections: dict(str, dict), description de chaque section
+            * self.meta: dict(str, object), métadonnées scalaires (JSON)
+    """
+    def __init__(self, path):
+        """ Constructeur de la classe IndexWriter.
+            @param path: str, chemin du fichier index à écrire
+        """
+        self.path = path
+        self.sections = dict()
+        self.meta = dict()
+        self.current = None
+        self.file = open(path + '.tmp', 'wb')
+        self.file.write(_HEADER.pack(MAGIC, VERSION, 0))
+
+    def _align(self):
+        """ Complète le fichier avec des zéros jusqu'au prochain multiple de ALIGN.
+        """
+        pos = self.file.tell()
+        if pos % ALIGN: self.file.write(b'\x00' * (ALIGN - pos % ALIGN))
+        return self.file.tell()
+
+    def addArray(self, name, array):
+        """ Ecrit le tableau array dans la section name.
+            @param name: str, nom de la section
+            @param array: array, tableau NumPy à une dimension
+        """
+        self.beginArray(name, np.asarray(array).dtype)
+        self.appendArray(array)
+        self.endArray()
+
+    def beginArray(self, name, dtype):
+        """ Ouvre la section name, remplie ensuite par appendArray.
+            @param name: str, nom de la section
+            @param dtype: np.dtype, type des éléments de la section
+        """
+        if self.current != None: raise ValueError('section %s non terminée' % self.current)
+        if name in self.sections: raise ValueError('section %s déjà écrite' % name)
+        dtype = np.dtype(dtype).newbyteorder('<')
+        self.sections[name] = {'dtype' : dtype.str, 'count' : 0, 'offset' : self._align()}
+        self.current = name
+
+    def appendArray(self, chunk):
+        """ Ajoute un morceau de tableau à la section courante.
+            @param chunk: array, éléments à ajouter
+        """
+        section = self.sections[self.current]
+        chunk = np.ascontiguousarray(chunk, dtype=np.dtype(section['dtype'])).ravel()
+        self.file.write(chunk.tobytes())
+        section['count'] += len(chunk)
+
+    def endArray(self):
+        """ Termine la section courante.
+        """
+        self.current = None
+
+    def addStrings(self, name, strings):
+        """ Ecrit une liste de chaînes de caractères (encodées en utf-8) sous
+            la forme de deux sections: name_data (octets) et name_off (positions).
+            @param name: str, nom de la liste
+            @param strings: list(str), chaînes à écrire
+        """
+        encoded = [ s.encode('utf-8') for s in strings ]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([ len(s) for s in encoded ])
+        self.addArray(name + '_off', offsets)
+        self.addArray(name + '_data', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+    def setMeta(self, key, value):
+        """ Enregistre une métadonnée scalaire (sérialisable en JSON).
+        """
+        self.meta[key] = value
+
+    def close(self):
+        """ Ecrit la table des matières et le pied de fichier, puis publie
+            l'index sous son nom définitif.
+        """
+        if self.current != None: self.endArray()
+        toc = json.dumps({'sections' : self.sections, 'meta' : self.meta}).encode('utf-8')
+        offset = self._align()
+        self.file.write(toc)
+        self.file.write(_FOOTER.pack(offset, len(toc), MAGIC))
+        self.file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+
+############################ CLASSE INDEXREADER #############################
+
+class IndexReader:
+    """ Classe permettant d'ouvrir en lecture seule un fichier index écrit par
+        IndexWriter. Le fichier est projeté en mémoire (mmap): les sections sont
+        des vues NumPy sur le fichier, chargées à la demande par le système.
+        Attributs:
+            * self.path: str, chemin du fichier index
+            * self.sections: dict(str, dict), description de chaque section
+            * self.meta: dict(str, object), métadonnées scalaires
+    """
+    def __init__(self, path):
+        """ Constructeur de la classe IndexReader.
+            @param path: str, chemin du fichier index
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Vérification de l'en-tête et du pied de fichier
+        if len(self.mm) < _HEADER.size + _FOOTER.size:
+            raise IndexFormatError('%s: fichier trop court' % path)
+        magic, version, _ = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise IndexFormatError('%s: ce fichier n\'est pas un index' % path)
+        if version > VERSION:
+            raise IndexFormatError('%s: version %d non supportée (max %d)' % (path, version, VERSION))
+        offset, size, magic = _FOOTER.unpack_from(self.mm, len(self.mm) - _FOOTER.size)
+        if magic != MAGIC:
+            raise IndexFormatError('%s: index tronqué' % path)
+
+        toc = json.loads(self.mm[offset : offset + size].decode('utf-8'))
+        self.version = version
+        self.sections = toc['sections']
+        self.meta = toc['meta']
+
+    def has(self, name):
+        return name in self.sections
+
+    def getArray(self, name):
+        """ Retourne la section name sous la forme d'un tableau NumPy en lecture
+            seule, sans copie.
+            @param name: str, nom de la section
+        """
+        section = self.sections[name]
+        return np.frombuffer(self.mm, dtype=np.dtype(section['dtype']), count=section['count'], offset=section['offset'])
+
+    def getStrings(self, name):
+        """ Retourne la liste de chaînes de caractères écrite par addStrings.
+            @param name: str, nom de la liste
+            @return : list(str)
+        """
+        offsets = self.getArray(name + '_off')
+        data = self.getArray(name + '_data').tobytes()
+        return [ data[offsets[i] : offsets[i+1]].decode('utf-8') for i in range(len(offsets) - 1) ]
+
+    def getMeta(self, key, default=None):
+        return self.meta.get(key, default)
@@ -7,63 +7,726 @@ Created on Wed Jan 27 09:29:53 2021
 
 ##################### IMPORTATION DES FICHIERS EXTERNES ####################
 
-import math
+import os
+import heapq
+import shutil
+import tempfile
+import numpy as np
 import textRepresenter as tr
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from collections.abc import Mapping
+from IndexFile import IndexWriter, IndexReader, IndexFormatError
+from Compression import CompressedPostings
+from Parser import Parser, DocumentStore
+from CitationGraph import CitationGraph
+from CollectionStats import CollectionStats
+from Weighter import WeightSegment
+
+############################# VUES SUR L'INDEX #############################
+
+class IndexView(Mapping):
+    """ Vue en lecture seule de l'index d'un IndexerSimple, sous la forme
+        historique dict(int, dict(str, int)): pour chaque identifiant de
+        document, le tf de chacun de ses stems. Les dictionnaires sont
+        construits à la demande à partir des tableaux CSR de l'indexer.
+    """
+    def __init__(self, indexer):
+        self.indexer = indexer
+    
+    def __getitem__(self, idDoc):
+        if idDoc not in self: raise KeyError(idDoc)
+        return self.indexer.getTfsForDoc(idDoc)
+    
+    def __contains__(self, idDoc):
+        return self.indexer.getDocRow(idDoc) >= 0
+    
+    def __iter__(self):
+        return iter(self.indexer.docIds[self.indexer.alive].tolist())
+    
+    def __len__(self):
+        return self.indexer.getNbDocs()
+
+
+class IndexInverseView(Mapping):
+    """ Vue en lecture seule de l'index inversé d'un IndexerSimple, sous la 
+        forme historique dict(str, dict(int, int)): pour chaque stem, le tf
+        de chaque document qui le contient.
+    """
+    def __init__(self, indexer):
+        self.indexer = indexer
+    
+    def __getitem__(self, stem):
+        if stem not in self: raise KeyError(stem)
+        return self.indexer.getTfsForStem(stem)
+    
+    def __contains__(self, stem):
+        return stem in self.indexer.termIds
+    
+    def __iter__(self):
+        return iter(self.indexer.terms)
+    
+    def __len__(self):
+        return len(self.indexer.terms)
+
+
+########################## FONCTIONS D'INDEXATION ##########################
+
+def indexShard(documents, analyzer=None):
+    """ Indexe un morceau (shard) de la collection. Fonction de module pour 
+        pouvoir être exécutée dans un processus fils.
+        Les termes sont numérotés localement au shard, par ordre de première
+        apparition. Les textes du shard sont stemmés en batch: chaque forme
+        distincte n'est stemmée qu'une fois.
+        @param documents: list((int, str)), identifiant et texte de chaque document
+        @param analyzer: Analyzer, analyseur des textes (par défaut Analyzer())
+        @return shard: tuple, (terms, docIds, fwd_off, fwd_terms, fwd_tfs,
+                       post_off, post_rows, post_tfs), index et index inversé
+                       partiels au format CSR (lignes locales au shard)
+    """
+    # Initialisation analyseur
+    ps = analyzer if analyzer != None else tr.Analyzer()
+    
+    terms = []
+    termIds = dict()
+    docIds = []
+    fwd_len, fwd_terms, fwd_tfs = [], [], []
+    
+    # Calcul de l'index au format COO (ligne, terme, tf)
+    representations = ps.getTextRepresentations([ texte for idDoc, texte in documents ])
+    for (idDoc, texte), tfs in zip(documents, representations):
+        docIds.append( idDoc )
+        for word, tf in tfs.items():
+            if word not in termIds:
+                termIds[word] = len(terms)
+                terms.append(word)
+            fwd_terms.append( termIds[word] )
+            fwd_tfs.append( tf )
+        fwd_len.append( len(tfs) )
+    
+    docIds = np.array(docIds, dtype=np.int32)
+    fwd_off = np.zeros(len(docIds) + 1, dtype=np.int64)
+    fwd_off[1:] = np.cumsum(fwd_len)
+    fwd_terms = np.array(fwd_terms, dtype=np.int32)
+    fwd_tfs = np.array(fwd_tfs, dtype=np.int32)
+    
+    # Index inversé partiel: transposition stable de l'index
+    rows = np.repeat( np.arange(len(docIds), dtype=np.int32), fwd_len )
+    order = np.argsort(fwd_terms, kind='stable')
+    post_off = np.zeros(len(terms) + 1, dtype=np.int64)
+    post_off[1:] = np.cumsum( np.bincount(fwd_terms, minlength=len(terms)) )
+    
+    return terms, docIds, fwd_off, fwd_terms, fwd_tfs, post_off, rows[order], fwd_tfs[order]
+
+
+def batches(documents, size):
+    """ Découpe un flux de Documents en shards de size documents, lus au fur et
+        à mesure (cf Parser.iterDocuments).
+        @param documents: iterable(Document), documents de la collection
+        @param size: int, nombre de documents par shard
+        @return : generator(list((int, str))), identifiant et texte des
+                  documents de chaque shard
+    """
+    batch = []
+    for document in documents:
+        batch.append( ( document.getId(), document.getTexte() ) )
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+
+def mergeShards(shards):
+    """ Fusionne les index partiels de shards consécutifs de la collection.
+        La fusion est déterministe: les termes reçoivent leur identifiant global
+        par ordre de première apparition dans la collection et les postings de
+        chaque terme restent dans l'ordre de la collection, quel que soit le 
+        découpage en shards.
+        @param shards: list(tuple), index partiels rendus par indexShard, dans
+                       l'ordre de la collection
+        @return : tuple, (terms, docIds, fwd_off, fwd_terms, fwd_tfs, post_off,
+                  post_rows, post_tfs)
+    """
+    terms = []
+    termIds = dict()
+    docIds, fwd_len, fwd_terms, fwd_tfs = [], [], [], []
+    post_terms, post_rows, post_tfs = [], [], []
+    nbRows = 0
+    
+    for sTerms, sDocIds, sFwdOff, sFwdTerms, sFwdTfs, sPostOff, sPostRows, sPostTfs in shards:
+        # Identifiant global de chaque terme du shard
+        remap = np.empty(len(sTerms), dtype=np.int32)
+        for i, stem in enumerate(sTerms):
+            if stem not in termIds:
+                termIds[stem] = len(terms)
+                terms.append(stem)
+            remap[i] = termIds[stem]
+        
+        docIds.append( sDocIds )
+        fwd_len.append( np.diff(sFwdOff) )
+        fwd_terms.append( remap[sFwdTerms] )
+        fwd_tfs.append( sFwdTfs )
+        post_terms.append( np.repeat(remap, np.diff(sPostOff)) )
+        post_rows.append( sPostRows + nbRows )
+        post_tfs.append( sPostTfs )
+        nbRows += len(sDocIds)
+    
+    docIds = np.concatenate(docIds) if docIds else np.zeros(0, dtype=np.int32)
+    fwd_off = np.zeros(len(docIds) + 1, dtype=np.int64)
+    if fwd_len: fwd_off[1:] = np.cumsum( np.concatenate(fwd_len) )
+    fwd_terms = np.concatenate(fwd_terms) if fwd_terms else np.zeros(0, dtype=np.int32)
+    fwd_tfs = np.concatenate(fwd_tfs) if fwd_tfs else np.zeros(0, dtype=np.int32)
+    
+    # Concaténation des postings de chaque terme, shard après shard
+    post_terms = np.concatenate(post_terms) if post_terms else np.zeros(0, dtype=np.int32)
+    order = np.argsort(post_terms, kind='stable')
+    post_off = np.zeros(len(terms) + 1, dtype=np.int64)
+    post_off[1:] = np.cumsum( np.bincount(post_terms, minlength=len(terms)) )
+    post_rows = np.concatenate(post_rows)[order] if post_rows else np.zeros(0, dtype=np.int32)
+    post_tfs = np.concatenate(post_tfs)[order] if post_tfs else np.zeros(0, dtype=np.int32)
+    
+    return terms, docIds, fwd_off, fwd_terms, fwd_tfs, post_off, post_rows, post_tfs
+
+
+def grow(buffer, size, fill=0):
+    """ Renvoie un tableau de capacité au moins size commençant par buffer.
+        La capacité est au moins doublée à chaque réallocation, pour que des
+        ajouts successifs coûtent en moyenne O(1) par élément.
+        @param buffer: array, tableau à agrandir
+        @param size: int, capacité minimale
+        @param fill: valeur des nouvelles cases
+    """
+    if size <= len(buffer): return buffer
+    new = np.full( max(size, 2 * len(buffer)), fill, dtype=buffer.dtype )
+    new[:len(buffer)] = buffer
+    return new
+
 
 ########################### CLASSE INDEXERSIMPLE ###########################
 
 class IndexerSimple:
     """ Classe permettant d'indexer une collection de documents rendue par la
-        méthode getCollection() de la classe Parser. Génère les fichiers index
-        correspondant à l'index et l'index inversé de la collection.
+        méthode getCollection() de la classe Parser. Génère l'index et l'index 
+        inversé de la collection.
+        Les stems sont numérotés (identifiant de terme dense, par ordre de
+        première apparition) et les documents sont numérotés par leur rang
+        dans l'index (ligne). Les deux index partagent les mêmes données,
+        stockées dans des tableaux NumPy contigus au format CSR:
+            * index inversé: les postings du terme t sont aux positions
+              post_off[t] à post_off[t+1] de post_rows (lignes des documents)
+              et post_tfs (tf)
+            * index: les termes de la ligne d sont aux positions fwd_off[d] à
+              fwd_off[d+1] de fwd_terms (identifiants de termes) et fwd_tfs (tf)
+        Les documents ajoutés après la construction (addDocuments) sont dans
+        un segment delta en mémoire, les documents supprimés (deleteDocuments)
+        sont marqués morts (tombstones) et filtrés à la lecture. compact()
+        réécrit l'ensemble dans des tableaux CSR.
         Attributs:
             * self.collection: dict(int, Document), collection de Documents
-            * self.index: dict(int, int), ensemble des index des Documents de la collection
-            * self.index_inv: dict(str, int), ensemble des index des Documents de la collection
+            * self.store: DocumentStore, accès aux textes des documents (cf getStrDoc)
+            * self.texts: dict(int, str), textes des documents ajoutés par 
+                          addDocuments (prioritaires sur le store)
+            * self.analyzer: Analyzer, analyseur des documents et des requêtes
+            * self.terms: list(str), stem de chaque identifiant de terme
+            * self.termIds: dict(str, int), identifiant de chaque stem
+            * self.docIds: int array, identifiant (.I) de chaque ligne
+            * self.docLen: int array, longueur (nombre de stems) de chaque ligne
+            * self.alive: bool array, False pour les lignes supprimées
+            * self.dfs: int array, df de chaque terme
+            * self.cfs: int array, nombre d'occurrences de chaque terme dans
+                        les documents vivants
+            * self.version: int, incrémenté à chaque modification de l'index
+            * self.stats: CollectionStats, statistiques de la version courante
+                          de l'index (cf getStats)
+            * self.weights: dict(str, WeightSegment), poids du segment 
+                            principal de chaque Weighter (cf getWeightSegment)
+            * self.weighters: dict(str, Weighter), weighter ayant demandé 
+                              chaque segment de poids (cf compact)
+            * self.priors: dict(str, float array), priors statiques des 
+                           documents indexés par identifiant (cf setPrior)
+            * self.index: IndexView, index (vue dict(int, dict(str, int)))
+            * self.index_inverse: IndexInverseView, index inversé (vue 
+                                  dict(str, dict(int, int)))
     """
-    def __init__(self, parser):
+    # Nombre de documents par shard pour l'indexation d'un flux (fromDocuments)
+    BATCH = 4096
+    
+    def __init__(self, parser, workers=1, analyzer=None):
         """ Constructeur de la classe IndexerSimple.
             @param parser: Parser, parser de la collection de documents
+            @param workers: int, nombre de processus utilisés pour l'indexation
+            @param analyzer: Analyzer, analyseur des textes (par défaut Analyzer())
         """
-        self.parser = parser
-        self.collection = parser.getCollection()
-        self.index = dict()
-        self.index_inverse = dict()
+        self._init(parser, analyzer)
         
         # Mise à jour de l'index et l'index inversé sur la collection
-        self.indexation()
-        self.idf = self.getIdf()
+        self.indexation(workers)
+    
+    @classmethod
+    def fromDocuments(cls, documents, analyzer=None):
+        """ Indexe un flux de Documents, par exemple Parser.iterDocuments(filename):
+            les documents sont lus, analysés et indexés par shards de BATCH 
+            documents au fur et à mesure de la lecture, sans garder en mémoire
+            le fichier ni la collection. L'index obtenu est identique à celui de
+            IndexerSimple(Parser(filename)), mais n'a ni parser ni collection.
+            @param documents: iterable(Document), documents de la collection
+            @param analyzer: Analyzer, analyseur des textes (par défaut Analyzer())
+            @return : IndexerSimple
+        """
+        indexer = cls.__new__(cls)
+        indexer._init(None, analyzer)
+        
+        # Liens de chaque document, relevés pendant la lecture (graphe des citations)
+        ids, links = [], []
+        def read(documents):
+            for document in documents:
+                ids.append( document.getId() )
+                links.append( document.getLiens() )
+                yield document
+        
+        indexer.setArrays( *mergeShards([ indexShard(batch, indexer.analyzer) for batch in batches(read(documents), cls.BATCH) ]) )
+        indexer.graph = CitationGraph.fromLinks(ids, links)
+        return indexer
+    
+    @classmethod
+    def fromFile(cls, filename, analyzer=None):
+        """ Indexe la collection filename en flux (cf fromDocuments). Les textes
+            ne sont pas gardés en mémoire: getStrDoc les relit à la demande dans
+            le fichier (cf DocumentStore), la mémoire occupée après l'indexation
+            ne dépend donc pas de la taille des textes.
+            @param filename: str, nom du fichier .txt de la collection
+            @param analyzer: Analyzer, analyseur des textes (par défaut Analyzer())
+            @return : IndexerSimple
+        """
+        indexer = cls.fromDocuments(Parser.iterDocuments(filename), analyzer)
+        indexer.store = DocumentStore.fromFile(filename)
+        return indexer
+    
+    def _init(self, parser, analyzer):
+        """ Initialise les attributs de l'index, avant le calcul des tableaux
+            (l'index n'a pas de collection si parser vaut None, cf load et
+            fromDocuments).
+        """
+        self.parser = parser
+        self.collection = parser.getCollection() if parser != None else None
+        self.store = parser.getStore() if parser != None else None
+        self.texts = dict()
+        self.weighters = dict()
+        self.graph = None
+        self.analyzer = analyzer if analyzer != None else tr.Analyzer()
+        self.index = IndexView(self)
+        self.index_inverse = IndexInverseView(self)
+        self.version = 0
+        self.stats = None
+        self.priors = dict()
     
-    def indexation(self):
-        """ Calcule l'index et l'index inverse du document passé en paramètre.
+    def indexation(self, workers=1):
+        """ Calcule l'index et l'index inversé de la collection.
             Le calcul des index se fera à partir du nombre d'occurrences de 
             chaque mot.
-            Attention: l'index et l'index inversé sont des dictionnaires dont 
-                       les clés sont l'identifiant du document, et non le 
-                       numéro du document dans la collection
-            @param document: Document, indice du document à parser dans la collection
-            @return occurrences: dict(str, int), dictionnaire des occurrences
+            Si workers > 1, la collection est découpée en shards consécutifs,
+            indexés en parallèle par un pool de processus puis fusionnés: le
+            résultat est identique à celui de l'indexation séquentielle.
+            @param workers: int, nombre de processus
         """
-        # Initialisation stemmer
-        ps = tr.PorterStemmer()
+        documents = [ ( document.getId(), document.getTexte() ) for document in self.collection.values() ]
         
-        # Calcul de l'index et de l'index inversé
+        if workers <= 1 or len(documents) < 2:
+            shards = [ indexShard(documents, self.analyzer) ]
+        else:
+            # Plusieurs shards par processus pour équilibrer la charge
+            nbShards = min( 4 * workers, len(documents) )
+            bounds = np.linspace(0, len(documents), nbShards + 1).astype(int)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                shards = list( pool.map(partial(indexShard, analyzer=self.analyzer), [ documents[bounds[i] : bounds[i+1]] for i in range(nbShards) ]) )
         
-        for i in self.collection:
-            
-            # Récupération du texte du document
-            document = self.collection[i]
-            texte = document.getTexte()
+        self.setArrays( *mergeShards(shards) )
+    
+    def setArrays(self, terms, docIds, fwd_off, fwd_terms, fwd_tfs, post_off=None, post_rows=None, post_tfs=None, docLen=None, dfs=None, idfs=None, cpostings=None):
+        """ Installe les tableaux de l'index et calcule les tableaux dérivés
+            qui ne sont pas donnés. Le segment delta et les tombstones sont vidés.
+            Si l'index inversé n'est pas donné, il est obtenu en transposant
+            l'index (tri stable par terme: les postings de chaque terme restent
+            dans l'ordre des lignes). S'il est donné compressé (cpostings),
+            post_rows et post_tfs valent None.
+        """
+        self.terms = list(terms)
+        self.termIds = { stem : t for t, stem in enumerate(self.terms) }
+        self.fwd_off, self.fwd_terms, self.fwd_tfs = fwd_off, fwd_terms, fwd_tfs
+        
+        if post_off is None and cpostings is None:
+            # Ligne de chaque entrée de l'index
+            rows = np.repeat( np.arange(len(docIds), dtype=np.int32), np.diff(fwd_off) )
+            order = np.argsort(fwd_terms, kind='stable')
+            post_off = np.zeros(len(terms) + 1, dtype=np.int64)
+            post_off[1:] = np.cumsum( np.bincount(fwd_terms, minlength=len(terms)) )
+            post_rows = rows[order]
+            post_tfs = fwd_tfs[order]
+        self.post_off, self.post_rows, self.post_tfs = post_off, post_rows, post_tfs
+        self.cpostings = cpostings
+        
+        # Tableaux modifiables par addDocuments/deleteDocuments (copies si l'index
+        # est projeté en mémoire)
+        self.nbRows = self.nbMainRows = len(docIds)
+        self._docIds = np.array(docIds, dtype=np.int32)
+        self._alive = np.ones(len(docIds), dtype=bool)
+        
+        # Table de correspondance identifiant .I -> ligne (-1 si absent)
+        self.rows = np.full(int(self._docIds.max()) + 1 if len(docIds) else 0, -1, dtype=np.int32)
+        self.rows[self._docIds] = np.arange(len(docIds), dtype=np.int32)
+        
+        # Statistiques de la collection
+        if docLen is None:
+            docLen = np.zeros(len(docIds), dtype=np.int64)
+            nonEmpty = fwd_off[:-1] < fwd_off[1:]
+            docLen[nonEmpty] = np.add.reduceat(fwd_tfs, fwd_off[:-1][nonEmpty])
+        if dfs is None: dfs = np.diff(post_off)
+        self._docLen = np.array(docLen, dtype=np.int64)
+        self._dfs = np.array(dfs, dtype=np.int32)
+        self._cfs = np.bincount(fwd_terms, weights=fwd_tfs, minlength=len(self.terms)).astype(np.int64)
+        self.nbDocs = len(docIds)
+        self.totalLen = int(self._docLen.sum())
+        
+        # Segment delta: postings et index des documents ajoutés
+        self.delta_post = dict()
+        self.delta_fwd = dict()
+        self.nbDeleted = 0
+        
+        # Poids du segment principal par weighter (cf getWeightSegment)
+        self.weights = dict()
+        
+        self.version = getattr(self, 'version', 0) + 1
+        self.stats = CollectionStats(self, idfs) if idfs is not None else None
+    
+    
+    # --------------- Mise à jour incrémentale ---------------
+    
+    def addDocuments(self, documents):
+        """ Ajoute des documents à l'index sans le reconstruire: leurs postings
+            vont dans le segment delta, df et les longueurs sont mis à jour
+            incrémentalement. Le coût est proportionnel à la taille des 
+            documents ajoutés. Si l'index a un parser, la collection et les
+            liens (getAllLinksFrom/getAllLinksTo) sont aussi mis à jour.
+            Si un document est déjà indexé ou apparaît deux fois, ValueError
+            est levée avant toute modification.
+            @param documents: iterable(Document), documents à ajouter
+        """
+        documents = list(documents)
+        seen = set()
+        for document in documents:
+            idDoc = document.getId()
+            if self.getDocRow(idDoc) >= 0: raise ValueError('document %d déjà indexé' % idDoc)
+            if idDoc in seen: raise ValueError('document %d ajouté deux fois' % idDoc)
+            seen.add(idDoc)
+        
+        representations = self.analyzer.getTextRepresentations([ document.getTexte() for document in documents ])
+        for document, tfs in zip(documents, representations):
             idDoc = document.getId()
             
-            # Indexation du texte du document
-            self.index[idDoc] = ps.getTextRepresentation(texte)
+            # Nouvelle ligne
+            row = self.nbRows
+            self.nbRows += 1
+            self._docIds = grow(self._docIds, self.nbRows)
+            self._docLen = grow(self._docLen, self.nbRows)
+            self._alive = grow(self._alive, self.nbRows, False)
+            self.rows = grow(self.rows, idDoc + 1, -1)
             
-            # Calcul de l'index inverse
-            for word in self.index[idDoc]:
-                if word not in self.index_inverse: self.index_inverse[word] = dict()
-                self.index_inverse[word][idDoc] = self.index[idDoc][word]
-                
+            # Identifiants des termes (nouveaux termes en fin de dictionnaire)
+            for word in tfs:
+                if word not in self.termIds:
+                    self.termIds[word] = len(self.terms)
+                    self.terms.append(word)
+            self._dfs = grow(self._dfs, len(self.terms))
+            self._cfs = grow(self._cfs, len(self.terms))
+            terms = np.fromiter((self.termIds[word] for word in tfs), dtype=np.int32, count=len(tfs))
+            row_tfs = np.fromiter(tfs.values(), dtype=np.int32, count=len(tfs))
+            
+            # Index et index inversé du segment delta
+            self.delta_fwd[row] = (terms, row_tfs)
+            for t, tf in zip(terms.tolist(), row_tfs.tolist()):
+                if t not in self.delta_post: self.delta_post[t] = ( array('i'), array('i') )
+                self.delta_post[t][0].append(row)
+                self.delta_post[t][1].append(tf)
+            
+            # Statistiques
+            self._docIds[row] = idDoc
+            self._docLen[row] = row_tfs.sum()
+            self._alive[row] = True
+            self.rows[idDoc] = row
+            self.texts[idDoc] = document.getTexte()
+            self._dfs[terms] += 1
+            self._cfs[terms] += row_tfs
+            self.nbDocs += 1
+            self.totalLen += int(row_tfs.sum())
+        
+        if self.parser != None: self.parser.addDocuments(documents)
+        self.version += 1
+    
+    def deleteDocuments(self, ids):
+        """ Supprime des documents de l'index: leurs lignes sont marquées mortes
+            (tombstones) et ne sont plus renvoyées par les postings; df et les
+            longueurs sont mis à jour incrémentalement. Si l'index a un parser,
+            la collection et les liens sont aussi mis à jour.
+            Les identifiants répétés ne sont supprimés qu'une fois; si l'un
+            d'eux n'est pas dans l'index, KeyError est levée avant toute 
+            modification.
+            @param ids: iterable(int), identifiants (.I) des documents
+        """
+        ids = list( dict.fromkeys(ids) )
+        missing = [ idDoc for idDoc in ids if self.getDocRow(idDoc) < 0 ]
+        if missing: raise KeyError(missing[0])
+        
+        for idDoc in ids:
+            row = self.getDocRow(idDoc)
+            terms, tfs = self.getDocTerms(idDoc)
+            
+            self._alive[row] = False
+            self.rows[idDoc] = -1
+            self.texts.pop(idDoc, None)
+            self._dfs[terms] -= 1
+            self._cfs[terms] -= tfs
+            self.nbDocs -= 1
+            self.totalLen -= int(self._docLen[row])
+            self.nbDeleted += 1
+        
+        if self.parser != None: self.parser.deleteDocuments(ids)
+        self.version += 1
+    
+    def compact(self):
+        """ Réécrit l'index (segment principal, segment delta, tombstones) dans
+            de nouveaux tableaux CSR. Les documents vivants sont renumérotés
+            dans l'ordre de leurs lignes; les identifiants de termes ne changent pas.
+        """
+        if self.nbRows == self.nbMainRows and self.nbDeleted == 0: return
+        alive = self.alive
+        
+        # Segment principal: entrées des lignes vivantes
+        lens = np.diff(self.fwd_off)
+        keep = np.repeat( alive[:self.nbMainRows], lens )
+        fwd_len = [ lens[ alive[:self.nbMainRows] ] ]
+        fwd_terms = [ self.fwd_terms[keep] ]
+        fwd_tfs = [ self.fwd_tfs[keep] ]
+        
+        # Segment delta
+        for row in range(self.nbMainRows, self.nbRows):
+            if alive[row]:
+                terms, tfs = self.delta_fwd[row]
+                fwd_len.append( [len(terms)] )
+                fwd_terms.append(terms)
+                fwd_tfs.append(tfs)
+        
+        docIds = self.docIds[alive]
+        fwd_off = np.zeros(len(docIds) + 1, dtype=np.int64)
+        fwd_off[1:] = np.cumsum( np.concatenate(fwd_len) )
+        
+        # Poids du segment principal: lignes vivantes renumérotées et poids 
+        # du delta (calculés par le weighter qui a demandé le segment; un 
+        # segment relu avec l'index sans weighter connu est abandonné si le 
+        # delta n'est pas vide)
+        weights = dict()
+        for name, segment in self.weights.items():
+            if not self.delta_post: weights[name] = segment.compact(None, alive, len(self.terms))
+            elif name in self.weighters:
+                delta = WeightSegment.fromPostings(self.weighters[name], *self.getDeltaPostings(), self.nbRows)
+                weights[name] = segment.compact(delta, alive, len(self.terms))
+        
+        self.setArrays(self.terms, docIds, fwd_off, np.concatenate(fwd_terms).astype(np.int32), np.concatenate(fwd_tfs).astype(np.int32))
+        self.weights = weights
+    
+    
+    # --------------- Accès aux tableaux de l'index ---------------
+    
+    @property
+    def docIds(self):
+        return self._docIds[:self.nbRows]
+    
+    @property
+    def docLen(self):
+        return self._docLen[:self.nbRows]
+    
+    @property
+    def alive(self):
+        return self._alive[:self.nbRows]
+    
+    @property
+    def dfs(self):
+        return self._dfs[:len(self.terms)]
+    
+    @property
+    def cfs(self):
+        return self._cfs[:len(self.terms)]
+    
+    def getStats(self):
+        """ Renvoie les statistiques de la collection (df, idf, fréquences
+            dans la collection, longueurs, normes), recalculées seulement si
+            l'index a changé depuis le dernier appel.
+            @return : CollectionStats
+        """
+        if self.stats == None or self.stats.version != self.version:
+            self.stats = CollectionStats(self)
+        return self.stats
+    
+    def getIdfs(self):
+        """ Renvoie l'idf de chaque terme (tableau indexé par identifiant de
+            terme), recalculé seulement si l'index a changé.
+        """
+        return self.getStats().idfs
+    
+    def getCollectionFrequencies(self):
+        """ Renvoie le nombre d'occurrences de chaque terme dans les documents
+            vivants de la collection (tableau indexé par identifiant de terme),
+            tenu à jour incrémentalement comme df.
+        """
+        return self.cfs
+    
+    def getTermId(self, stem):
+        """ Renvoie l'identifiant du stem, -1 s'il n'est pas dans l'index.
+        """
+        return self.termIds.get(stem, -1)
+    
+    def getDocRow(self, idDoc):
+        """ Renvoie la ligne du document idDoc, -1 s'il n'est pas dans l'index.
+        """
+        if 0 <= idDoc < len(self.rows): return int(self.rows[idDoc])
+        return -1
+    
+    def getPostings(self, stem):
+        """ Renvoie les postings du stem sous la forme de deux tableaux 
+            parallèles (vues sans copie sur l'index inversé si l'index n'a
+            ni segment delta ni tombstones pour ce stem).
+            @param stem: str, stem de mot
+            @return rows: int32 array, lignes des documents contenant stem
+            @return tfs: int32 array, tf de stem dans chacun de ces documents
+        """
+        t = self.termIds.get(stem, -1)
+        if t < 0: return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        
+        # Segment principal
+        rows, tfs = self.getMainPostings(t)
+        
+        # Segment delta
+        if t in self.delta_post:
+            delta_rows, delta_tfs = self.delta_post[t]
+            rows = np.concatenate( (rows, np.frombuffer(delta_rows, dtype=np.int32)) )
+            tfs = np.concatenate( (tfs, np.frombuffer(delta_tfs, dtype=np.int32)) )
+        
+        # Tombstones
+        if self.nbDeleted:
+            keep = self._alive[rows]
+            rows, tfs = rows[keep], tfs[keep]
+        
+        return rows, tfs
+    
+    def getMainPostings(self, t):
+        """ Renvoie les postings du terme t dans le segment principal (sans
+            le segment delta ni le filtrage des tombstones), décodés bloc par 
+            bloc si l'index inversé est compressé.
+            @param t: int, identifiant du terme
+        """
+        # Les nouveaux termes n'ont pas de postings dans le segment principal
+        if t + 1 >= len(self.post_off): return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        if self.cpostings != None: return self.cpostings.decode(t)
+        return self.post_rows[ self.post_off[t] : self.post_off[t+1] ], self.post_tfs[ self.post_off[t] : self.post_off[t+1] ]
+    
+    def getPostingsArrays(self):
+        """ Renvoie l'index inversé du segment principal au format CSR
+            (post_off, post_rows, post_tfs), décompressé si besoin.
+        """
+        if self.cpostings == None: return self.post_off, self.post_rows, self.post_tfs
+        return ( self.post_off, ) + self.cpostings.decodeAll()
+    
+    def getAllPostings(self):
+        """ Renvoie l'index inversé complet (segment principal, segment delta,
+            sans les lignes supprimées) au format CSR (off, rows, tfs), en une
+            passe vectorisée: les postings du delta sont insérés à la fin de
+            ceux de chaque terme dans le segment principal.
+        """
+        post_off, rows, tfs = self.getPostingsArrays()
+        nbTerms = len(self.terms)
+        lens = np.zeros(nbTerms, dtype=np.int64)
+        lens[ : len(post_off) - 1 ] = np.diff(post_off)
+        
+        if self.delta_post:
+            doff, drows, dtfs = self.getDeltaPostings()
+            dlens = np.diff(doff)
+            positions = np.repeat( post_off[ np.minimum( np.arange(nbTerms) + 1, len(post_off) - 1 ) ], dlens )
+            rows, tfs = np.insert(rows, positions, drows), np.insert(tfs, positions, dtfs)
+            lens += dlens
+        
+        if self.nbDeleted:
+            keep = self._alive[rows]
+            lens = np.bincount( np.repeat( np.arange(nbTerms), lens )[keep], minlength=nbTerms )
+            rows, tfs = rows[keep], tfs[keep]
+        
+        off = np.zeros(nbTerms + 1, dtype=np.int64)
+        off[1:] = np.cumsum(lens)
+        return off, rows, tfs
+    
+    def getDeltaPostings(self):
+        """ Renvoie l'index inversé du segment delta seul (lignes supprimées
+            comprises) au format CSR (off, rows, tfs) sur tous les termes:
+            le coût est proportionnel à la taille du delta.
+        """
+        dterms = sorted(self.delta_post)
+        off = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        off[ np.array(dterms, dtype=np.int64) + 1 ] = [ len(self.delta_post[t][0]) for t in dterms ]
+        off = np.cumsum(off)
+        rows = np.concatenate([ np.zeros(0, dtype=np.int32) ] + [ np.frombuffer(self.delta_post[t][0], dtype=np.int32) for t in dterms ])
+        tfs = np.concatenate([ np.zeros(0, dtype=np.int32) ] + [ np.frombuffer(self.delta_post[t][1], dtype=np.int32) for t in dterms ])
+        return off, rows, tfs
+    
+    def getWeightSegment(self, weighter):
+        """ Poids locaux du segment principal pour un weighter (cf 
+            WeightSegment), calculés une seule fois tant que le segment 
+            principal ne change pas (load) et sauvegardés avec l'index. Au
+            compactage, ils sont renumérotés et complétés par ceux du delta
+            (cf compact).
+            @param weighter: Weighter, de getTfWeights non None
+            @return : WeightSegment
+        """
+        name = type(weighter).__name__
+        self.weighters[name] = weighter
+        if name not in self.weights:
+            self.weights[name] = WeightSegment.fromPostings(weighter, *self.getPostingsArrays(), self.nbMainRows)
+        return self.weights[name]
+    
+    def getDocTerms(self, idDoc):
+        """ Renvoie l'index du document idDoc sous la forme de deux tableaux
+            parallèles (vues sans copie sur l'index).
+            @param idDoc: int, identifiant du document (balise .I)
+            @return terms: int32 array, identifiants des termes du document
+            @return tfs: int32 array, tf de chacun de ces termes
+        """
+        d = self.getDocRow(idDoc)
+        if d < 0: raise KeyError(idDoc)
+        if d >= self.nbMainRows: return self.delta_fwd[d]
+        return self.fwd_terms[ self.fwd_off[d] : self.fwd_off[d+1] ], self.fwd_tfs[ self.fwd_off[d] : self.fwd_off[d+1] ]
+    
+    def getNbDocs(self):
+        """ Nombre de documents (vivants) de l'index.
+        """
+        return self.nbDocs
+    
+    def getNbRows(self):
+        """ Nombre de lignes de l'index (taille des tableaux indexés par ligne).
+        """
+        return self.nbRows
+    
+    def getTotalLength(self):
+        """ Nombre total d'occurrences (tout stem confondu) dans la collection.
+        """
+        return self.totalLen
+    
+    def toDict(self, scores):
+        """ Transforme un tableau de valeurs indexé par ligne en dictionnaire
+            indexé par identifiant de document (documents vivants seulement).
+            @param scores: array, une valeur par ligne de l'index
+            @return : dict(int, float)
+        """
+        alive = self.alive
+        return dict( zip( self.docIds[alive].tolist(), scores[:self.nbRows][alive].tolist() ) )
+    
     
     # --------------- Calculs tf, idf, tf-idf ---------------
     
@@ -72,7 +735,8 @@ class IndexerSimple:
             @param idDoc: int, identifiant du document (balise .I)
             return tf: dict(str, int), nombre d'occurrences de chaque mot (tf)
         """
-        return self.index[idDoc]
+        terms, tfs = self.getDocTerms(idDoc)
+        return { self.terms[t] : tf for t, tf in zip(terms.tolist(), tfs.tolist()) }
     
     def getDf(self):
         """ Renvoie pour chaque mot de la collection le nombre de documents
@@ -80,37 +744,21 @@ class IndexerSimple:
             @return df: dict(str, int), pour chaque mot, nombre de documents
                         dans lequel il apparaît
         """
-        # Initialisation du dictionnaire df
-        df = dict()
-        
-        # Parcours de tous les documents
-        for idDoc in self.index:
-            for word in self.index[idDoc]:
-                if word not in df:
-                    df[word] = 1
-                else:
-                    df[word] += 1
-        return df
+        return dict( zip(self.terms, self.dfs.tolist()) )
         
     def getIdf(self):
         """ Renvoie pour chaque mot du document la valeur de son idf.
             @return idf: dict(str, float), pour chaque mot, son idf dans la collection
-        """        
-        # Calcul de df pour tous les mots de la collection
-        df = self.getDf()
-        # Calcul de idf pour tous les mots de la collection
-        idf = {word : math.log((1 + len(self.collection)) / (1 + df[word])) for word in df}
-        
-        return idf
+        """
+        return self.getStats().getIdf()
     
     def getTfIdf(self, idDoc):
         """ Calcule pour tous les mots d'un Document son tf-idf.
             @param idDoc: int, identifiant du Document dans la collection
             @return tf_idf: dict(str, float), pour chaque mot, son tf-idf
         """
-        # Calcul de tf, self.idf est déjà un attribut de la classe IndexerSimple
-        tf = self.getTf(idDoc)
-        return {word : tf[word]*self.idf[word] for word in tf}
+        terms, tfs = self.getDocTerms(idDoc)
+        return { self.terms[t] : w for t, w in zip(terms.tolist(), (tfs * self.getIdfs()[terms]).tolist()) }
     
     
     # --------------- Getteurs représentations ---------------
@@ -135,9 +783,11 @@ class IndexerSimple:
         """ Retourne la représentation (doc-tf) d’un stem à partir de l’index
             inverse.
             Il s'agit en fait simplement du calcul du TF du mot word.
+            Un stem absent de la collection a une représentation vide.
             @param word: str, stem de mot
         """
-        return self.index_inverse[word]
+        rows, tfs = self.getPostings(word)
+        return dict( zip(self._docIds[rows].tolist(), tfs.tolist()) )
     
     def getTfIDFsForStem(self, word):
         """ Retourne la représentation (doc-TFIDF) d’un stem à partir de
@@ -145,22 +795,158 @@ class IndexerSimple:
             Il s'agit en fait simplement du calcul du tf-idf du mot word.
             @param word: str, stem de mot
         """
-        return {idDoc : self.getTfIdf(idDoc)[word] for idDoc in self.index_inverse[word]}
+        rows, tfs = self.getPostings(word)
+        return dict( zip(self._docIds[rows].tolist(), (tfs * self.getIdf().get(word, 0)).tolist()) )
     
     def getStrDoc(self, idDoc):
         """ Retourne la chaîne de caractère dont est issu un Document de la
             collection.
             @param: idDoc: int, identifiant du document (balise .I) dans 
                            la collection
+            Le texte d'un document ajouté par addDocuments (même s'il remplace
+            un document supprimé) est celui gardé à l'ajout; les autres sont
+            relus dans le DocumentStore de l'index (O(1)), ou à défaut dans la
+            collection du parser. Renvoie None pour un document supprimé ou si
+            le texte n'est pas disponible.
+        """
+        if self.getDocRow(idDoc) < 0: return None
+        if idDoc in self.texts: return self.texts[idDoc][:-1]
+        if self.store != None and idDoc in self.store:
+            return self.store.getDocument(idDoc).getTexte()[:-1]
+        if self.parser != None:
+            return self.collection[ self.parser.numbers[idDoc] ].getTexte()[:-1]
+        return None
+    
+    # --------------- Sauvegarde et chargement ---------------
+    
+    def save(self, path, compress=False):
+        """ Sauvegarde l'index dans le fichier binaire path (cf IndexFile).
+            L'index est d'abord compacté s'il a été modifié (cf compact).
+            Sections écrites:
+                * terms: dictionnaire des stems (l'identifiant d'un stem est 
+                  sa position dans le dictionnaire)
+                * post_off, post_rows, post_tfs: index inversé au format CSR
+                  (si compress, post_rows et post_tfs sont remplacés par les
+                  sections cpost_* de l'index compressé par blocs, cf Compression)
+                * fwd_off, fwd_terms, fwd_tfs: index au format CSR, une ligne
+                  par document de doc_ids
+                * doc_ids, doc_len: identifiants et longueurs des documents
+                * df, idf: statistiques de chaque stem
+                * analyzer_stop_words (et métadonnée analyzer): analyseur de
+                  l'index, rechargé avec lui
+                * store_ids, store_off, store_data: documents de l'index
+                  présents dans son DocumentStore (textes relus par getStrDoc)
+                * texts_ids, texts: textes des documents ajoutés par 
+                  addDocuments
+                * graph_*: graphe des citations (cf CitationGraph)
+                * weights_<Weighter>_*: poids locaux des documents déjà
+                  calculés (cf WeightSegment), et métadonnée weights
+                * prior_<nom>: priors statiques des documents (cf setPrior),
+                  et métadonnée priors
+            @param path: str, chemin du fichier index
+            @param compress: bool, si True l'index inversé est compressé
         """
-        for index, document in self.collection.items():
-            if document.getId() == idDoc: return document.getTexte()[:-1]
+        self.compact()
+        writer = IndexWriter(path)
+        writer.addStrings('terms', self.terms)
+        writer.addArray('post_off', self.post_off)
+        if compress:
+            cpostings = self.cpostings if self.cpostings != None else CompressedPostings.encode(self.post_off, self.post_rows, self.post_tfs)
+            cpostings.save(writer)
+        else:
+            post_off, post_rows, post_tfs = self.getPostingsArrays()
+            writer.addArray('post_rows', post_rows)
+            writer.addArray('post_tfs', post_tfs)
+        writer.addArray('fwd_off', self.fwd_off)
+        writer.addArray('fwd_terms', self.fwd_terms)
+        writer.addArray('fwd_tfs', self.fwd_tfs)
+        writer.addArray('doc_ids', self.docIds)
+        writer.addArray('doc_len', self.docLen)
+        writer.addArray('df', self.dfs)
+        writer.addArray('idf', self.getIdfs())
+        self.analyzer.save(writer)
+        texts_ids = np.array(sorted(self.texts), dtype=np.int32)
+        if self.store != None: self.store.save(writer, self.docIds[ ~np.isin(self.docIds, texts_ids) ])
+        writer.addArray('texts_ids', texts_ids)
+        writer.addStrings('texts', [ self.texts[idDoc] for idDoc in texts_ids.tolist() ])
+        if self.getCitationGraph() != None: self.getCitationGraph().save(writer)
+        for name, segment in self.weights.items(): segment.save(writer, name)
+        writer.setMeta('weights', list(self.weights))
+        for name, prior in self.priors.items(): writer.addArray('prior_%s' % name, prior)
+        writer.setMeta('priors', list(self.priors))
+        writer.setMeta('nbDocs', self.nbDocs)
+        writer.setMeta('compressed', compress)
+        writer.close()
+    
+    @classmethod
+    def load(cls, path):
+        """ Recharge un index sauvegardé par save(), sans relire ni re-stemmer
+            la collection: le fichier est projeté en mémoire en lecture seule
+            et les tableaux CSR de l'index sont des vues sur ce fichier.
+            L'index rechargé n'a ni parser ni collection (les textes restent
+            accessibles par getStrDoc si l'index a été sauvegardé avec son
+            DocumentStore).
+            @param path: str, chemin du fichier index
+            @return : IndexerSimple
+        """
+        reader = IndexReader(path)
+        if reader.version < 2:
+            raise IndexFormatError('%s: index de version %d, à reconstruire' % (path, reader.version))
+        
+        indexer = cls.__new__(cls)
+        indexer._init(None, tr.Analyzer.load(reader))
+        if reader.has('store_off'): indexer.store = DocumentStore.load(reader)
+        if reader.has('texts_ids'): indexer.texts = dict( zip( reader.getArray('texts_ids').tolist(), reader.getStrings('texts') ) )
+        if reader.has('graph_out_off'): indexer.graph = CitationGraph.load(reader)
+        
+        post_off = reader.getArray('post_off')
+        if reader.getMeta('compressed', False):
+            post_rows, post_tfs = None, None
+            cpostings = CompressedPostings.load(reader, np.diff(post_off))
+        else:
+            post_rows, post_tfs = reader.getArray('post_rows'), reader.getArray('post_tfs')
+            cpostings = None
+        
+        indexer.setArrays( reader.getStrings('terms'), reader.getArray('doc_ids'), reader.getArray('fwd_off'), reader.getArray('fwd_terms'), reader.getArray('fwd_tfs'),
+                           post_off, post_rows, post_tfs, reader.getArray('doc_len'), reader.getArray('df'), reader.getArray('idf'), cpostings )
+        for name in reader.getMeta('weights', []):
+            if reader.has('weights_%s_squares' % name): indexer.weights[name] = WeightSegment.load(reader, name, indexer.getNbRows())
+        for name in reader.getMeta('priors', []):
+            indexer.priors[name] = reader.getArray('prior_%s' % name)
+        
+        return indexer
     
     # ----------------- Getteurs attributs ------------------
     
     def getParser(self):
         return self.parser
     
+    def getAnalyzer(self):
+        return self.analyzer
+    
+    def setPrior(self, name, prior):
+        """ Enregistre un prior statique (indépendant de la requête) des
+            documents, sauvegardé avec l'index (cf PageRank.computePriors).
+            @param name: str, nom du prior (par exemple 'pagerank')
+            @param prior: float array, valeur du prior de chaque document,
+                          indexée par identifiant (.I)
+        """
+        self.priors[name] = np.asarray(prior, dtype=float)
+    
+    def getPrior(self, name):
+        """ @return : float array, prior name indexé par identifiant (.I), 
+                      None si l'index n'en a pas
+        """
+        return self.priors.get(name)
+    
+    def getCitationGraph(self):
+        """ Graphe des citations de la collection: celui du parser s'il y en a
+            un, sinon celui relevé à l'indexation (fromDocuments) ou rechargé
+            avec l'index (load). None si l'index n'a pas de graphe.
+        """
+        if self.parser != None: return self.parser.getCitationGraph()
+        return self.graph
+    
     def getCollection(self):
         return self.collection
     
@@ -168,4 +954,210 @@ class IndexerSimple:
         return self.index
     
     def getIndexInverse(self):
-        return self.index_inverse
\ No newline at end of file
+        return self.index_inverse
+
+
+############################ CLASSE INDEXERSPIMI ############################
+
+class IndexerSPIMI:
+    """ Construction d'un index sur disque en mémoire bornée (Single-Pass 
+        In-Memory Indexing), pour les collections plus grandes que la RAM.
+        Les documents sont lus en flux: les postings sont accumulés en mémoire
+        jusqu'au budget memory, puis écrits triés par terme dans un fichier 
+        temporaire (run). Les runs sont enfin fusionnés (fusion k-voies) dans 
+        le fichier index, au format de IndexerSimple.save.
+        Seuls le dictionnaire des termes, trois entiers et les liens (.X) de 
+        chaque document restent en mémoire pendant toute la construction (la
+        fusion ne lit et n'écrit que des morceaux de CHUNK postings, quelle
+        que soit la taille de la liste d'un terme); l'index produit (tf, df, idf,
+        longueurs) est identique à celui de IndexerSimple.
+        Attributs:
+            * self.memory: int, budget mémoire (octets) des postings accumulés
+            * self.tmpdir: str, répertoire des fichiers temporaires
+            * self.analyzer: Analyzer, analyseur des textes, sauvegardé avec l'index
+            * self.nbRuns: int, nombre de runs écrits lors de la dernière construction
+    """
+    # Coût estimé d'un posting accumulé (deux entiers 32 bits) et d'un terme du bloc
+    POSTING_BYTES = 8
+    TERM_BYTES = 160
+    # Nombre de postings lus ou copiés à la fois pendant la fusion
+    CHUNK = 1 << 16
+    
+    RUN_DTYPE = np.dtype([('term', '<i4'), ('row', '<i4'), ('tf', '<i4')])
+    
+    def __init__(self, memory=64 * 2**20, tmpdir=None, analyzer=None):
+        """ Constructeur de la classe IndexerSPIMI.
+            @param memory: int, budget mémoire en octets
+            @param tmpdir: str, répertoire des fichiers temporaires (par défaut
+                           celui du système)
+            @param analyzer: Analyzer, analyseur des textes (par défaut Analyzer())
+        """
+        self.memory = memory
+        self.tmpdir = tmpdir
+        self.analyzer = analyzer if analyzer != None else tr.Analyzer()
+        self.nbRuns = 0
+    
+    def build(self, documents, path):
+        """ Construit l'index des documents dans le fichier path.
+            @param documents: iterable(Document), documents de la collection,
+                              lus une seule fois dans l'ordre
+            @param path: str, chemin du fichier index
+            @return : IndexerSimple, index rechargé depuis path
+        """
+        workdir = tempfile.mkdtemp(prefix='spimi-', dir=self.tmpdir)
+        try:
+            self._build(documents, path, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return IndexerSimple.load(path)
+    
+    def _build(self, documents, path, workdir):
+        ps = self.analyzer
+        terms = []
+        termIds = dict()
+        docIds = array('i')
+        fwd_len = array('q')
+        docLen = array('q')
+        
+        # Index (une ligne par document) écrit en flux
+        fwd_terms_file = open(os.path.join(workdir, 'fwd_terms'), 'wb')
+        fwd_tfs_file = open(os.path.join(workdir, 'fwd_tfs'), 'wb')
+        
+        runs = []
+        block = dict()
+        blockSize = 0
+        links = []
+        
+        for document in documents:
+            tfs = ps.getTextRepresentation( document.getTexte() )
+            idDoc = document.getId()
+            links.append( document.getLiens() )
+            
+            row_terms = array('i')
+            for word, tf in tfs.items():
+                t = termIds.get(word)
+                if t == None:
+                    t = termIds[word] = len(terms)
+                    terms.append(word)
+                row_terms.append(t)
+                
+                # Accumulation des postings du bloc courant
+                if t not in block:
+                    block[t] = ( array('i'), array('i') )
+                    blockSize += self.TERM_BYTES
+                block[t][0].append(len(docIds))
+                block[t][1].append(tf)
+                blockSize += self.POSTING_BYTES
+            
+            row_tfs = array('i', tfs.values())
+            row_terms.tofile(fwd_terms_file)
+            row_tfs.tofile(fwd_tfs_file)
+            docIds.append(idDoc)
+            fwd_len.append(len(tfs))
+            docLen.append(sum(row_tfs))
+            
+            if blockSize >= self.memory:
+                runs.append( self._flush(block, os.path.join(workdir, 'run%d' % len(runs))) )
+                block = dict()
+                blockSize = 0
+        
+        if block: runs.append( self._flush(block, os.path.join(workdir, 'run%d' % len(runs))) )
+        fwd_terms_file.close()
+        fwd_tfs_file.close()
+        self.nbRuns = len(runs)
+        
+        # Ecriture de l'index: fusion des runs pour l'index inversé
+        writer = IndexWriter(path)
+        writer.addStrings('terms', terms)
+        
+        # Les morceaux fusionnés sont écrits par paquets d'au moins CHUNK postings
+        post_off = np.zeros(len(terms) + 1, dtype=np.int64)
+        tfs_path = os.path.join(workdir, 'post_tfs')
+        with open(tfs_path, 'wb') as tfs_file:
+            writer.beginArray('post_rows', np.int32)
+            rows, tfs, size = [], [], 0
+            for t, part_rows, part_tfs in self._merge(runs):
+                post_off[t + 1] += len(part_rows)
+                rows.append(part_rows)
+                tfs.append(part_tfs)
+                size += len(part_rows)
+                if size >= self.CHUNK:
+                    writer.appendArray(np.concatenate(rows))
+                    np.concatenate(tfs).tofile(tfs_file)
+                    rows, tfs, size = [], [], 0
+            if rows:
+                writer.appendArray(np.concatenate(rows))
+                np.concatenate(tfs).tofile(tfs_file)
+            writer.endArray()
+        np.cumsum(post_off, out=post_off)
+        self._copy(writer, 'post_tfs', tfs_path)
+        writer.addArray('post_off', post_off)
+        
+        fwd_off = np.zeros(len(docIds) + 1, dtype=np.int64)
+        fwd_off[1:] = np.cumsum(fwd_len)
+        writer.addArray('fwd_off', fwd_off)
+        self._copy(writer, 'fwd_terms', os.path.join(workdir, 'fwd_terms'))
+        self._copy(writer, 'fwd_tfs', os.path.join(workdir, 'fwd_tfs'))
+        
+        dfs = np.diff(post_off).astype(np.int32)
+        writer.addArray('doc_ids', np.frombuffer(docIds, dtype=np.int32))
+        writer.addArray('doc_len', np.frombuffer(docLen, dtype=np.int64))
+        writer.addArray('df', dfs)
+        writer.addArray('idf', np.log( (1 + len(docIds)) / (1 + dfs) ))
+        self.analyzer.save(writer)
+        CitationGraph.fromLinks(docIds.tolist(), links).save(writer)
+        writer.setMeta('nbDocs', len(docIds))
+        writer.close()
+    
+    def _flush(self, block, path):
+        """ Ecrit les postings du bloc, triés par terme, dans le run path.
+            @return path: str, chemin du run
+        """
+        with open(path, 'wb') as f:
+            for t in sorted(block):
+                rows, tfs = block[t]
+                run = np.empty(len(rows), dtype=self.RUN_DTYPE)
+                run['term'] = t
+                run['row'] = rows
+                run['tf'] = tfs
+                run.tofile(f)
+        return path
+    
+    def _readRun(self, path, irun):
+        """ Parcourt un run terme par terme, en le lisant par morceaux.
+            @return : generator((int, int, int array, int array)), terme, numéro
+                      du run, lignes et tf des postings du terme dans le run
+        """
+        run = np.memmap(path, dtype=self.RUN_DTYPE, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=self.RUN_DTYPE)
+        for start in range(0, len(run), self.CHUNK):
+            chunk = np.array(run[start : start + self.CHUNK])
+            # Découpage du morceau par terme
+            cuts = np.flatnonzero(np.diff(chunk['term'])) + 1
+            bounds = [0] + cuts.tolist() + [len(chunk)]
+            for i in range(len(bounds) - 1):
+                part = chunk[bounds[i] : bounds[i+1]]
+                yield int(part['term'][0]), irun, part['row'], part['tf']
+    
+    def _merge(self, runs):
+        """ Fusion k-voies des runs, en flux: les postings ne sont jamais
+            regroupés en mémoire, même pour un terme très fréquent. Les runs
+            étant écrits dans l'ordre de la collection, les morceaux d'un même
+            terme sont renvoyés par ordre de run, puis dans l'ordre du run (un
+            terme coupé entre deux morceaux d'un run reste dans l'ordre).
+            @return : generator((int, int array, int array)), morceaux d'au 
+                      plus CHUNK postings, par terme croissant: terme, lignes
+                      et tf des postings du morceau
+        """
+        for t, irun, part_rows, part_tfs in heapq.merge( *[ self._readRun(path, i) for i, path in enumerate(runs) ], key=lambda item: (item[0], item[1]) ):
+            yield t, part_rows, part_tfs
+    
+    def _copy(self, writer, name, path):
+        """ Copie par morceaux le fichier temporaire path (int32) dans la section name.
+        """
+        writer.beginArray(name, np.int32)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = np.fromfile(f, dtype=np.int32, count=self.CHUNK)
+                if len(chunk) == 0: break
+                writer.appendArray(chunk)
+        writer.endArray()
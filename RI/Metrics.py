@@ -27,8 +27,8 @@ class EvalMesure(ABC):
     def evalQuery(self, ranking, query):
         """ Calcule la mesure pour la liste des documents retournés par un 
             modèle et un objet Query.
-            @param ranking: list(int), liste des ids des documents pertinents,
-                            classés par IRModel
+            @param ranking: list(int) ou RankedResult, liste des ids des 
+                            documents pertinents, classés par IRModel
             @param query: Query, requête
         """
         pass
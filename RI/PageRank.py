@@ -7,10 +7,143 @@ Created on Wed Jan 27 09:29:53 2021
 
 ##################### IMPORTATION DES LIBRAIRIES UTILES ######################
 
-from collections import Counter
 import numpy as np
 import random as rd
+from collections import deque
 from IRModel import *
+from Sparse import SparseMatrix
+
+
+def powerIteration(matT, dangling, a, d, eps, maxIter):
+    """ Itération de la puissance du PageRank, un produit matrice-vecteur 
+        creux par itération: s = d * (P^T s + masse des noeuds dangling * a)
+        + (1 - d) * a (la masse des noeuds sans lien sortant est redistribuée
+        selon la distribution a priori).
+        @param matT: SparseMatrix, transposée de la matrice de transitions P
+        @param dangling: bool array, noeuds sans lien sortant
+        @param a: float array, distribution a priori (de somme 1)
+        @param d: float, damping factor (facteur d'amortissement)
+        @param eps: float, écart maximum (norme L1) entre s au temps t et t + 1
+        @param maxIter: int, nombre maximal d'itérations
+        @return scores: float array, score de chaque noeud (de somme 1)
+        @return iter: int, nombre d'itérations effectuées
+    """
+    scores, iters = powerIterationBatch(matT, dangling, np.reshape(a, (-1, 1)), d, eps, maxIter)
+    return scores[:, 0], int(iters[0])
+
+def powerIterationBatch(matT, dangling, A, d, eps, maxIter):
+    """ Itération de la puissance pour plusieurs distributions a priori à la
+        fois (une par colonne de A, par exemple une par requête): un produit
+        matrice creuse x matrice dense par itération. La convergence est
+        suivie colonne par colonne: une colonne convergée n'est plus calculée.
+        @param A: float array, nbNodes x m, distributions a priori (colonnes
+                  de somme 1)
+        @return scores: float array, nbNodes x m, scores de chaque colonne
+        @return iters: int array, nombre d'itérations de chaque colonne
+        (cf powerIteration pour les autres paramètres)
+    """
+    scores = np.zeros( A.shape , dtype=float )
+    iters = np.zeros( A.shape[1], dtype=np.int64 )
+    
+    # Colonnes non convergées, et leurs scores et distributions a priori
+    active = np.arange( A.shape[1] )
+    scores_t1 = np.ones( A.shape , dtype=float ) / len(A)
+    a = A
+    
+    # Compteur itérations
+    iter = 0
+    
+    while ( len(active) and iter < maxIter ) :
+        scores_t0 = scores_t1
+        scores_t1 = d * ( matT.dotVector(scores_t0) + np.sum(scores_t0[dangling], axis=0) * a ) + ( 1 - d ) * a
+        
+        #Normalisation
+        scores_t1 /= np.sum(scores_t1, axis=0)
+        iter += 1
+        
+        # Critère de convergence, par colonne: les colonnes convergées sont
+        # rangées dans scores et retirées du calcul
+        done = np.sum( np.abs( scores_t1 - scores_t0 ), axis=0 ) <= eps
+        if iter == maxIter: done[:] = True
+        if done.any():
+            scores[:, active[done]] = scores_t1[:, done]
+            iters[ active[done] ] = iter
+            active, scores_t1, a = active[~done], scores_t1[:, ~done], a[:, ~done]
+    
+    return scores, iters
+
+def computePriors(ref_index, d = 0.85, eps = 1e-10, maxIter = 1000):
+    """ Calcul hors ligne des priors statiques (indépendants de la requête) 
+        sur tout le graphe des citations de l'index, enregistrés dans l'index
+        (sauvegardés avec lui, cf IndexerSimple.setPrior) et utilisables par 
+        tous les modèles (cf IRModel.setPrior):
+            * 'pagerank': PageRank global, la téléportation se fait vers les
+              documents de l'index
+            * 'indegree': nombre de citations reçues + 1, normalisé
+        Les priors sont indexés par identifiant de document (.I).
+        @param ref_index: IndexerSimple, index ayant un graphe des citations
+        @return : dict(str, float array), priors calculés
+    """
+    graph = ref_index.getCitationGraph()
+    if graph == None: raise ValueError("l'index n'a pas de graphe des citations")
+    nbNodes = max( graph.getNbNodes(), int( np.max(ref_index.docIds, initial=-1) ) + 1 )
+    
+    # Téléportation uniforme vers les documents (vivants) de l'index
+    a = np.zeros(nbNodes)
+    a[ ref_index.docIds[ ref_index.alive ] ] = 1
+    a /= max( np.sum(a), 1 )
+    
+    P = graph.getTransitions(nbNodes)
+    pagerank, iter = powerIteration(P.transpose(), P.getRowSums() == 0, a, d, eps, maxIter)
+    
+    indegree = np.zeros(nbNodes)
+    indegree[ : graph.getNbNodes() ] = np.diff(graph.in_off)
+    indegree += 1
+    
+    priors = { 'pagerank' : pagerank, 'indegree' : indegree / np.sum(indegree) }
+    for name, prior in priors.items(): ref_index.setPrior(name, prior)
+    return priors
+
+def personalizedPush(graph, teleport, d = 0.85, eps = 1e-6):
+    """ PageRank personnalisé approché par poussée locale (forward push): 
+        chaque noeud garde un résidu de masse non encore propagée; tant 
+        qu'un noeud u a un résidu r(u) > eps * degré sortant de u, il en 
+        garde (1 - d) r(u) dans son score et pousse d r(u) vers les documents
+        qu'il cite (vers la distribution teleport s'il ne cite personne).
+        Seul le voisinage atteint depuis teleport est parcouru: le travail
+        ne dépend pas de la taille du graphe.
+        @param graph: CitationGraph, graphe des citations
+        @param teleport: dict(int, float), distribution de téléportation (de
+                         somme 1) sur les identifiants des documents
+        @param d: float, damping factor (facteur d'amortissement)
+        @param eps: float, résidu maximal par lien sortant d'un noeud
+        @return scores: dict(int, float), score des noeuds atteints
+    """
+    def degree(u):
+        return int( graph.out_off[u+1] - graph.out_off[u] ) if u < graph.getNbNodes() else 0
+    
+    scores = dict()
+    residuals = dict(teleport)
+    queue = deque( u for u, r in residuals.items() if r > eps * max(degree(u), 1) )
+    
+    while queue:
+        u = queue.popleft()
+        r = residuals[u]
+        residuals[u] = 0.
+        scores[u] = scores.get(u, 0.) + ( 1 - d ) * r
+        
+        # Masse poussée vers les documents cités (répétitions comprises)
+        links = graph.getLinksFrom(u).tolist()
+        if links: targets = [ (v, d * r / len(links)) for v in links ]
+        else: targets = [ (v, d * r * w) for v, w in teleport.items() ]
+        
+        for v, mass in targets:
+            before = residuals.get(v, 0.)
+            residuals[v] = before + mass
+            threshold = eps * max(degree(v), 1)
+            if before <= threshold < residuals[v]: queue.append(v)
+    
+    return scores
 
 
 ############################# CLASSE PAGERANK ################################
@@ -20,7 +153,7 @@ class PageRank:
         comme définis par l'algorithme PageRank.
         Attributs:
             * self.ref_index: IndexerSimple, référence de l'indexer
-            * self.parser: Parser, référence du parser
+            * self.citations: CitationGraph, graphe des citations de la collection
             * self.model: IRModel, modèle à utiliser pour un premier ranking
                           sur nos documents
             * self.query: str, requête à traiter
@@ -28,12 +161,16 @@ class PageRank:
                       de documents à prendre dans le ranking rendu par le modèle
             * self.k: int, nombre de Documents à choisir aléatoirement parmi
                       tous ceux pointant vers chaque Document
+            * self.inodes: list(int), noeuds du graphe (identifiants triés)
+            * self.nodeIndex: dict(int, int), indice de chaque noeud dans inodes
+            * self.mat: SparseMatrix, matrice de transitions P (CSR)
+            * self.dangling: bool array, noeuds sans lien sortant
     """
     def __init__(self, ref_index, model, query, n, k):
         """ Constructeur de la classe PageRank.
         """
         self.ref_index = ref_index
-        self.parser = ref_index.getParser()
+        self.citations = ref_index.getCitationGraph()
         self.model = model
         self.query = query
         self.n = n
@@ -51,16 +188,16 @@ class PageRank:
         """
         # Initialisation du dictionnaire et de seeds
         graph = dict()
-        seeds = list( self.model.getRanking( self.query ) )[ : self.n]
+        seeds = self.model.getRanking( self.query, self.n )
         
         for idDoc in seeds:
             
             # Traitement pour les documents cités par le document courant
             if idDoc not in graph.keys(): graph[idDoc] = []
-            graph[idDoc] += self.parser.getHyperlinksFrom(idDoc)
+            graph[idDoc] += self.citations.getLinksFrom(idDoc).tolist()
 
             # On choisit k documents qui citent le Document courant (répétitions posssibles)
-            linksTo = list( Counter( self.parser.getHyperlinksTo(idDoc) ).elements() )
+            linksTo = self.citations.getLinksTo(idDoc).tolist()
             to_keep = rd.sample( linksTo , k = min( self.k, len(linksTo) ) )
             
             # Pour chacun d'entre eux, on rajoute le lien allant d'eux vers idDoc
@@ -71,57 +208,48 @@ class PageRank:
         return graph
     
     def buildMat(self):
-        """ Construction de la matrice de transitions P à partir de self.graph.
+        """ Construction de la matrice de transitions P (creuse, format CSR) à
+            partir de self.graph: P[i, j] = nombre de liens de i vers j divisé
+            par le nombre de liens sortants de i. Les lignes des noeuds sans
+            lien sortant (dangling) restent vides.
         """
         # Liste des noeuds sources et des noeuds destinations
-        ifrom = set( [ k for k in self.graph.keys() ] )
+        ifrom = set( self.graph.keys() )
         ito = set( [ v for all_values in self.graph.values() for v in all_values ] )
         
-        self.inodes = sorted( list( ifrom.union(ito) ) )
+        self.inodes = sorted( ifrom.union(ito) )
+        self.nodeIndex = { node : i for i, node in enumerate(self.inodes) }
+        nbNodes = len(self.inodes)
         
-        # Initialisation de la matrice
-        P = np.zeros((len(self.inodes),len(self.inodes)))
+        # Liens du graphe (avec répétitions): indices dans inodes des sources et destinations
+        sources = np.repeat( [ self.nodeIndex[node] for node in self.graph.keys() ], [ len(v) for v in self.graph.values() ] ).astype(np.int64)
+        targets = np.array([ self.nodeIndex[v] for all_values in self.graph.values() for v in all_values ], dtype=np.int64)
         
-        # Remplissage de la matrice
-        for idDoc in self.graph.keys():
-            # On retrouve l'indice de idDoc dans inodes
-            i = self.inodes.index(idDoc)
-            
-            P[i] = np.array([ self.graph[self.inodes[i]].count(node) for node in self.inodes ])
-            P[i] /= np.sum(P[i])
+        # Chaque lien de i vaut 1 / degré sortant de i, les liens répétés sont sommés
+        degrees = np.bincount(sources, minlength=nbNodes)
+        self.dangling = degrees == 0
         
-        return P
+        return SparseMatrix.fromCoords(sources, targets, 1 / degrees[sources], nbNodes, nbNodes)
     
     def getScores(self, d = 0.8, eps = 1e-5, a = None, maxIter = 1000):
         """ Calcul des scores.
             @param d: float, damping factor (facteur d'amortissement)
-            @param eps: float, écart maximum entre s au temps t et t + 1
+            @param eps: float, écart maximum (norme L1, indépendante de la
+                        taille du graphe) entre s au temps t et t + 1
             @param maxIter: int, nombre maximal d'itérations
             @param a: list(float), liste des probas a priori pour chaque noeud
             @return scores: (float) array, array des scores de chaque page
         """
-        # Par défaut: la distribution initiale (a priori) est uniforme
-        if a == None:
-            a = np.array( [ 1 / len(self.mat) for i in range(len(self.mat)) ] )
-            
-        # Initialisation des scores
-        scores_t0 = np.ones( len( self.mat ) , dtype=float )
-        scores_t1 = np.ones( len( self.mat ) , dtype=float )  / len(scores_t0)
-        diff_mean = 1
+        nbNodes = self.mat.getNbRows()
+        if nbNodes == 0: return dict()
         
-        # Compteur itérations
-        iter = 0
+        # Par défaut: la distribution initiale (a priori) est uniforme
+        if a is None:
+            a = np.ones(nbNodes) / nbNodes
+        a = np.asarray(a, dtype=float) / np.sum(a)
         
-        while ( diff_mean > eps and iter < maxIter ) :
-            scores_t0 = np.copy( scores_t1 )
-            scores_t1 = d * np.array([ np.sum( self.mat[ :, j ] * scores_t0 ) for j in range(len(self.mat)) ]) + ( 1 - d ) * a
-            
-            #Normalisation
-            scores_t1 /= np.sum(scores_t1)
-            
-            # Critère de convergence
-            diff_mean = np.mean( np.abs( scores_t1 - scores_t0 ) )
-            iter += 1
+        # Marche aléatoire vers chaque noeud (P transposée)
+        scores_t1, iter = powerIteration(self.mat.transpose(), self.dangling, a, d, eps, maxIter)
         
         print('Convergence en', iter, ' itérations')
         
@@ -140,6 +268,174 @@ class PageRank:
         return self.inodes
 
 
+###################### CLASSE PERSONALIZEDPAGERANK ##########################
+
+class PersonalizedPageRank:
+    """ Reclassement des résultats d'un modèle par PageRank personnalisé sur
+        tout le graphe des citations: la téléportation se fait vers les n 
+        premiers documents du classement du modèle, proportionnellement à 
+        leur score, et les scores sont approchés par poussée locale (cf
+        personalizedPush). Le classement de chaque requête est gardé en cache
+        tant que l'index, les paramètres (du modèle comme de PageRank) et le
+        prior du modèle ne changent pas.
+        Attributs:
+            * self.ref_index: IndexerSimple, référence de l'indexer
+            * self.citations: CitationGraph, graphe des citations de la collection
+            * self.model: IRModel, modèle donnant les documents seeds
+            * self.n: int, nombre de Documents seeds
+            * self.d: float, damping factor
+            * self.eps: float, tolérance de la poussée locale
+            * self.cache: dict(str, RankedResult), classement de chaque requête
+                          par poussée locale (cf getRanking)
+            * self.batchCache: dict((float, int), dict(str, RankedResult)),
+                               classement de chaque requête par itération de
+                               la puissance, pour chaque tolérance eps et
+                               maxIter (cf getScoresBatch)
+            * self.key: tuple, version de l'index et paramètres des 
+                        classements en cache (cf checkVersion)
+            * self.prior: float array, prior du modèle des classements en cache
+            * self.version: int, version de l'index du graphe des citations
+                            et de la matrice de transitions
+    """
+    def __init__(self, ref_index, model, n = 30, d = 0.85, eps = 1e-6):
+        """ Constructeur de la classe PersonalizedPageRank.
+        """
+        self.ref_index = ref_index
+        self.citations = ref_index.getCitationGraph()
+        self.model = model
+        self.n = n
+        self.d = d
+        self.eps = eps
+        self.cache = dict()
+        self.batchCache = dict()
+        self.key = self.getKey()
+        self.prior = model.prior
+        self.version = ref_index.version
+        self.transitions = None
+    
+    def getKey(self):
+        """ Version de l'index et paramètres dont dépendent les classements.
+        """
+        return ( self.ref_index.version, self.model.getParams(), self.n, self.d, self.eps )
+    
+    def checkVersion(self):
+        """ Abandonne les classements en cache si l'index, les paramètres
+            (cf IRModel.getParams, setMu) ou le prior du modèle (setPrior) ont
+            changé, et relit le graphe des citations (dont la matrice de
+            transitions est recalculée) si l'index a changé.
+        """
+        key = self.getKey()
+        if key != self.key or self.model.prior is not self.prior:
+            self.cache = dict()
+            self.batchCache = dict()
+            self.key = key
+            self.prior = self.model.prior
+        if self.ref_index.version != self.version:
+            self.citations = self.ref_index.getCitationGraph()
+            self.transitions = None
+            self.version = self.ref_index.version
+    
+    def getTransitions(self):
+        """ Transposée de la matrice de transitions du graphe entier et noeuds
+            sans lien sortant, pour le calcul en batch (cf getScoresBatch).
+        """
+        if self.transitions == None:
+            nbNodes = max( self.citations.getNbNodes(), int( np.max(self.ref_index.docIds, initial=-1) ) + 1 )
+            P = self.citations.getTransitions(nbNodes)
+            self.transitions = ( P.transpose(), P.getRowSums() == 0 )
+        return self.transitions
+    
+    def getTeleport(self, query, seeds = None):
+        """ Distribution de téléportation: scores des n premiers documents du
+            modèle, normalisés (ramenés en probabilités pour les scores en
+            log, cf ModeleLangue).
+            @param seeds: RankedResult, n premiers documents s'ils sont déjà
+                          calculés
+            @return : dict(int, float), de somme 1
+        """
+        if seeds == None: seeds = self.model.getRanking( query, self.n )
+        if len(seeds) == 0: return dict()
+        
+        weights = seeds.scores
+        if self.model.nullScore == -np.inf: weights = np.exp( weights - weights.max() )
+        weights = np.maximum(weights, 0)
+        if weights.sum() <= 0: weights = np.ones( len(seeds) )
+        return dict( zip( seeds.keys(), ( weights / weights.sum() ).tolist() ) )
+    
+    def getRanking(self, query, k = None):
+        """ @param query: str, requête
+            @param k: int, nombre de documents à classer (tous si None)
+            @return : RankedResult, documents (vivants) de l'index atteints 
+                      depuis les seeds, par PageRank personnalisé décroissant
+        """
+        self.checkVersion()
+        
+        if query not in self.cache:
+            scores = personalizedPush( self.citations, self.getTeleport(query), self.d, self.eps )
+            self.cache[query] = self.rankNodes( np.array( list(scores.keys()), dtype=np.int64 ), np.array( list(scores.values()), dtype=float ) )
+        
+        ranking = self.cache[query]
+        return ranking if k == None else ranking[:k]
+    
+    def getScoresBatch(self, queries, k = None, eps = 1e-10, maxIter = 1000):
+        """ Classement de plusieurs requêtes à la fois (cf EvalIRModel): les
+            distributions de téléportation de toutes les requêtes sont les
+            colonnes d'une matrice, résolue par une seule itération de la 
+            puissance sur le graphe entier (cf powerIterationBatch). Les 
+            requêtes déjà calculées avec les mêmes eps et maxIter ne sont pas
+            recalculées; ce cache est séparé de celui de getRanking (poussée
+            locale), les deux méthodes donnant des scores approchés différents.
+            @param queries: list(str), requêtes
+            @param k: int, nombre de documents à classer par requête (tous si None)
+            @param eps: float, écart maximum (norme L1) entre deux itérations
+                        pour chaque requête
+            @param maxIter: int, nombre maximal d'itérations
+            @return : list(RankedResult), classement de chaque requête
+        """
+        self.checkVersion()
+        queries = list(queries)
+        cache = self.batchCache.setdefault( (eps, maxIter), dict() )
+        todo = [ query for query in dict.fromkeys(queries) if query not in cache ]
+        
+        if todo:
+            # Seeds de toutes les requêtes en un seul batch du modèle
+            teleports = [ self.getTeleport(query, seeds) for query, seeds in zip( todo, self.model.getScoresBatch(todo, self.n) ) ]
+            for query, teleport in zip(todo, teleports):
+                if not teleport: cache[query] = RankedResult( np.zeros(0, dtype=np.int64), np.zeros(0) )
+            todo = [ (query, teleport) for query, teleport in zip(todo, teleports) if teleport ]
+        
+        if todo:
+            matT, dangling = self.getTransitions()
+            A = np.zeros( (matT.getNbRows(), len(todo)) )
+            for j, (query, teleport) in enumerate(todo):
+                A[ list(teleport.keys()), j ] = list(teleport.values())
+            
+            scores, iters = powerIterationBatch(matT, dangling, A, self.d, eps, maxIter)
+            ids = np.arange( matT.getNbRows() )
+            for j, (query, teleport) in enumerate(todo):
+                reached = scores[:, j] > 0
+                cache[query] = self.rankNodes( ids[reached], scores[reached, j] )
+        
+        return [ cache[query] if k == None else cache[query][:k] for query in queries ]
+    
+    def rankNodes(self, ids, values):
+        """ Classement des noeuds ids par score décroissant (à score égal, par
+            identifiant croissant), restreint aux documents (vivants) de l'index.
+            @return : RankedResult
+        """
+        rows = np.full( len(ids), -1, dtype=np.int64 )
+        inside = ids < len(self.ref_index.rows)
+        rows[inside] = self.ref_index.rows[ ids[inside] ]
+        keep = rows >= 0
+        keep[keep] = self.ref_index.alive[ rows[keep] ]
+        ids, values = ids[keep], values[keep]
+        
+        order = np.argsort(ids, kind='stable')
+        ids, values = ids[order], values[order]
+        order = topK(values)
+        return RankedResult( ids[order], values[order] )
+
+
 
 ##############################################################################
 
@@ -161,4 +457,17 @@ class PageRank:
 # pr.getMat()
 
 # ------- Pour avoir les scores de chaque noeud du graphe (trié)
-# pr.getScores()
\ No newline at end of file
+# pr.getScores()
+
+# ------- PageRank global (hors ligne), sauvegardé avec l'index
+# computePriors(i)
+# i.save('data/cacm/cacm.idx')
+
+# ------- Utilisation comme prior d'un modèle
+# model = Okapi(i)
+# model.setPrior('pagerank', weight = 2.)
+# model.getRanking(query, 10)
+
+# ------- PageRank personnalisé (poussée locale) à partir des 30 premiers documents
+# ppr = PersonalizedPageRank(i, model, n = 30)
+# ppr.getRanking(query, 10)
\ No newline at end of file
@@ -7,8 +7,20 @@ Created on Wed Jan 27 09:29:53 2021
 
 ################# IMPORTATION REGEX: EXPRESSIONS REGULIERES #################
 
+import io
+import os
 import re
+import mmap
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from CitationGraph import CitationGraph
+
+# Lettres possibles d'une balise (.I, .T, ...)
+BALISES = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+# Mois des dates de publication (balise .B, ex: 'CACM December, 1958')
+MOIS = { mois : i + 1 for i, mois in enumerate(['january', 'february', 'march', 'april', 'may', 'june', 'july',
+                                                  'august', 'september', 'october', 'november', 'december']) }
 
 ############################## CLASSE DOCUMENT ##############################
 
@@ -28,18 +40,24 @@ class Document:
             * .K: mots-clés du document
             * .W: texte du document
             * .X: liens du document du document
+        
+        Les attributs sont déclarés dans __slots__ (pas de __dict__ par 
+        Document): l'empreinte mémoire de chaque Document est réduite.
     """
+    __slots__ = ('id', 'titre', 'date', 'auteurs', 'mc', 'texte', 'liens')
+    
     def __init__(self, data):
         """ Construteur de la classe Document.
             @param data: dict(str, object), dictionnaire des métadonnées du document
+                         (data['A'] peut aussi être la liste des auteurs, un par ligne)
         """
         self.id = int(data['I'])
         if 'T' in data.keys(): self.titre = data['T'][:-1]
         else: self.titre = ''
         if 'B' in data.keys(): self.date = data['B'][:-1]
         else: self.date = ''
-        if 'A' in data.keys(): self.auteur = data['A'][:-1]
-        else: self.auteur = ''
+        if 'A' in data.keys(): self.auteurs = tuple(data['A']) if isinstance(data['A'], list) else tuple(filter(None, [ data['A'][:-1] ]))
+        else: self.auteurs = ()
         if 'K' in data.keys(): self.mc = data['K'][:-1]
         else: self.mc = ''
         if 'W' in data.keys(): self.texte = data['W'][:-1]
@@ -60,7 +78,10 @@ class Document:
         return self.date
     
     def getAuteur(self):
-        return self.auteur
+        return ' '.join(self.auteurs)
+    
+    def getAuteurs(self):
+        return self.auteurs
     
     def getMC(self):
         return self.mc
@@ -72,6 +93,287 @@ class Document:
         return self.liens
 
 
+######################### PARSING PAR MORCEAUX ##############################
+
+def findChunks(filename, nbChunks):
+    """ Découpe le fichier filename en nbChunks morceaux de tailles proches,
+        alignés sur les débuts de documents (lignes '.I'). Seules les positions
+        de découpe sont cherchées dans le fichier, sans le lire en entier.
+        @param filename: str, nom du fichier .txt
+        @param nbChunks: int, nombre de morceaux souhaité
+        @return : list((int, int)), position (en octets) du début et de la fin
+                  de chaque morceau
+    """
+    size = os.path.getsize(filename)
+    if size == 0: return []
+    
+    bounds = [0]
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for k in range(1, nbChunks):
+            # Premier document commençant après la position cible
+            pos = mm.find(b'\n.I', max(size * k // nbChunks, bounds[-1], 1) - 1)
+            if pos < 0: break
+            if pos + 1 > bounds[-1]: bounds.append(pos + 1)
+    bounds.append(size)
+    
+    return [ (bounds[i], bounds[i+1]) for i in range(len(bounds) - 1) ]
+
+def parseChunk(filename, start, end):
+    """ Parse un morceau du fichier filename (cf findChunks). Fonction de module
+        pour pouvoir être exécutée dans un processus fils.
+        @param filename: str, nom du fichier .txt
+        @param start, end: int, position du début et de la fin du morceau
+        @return : list(Document), documents du morceau dans l'ordre du fichier
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        return parseBytes( f.read(end - start) )
+
+def parseBytes(data):
+    """ Parse des documents lus en binaire dans un fichier collection.
+        @param data: bytes, contenu (documents complets) d'un fichier .txt
+        @return : list(Document), documents dans l'ordre du fichier
+    """
+    # Décodage et fins de ligne identiques à open(filename, 'r')
+    return list( Parser.parseLines( io.TextIOWrapper(io.BytesIO(data)) ) )
+
+
+########################## CLASSE DOCUMENTSTORE #############################
+
+class DocumentStore:
+    """ Accès aux documents d'une collection sans les garder en mémoire: seules
+        les positions (en octets) de chaque document dans le fichier sont 
+        conservées, le fichier est projeté en mémoire (mmap) et un document
+        n'est décodé que lorsqu'il est demandé, en O(1) par identifiant.
+        Le store peut aussi être écrit (compacté) dans un fichier index (cf 
+        IndexerSimple.save), pour être relu sans le fichier source.
+        Attributs:
+            * self.ids: int array, identifiant (.I) du k-ième document
+            * self.offsets: int64 array, le k-ième document est aux octets
+                            offsets[k] à offsets[k+1] de data
+            * self.data: uint8 array, contenu du fichier (projeté en mémoire)
+            * self.positions: int array, position k de chaque identifiant (-1
+                              si absent)
+    """
+    def __init__(self, ids, offsets, data):
+        """ Constructeur de la classe DocumentStore.
+            @param ids: int array, identifiants des documents
+            @param offsets: int64 array, positions des documents dans data
+            @param data: uint8 array, documents au format de la collection
+        """
+        self.ids = ids
+        self.offsets = offsets
+        self.data = data
+        self.positions = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int32)
+        self.positions[ids] = np.arange(len(ids), dtype=np.int32)
+    
+    @classmethod
+    def fromFile(cls, filename):
+        """ Repère la position de chaque document (ligne '.I') du fichier
+            filename, sans décoder les documents.
+            @param filename: str, nom du fichier .txt
+            @return : DocumentStore
+        """
+        if os.path.getsize(filename) == 0:
+            return cls(np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint8))
+        with open(filename, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        # Début de chaque document
+        offsets = [0] if mm[:2] == b'.I' else []
+        pos = mm.find(b'\n.I')
+        while pos >= 0:
+            offsets.append(pos + 1)
+            pos = mm.find(b'\n.I', pos + 1)
+        
+        # Identifiant lu sur la ligne '.I' de chaque document
+        ids = []
+        for start in offsets:
+            end = mm.find(b'\n', start)
+            ids.append( int( mm[start : end if end >= 0 else len(mm)].split(b' ')[-1] ) )
+        offsets.append( len(mm) )
+        
+        return cls(np.array(ids, dtype=np.int32), np.array(offsets, dtype=np.int64), np.frombuffer(mm, dtype=np.uint8))
+    
+    def __contains__(self, idDoc):
+        return 0 <= idDoc < len(self.positions) and self.positions[idDoc] >= 0
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def getDocument(self, idDoc):
+        """ Décode le document idDoc.
+            @param idDoc: int, identifiant du document
+            @return : Document (None si le document n'est pas dans le store)
+        """
+        if idDoc not in self: return None
+        k = self.positions[idDoc]
+        return parseBytes( self.data[ self.offsets[k] : self.offsets[k+1] ].tobytes() )[0]
+    
+    def save(self, writer, ids):
+        """ Ecrit dans les sections store_* d'un IndexWriter les seuls documents
+            ids (présents dans le store), contigus.
+            @param ids: int array, identifiants des documents à écrire
+        """
+        ids = np.array([ idDoc for idDoc in ids.tolist() if idDoc in self ], dtype=np.int32)
+        k = self.positions[ids] if len(ids) else np.zeros(0, dtype=np.int32)
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum( self.offsets[k+1] - self.offsets[k] )
+        
+        writer.addArray('store_ids', ids)
+        writer.addArray('store_off', offsets)
+        writer.beginArray('store_data', np.uint8)
+        for start, end in zip(self.offsets[k].tolist(), self.offsets[k+1].tolist()):
+            writer.appendArray( self.data[start : end] )
+        writer.endArray()
+    
+    @classmethod
+    def load(cls, reader):
+        """ Relit (sans copie) le store écrit par save dans un IndexReader.
+        """
+        return cls( reader.getArray('store_ids'), reader.getArray('store_off'), reader.getArray('store_data') )
+
+
+########################## CLASSE METADATASTORE #############################
+
+def dateKey(date):
+    """ Convertit la date de publication d'un document (balise .B) en entier
+        aaaamm (mm = 0 si le mois est inconnu, 0 si l'année est inconnue).
+        @param date: str, ex: 'CACM December, 1958'
+        @return : int
+    """
+    year = re.search(r'\b(1[89]|20)\d\d\b', date)
+    if year == None: return 0
+    month = re.search(r'[A-Za-z]+', date[:year.start()].replace('CACM', ''))
+    return int(year.group()) * 100 + ( MOIS.get(month.group().lower(), 0) if month != None else 0 )
+
+
+class DocumentInfo:
+    """ Métadonnées d'un document lues dans un MetadataStore (enregistrement
+        léger, sans __dict__).
+    """
+    __slots__ = ('id', 'date', 'auteurs', 'mc', 'longueurs')
+    
+    def __init__(self, idDoc, date, auteurs, mc, longueurs):
+        self.id = idDoc
+        self.date = date
+        self.auteurs = auteurs
+        self.mc = mc
+        self.longueurs = longueurs
+    
+    def __repr__(self):
+        return 'DocumentInfo(%d, %d, %r, %r)' % (self.id, self.date, self.auteurs, self.mc)
+
+
+class MetadataStore:
+    """ Métadonnées de la collection stockées par colonnes: un tableau NumPy
+        contigu par champ plutôt qu'un objet Python par document. Auteurs et
+        mots-clés sont internés (une table de chaînes distinctes, chaque 
+        document référençant des identifiants au format CSR). Les recherches
+        en masse (documents d'un auteur, d'un mot-clé, d'une période) sont des
+        parcours de tableaux.
+        Attributs:
+            * self.ids: int array, identifiant (.I) du k-ième document
+            * self.dates: int array, date aaaamm de chaque document (cf dateKey)
+            * self.longueurs: int array (nbDocs, len(CHAMPS)), nombre de
+                              caractères de chaque champ (nombre de liens pour .X)
+            * self.auteurs, self.mcs: list(str), tables des auteurs et mots-clés
+            * self.auteur_off, self.auteur_ids: array, auteurs du k-ième document
+              aux positions auteur_off[k] à auteur_off[k+1] de auteur_ids
+            * self.mc_off, self.mc_ids: array, mots-clés (idem)
+    """
+    CHAMPS = ('titre', 'auteur', 'mc', 'texte', 'liens')
+    
+    def __init__(self, documents):
+        """ Constructeur de la classe MetadataStore.
+            @param documents: iterable(Document), documents de la collection
+        """
+        ids, dates, longueurs = [], [], []
+        self.auteurs, self.mcs = [], []
+        auteurIds, mcIds = dict(), dict()
+        auteur_len, auteur_ids, mc_len, mc_ids = [], [], [], []
+        
+        for document in documents:
+            ids.append( document.getId() )
+            dates.append( dateKey(document.getDate()) )
+            liens = document.getLiens()
+            longueurs.append( ( len(document.getTitre()), len(document.getAuteur()), len(document.getMC()),
+                                len(document.getTexte()), len(liens) if liens != None else 0 ) )
+            
+            # Internement des auteurs (un par ligne) et des mots-clés (séparés par des virgules)
+            auteurs = [ a.strip() for a in document.getAuteurs() if a.strip() ]
+            mcs = [ mc.strip().lower() for mc in re.split(r'[,;]', document.getMC()) if mc.strip() ]
+            for values, table, tableIds, docIds, docLen in ( (auteurs, self.auteurs, auteurIds, auteur_ids, auteur_len),
+                                                             (mcs, self.mcs, mcIds, mc_ids, mc_len) ):
+                for value in values:
+                    if value not in tableIds:
+                        tableIds[value] = len(table)
+                        table.append(value)
+                    docIds.append( tableIds[value] )
+                docLen.append( len(values) )
+        
+        self.ids = np.array(ids, dtype=np.int32)
+        self.dates = np.array(dates, dtype=np.int32)
+        self.longueurs = np.array(longueurs, dtype=np.int32).reshape(len(ids), len(self.CHAMPS))
+        self.auteurIds, self.mcIds = auteurIds, mcIds
+        self.auteur_off = np.zeros(len(ids) + 1, dtype=np.int64)
+        self.auteur_off[1:] = np.cumsum(auteur_len)
+        self.auteur_ids = np.array(auteur_ids, dtype=np.int32)
+        self.mc_off = np.zeros(len(ids) + 1, dtype=np.int64)
+        self.mc_off[1:] = np.cumsum(mc_len)
+        self.mc_ids = np.array(mc_ids, dtype=np.int32)
+        
+        # Document (position k) de chaque entrée des tableaux auteur_ids et mc_ids
+        self.auteur_docs = np.repeat( np.arange(len(ids), dtype=np.int32), auteur_len )
+        self.mc_docs = np.repeat( np.arange(len(ids), dtype=np.int32), mc_len )
+        
+        # Position k de chaque identifiant (-1 si absent)
+        self.positions = np.full(int(self.ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int32)
+        self.positions[self.ids] = np.arange(len(ids), dtype=np.int32)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __contains__(self, idDoc):
+        return 0 <= idDoc < len(self.positions) and self.positions[idDoc] >= 0
+    
+    def getDocument(self, idDoc):
+        """ @param idDoc: int, identifiant du document
+            @return : DocumentInfo, métadonnées du document (None si absent)
+        """
+        if idDoc not in self: return None
+        k = self.positions[idDoc]
+        return DocumentInfo( idDoc, int(self.dates[k]),
+                             tuple( self.auteurs[a] for a in self.auteur_ids[ self.auteur_off[k] : self.auteur_off[k+1] ] ),
+                             tuple( self.mcs[m] for m in self.mc_ids[ self.mc_off[k] : self.mc_off[k+1] ] ),
+                             dict( zip(self.CHAMPS, self.longueurs[k].tolist()) ) )
+    
+    def getDocsByAuthor(self, auteur):
+        """ @param auteur: str, auteur (tel qu'écrit sur sa ligne .A)
+            @return : int array, identifiants des documents de cet auteur
+        """
+        a = self.auteurIds.get(auteur.strip())
+        if a == None: return np.zeros(0, dtype=np.int32)
+        return self.ids[ self.auteur_docs[ self.auteur_ids == a ] ]
+    
+    def getDocsByKeyword(self, mc):
+        """ @param mc: str, mot-clé (insensible à la casse)
+            @return : int array, identifiants des documents ayant ce mot-clé
+        """
+        m = self.mcIds.get(mc.strip().lower())
+        if m == None: return np.zeros(0, dtype=np.int32)
+        return self.ids[ self.mc_docs[ self.mc_ids == m ] ]
+    
+    def getDocsInDateRange(self, debut, fin):
+        """ Documents publiés entre debut et fin (inclus). Les bornes sont des
+            années (aaaa) ou des mois (aaaamm).
+            @return : int array, identifiants des documents de la période
+        """
+        debut = debut * 100 if debut < 10000 else debut
+        fin = fin * 100 + 12 if fin < 10000 else fin
+        return self.ids[ (self.dates >= debut) & (self.dates <= fin) ]
+
+
 ############################## CLASSE PARSER ##############################
 
 class Parser:
@@ -79,12 +381,21 @@ class Parser:
         entrée en paramètre, en stockant les documents qu'elle contient dans 
         un dictionnaire de Documents.
     """
-    def __init__(self, filename):
+    def __init__(self, filename, workers=1):
         """ Constructeur de la classe Parser.
             @param filename: str, nom du fichier .txt qui est la collection de
                              documents à parser.
+            @param workers: int, nombre de processus utilisés pour le parsing
         """
-        self.collection = self.parse(filename)
+        self.collection = self.parse(filename, workers)
+        
+        # Position de chaque document dans le fichier (accès sans la collection)
+        self.store = DocumentStore.fromFile(filename)
+        self.metadata = None
+        
+        # Numéro dans la collection de chaque identifiant de document
+        self.numbers = { self.collection[i].getId() : i for i in self.collection }
+        self.lastNum = max(self.collection, default=0)
         
         # Liste des documents cités par chaque document
         self.index_linksFrom = { self.collection[i].getId() : self.collection[i].getLiens() for i in self.collection }
@@ -98,53 +409,142 @@ class Parser:
                 for j in liens:
                     if i not in self.index_linksTo[j] : self.index_linksTo[j][i] = 0
                     self.index_linksTo[j][i] += 1
+        
+        # Graphe des citations au format CSR/CSC (cf CitationGraph)
+        self.graph = CitationGraph.fromDocuments(self.collection.values())
                 
-    def parse(self, filename):
+    def parse(self, filename, workers=1):
         """ Fonction créant le dictionnaire de Documents associé à la collection
             de documents entrée en paramètre (fichier filename).
+            Si workers > 1, le fichier est découpé en morceaux alignés sur les
+            documents (cf findChunks), parsés en parallèle par un pool de 
+            processus puis concaténés dans l'ordre: le résultat est identique à
+            celui du parsing séquentiel.
             @param filename: str, nom du fichier .txt à parser
+            @param workers: int, nombre de processus
             @return : dict(int, Document)
         """
-        # ----- Collection de Documents
-        collection = dict()
-        
-        # ----- Ouverture du fichier et récupération du contenu
-        lines = open(filename, 'r').read().splitlines()
-        dictionnaire = dict()
+        if workers <= 1:
+            documents = self.iterDocuments(filename)
+        else:
+            # Plusieurs morceaux par processus pour équilibrer la charge
+            chunks = findChunks(filename, 4 * workers)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list( pool.map(parseChunk, [ filename ] * len(chunks), *zip(*chunks)) ) if chunks else []
+            documents = ( document for part in parts for document in part )
         
-        # i: int, compteur de documents
-        i = 0
+        # ----- Collection de Documents, numérotés à partir de 1
+        return { i : document for i, document in enumerate(documents, 1) }
+    
+    @staticmethod
+    def iterDocuments(filename):
+        """ Générateur des Documents de la collection filename, lus un par un:
+            seul le document en cours de lecture est gardé en mémoire (et non
+            tout le fichier). Les Documents sont identiques à ceux de parse.
+            Exemple: IndexerSPIMI().build(Parser.iterDocuments(filename), path)
+            @param filename: str, nom du fichier .txt à parser
+            @return : generator(Document)
+        """
+        with open(filename, 'r') as f:
+            yield from Parser.parseLines(f)
+    
+    @staticmethod
+    def parseLines(lines):
+        """ Générateur des Documents décrits par les lignes lines (cf iterDocuments).
+            @param lines: iterable(str), lignes d'une collection
+            @return : generator(Document)
+        """
+        # data: dict(str, list), lignes de chaque balise du document courant
+        data = None
         balise = ''
+        
         for line in lines:
+            line = line.rstrip('\n')
             if line == '':
                 continue
-            # Cas balise '.I'
-            if(re.search('^[.]I', line)):
-                i += 1
-                balise = 'I'
-                dictionnaire[i] = {'I' : int(line.split(' ')[-1])}
-            else:
-                if(re.search('^[.][A-Z]', line)):
+            if line[0] == '.' and line[1:2] in BALISES:
+                # Cas balise '.I': nouveau document
+                if line[1] == 'I':
+                    if data != None: yield Parser.makeDocument(data)
+                    balise = 'I'
+                    data = {'I' : int(line.split(' ')[-1])}
+                elif data != None:
                     balise = line[-1]
-                    if balise == 'X':
-                        dictionnaire[i]['X'] = []
-                    else:
-                        dictionnaire[i][balise] = ''
-                else:
-                    if balise == 'X':
-                        dictionnaire[i][balise].append(line.split('\t'))
-                    else:
-                        dictionnaire[i][balise] += line + ' '
-        
-        # ----- Création de la collection de Documents correspondant
-        for num, data in dictionnaire.items():
-            collection[num] = Document(data)
-        
-        return collection
+                    data[balise] = []
+            elif balise == 'X':
+                data['X'].append(line.split('\t'))
+            elif balise != 'I' and data != None:
+                data[balise].append(line)
+        
+        if data != None: yield Parser.makeDocument(data)
+    
+    @staticmethod
+    def makeDocument(data):
+        """ Crée le Document à partir des lignes de chacune de ses balises.
+            @param data: dict(str, list), identifiant (.I) et lignes de chaque balise
+            @return : Document
+        """
+        # Document attend le contenu d'une balise suivi d'un espace (cf parse),
+        # et la liste des auteurs
+        for balise, lines in data.items():
+            if balise not in ('I', 'X', 'A'): data[balise] = ' '.join(lines + [''])
+        return Document(data)
+    
+    def addDocuments(self, documents):
+        """ Ajoute des documents à la collection et met à jour les liens.
+            @param documents: iterable(Document), documents à ajouter
+        """
+        self.metadata = None
+        self.graph = None
+        for document in documents:
+            self.lastNum += 1
+            i = self.lastNum
+            idDoc = document.getId()
+            self.collection[i] = document
+            self.numbers[idDoc] = i
+            self.index_linksFrom[idDoc] = document.getLiens()
+            self.index_linksTo.setdefault(idDoc, {})
+            
+            if document.getLiens() != None:
+                for j in document.getLiens():
+                    self.index_linksTo.setdefault(j, {})
+                    if idDoc not in self.index_linksTo[j] : self.index_linksTo[j][idDoc] = 0
+                    self.index_linksTo[j][idDoc] += 1
+    
+    def deleteDocuments(self, ids):
+        """ Supprime des documents de la collection et met à jour les liens.
+            Les liens des autres documents vers un document supprimé sont conservés.
+            @param ids: iterable(int), identifiants des documents à supprimer
+        """
+        self.metadata = None
+        self.graph = None
+        for idDoc in ids:
+            del self.collection[ self.numbers.pop(idDoc) ]
+            liens = self.index_linksFrom.pop(idDoc)
+            if liens != None:
+                for j in set(liens):
+                    if j in self.index_linksTo: self.index_linksTo[j].pop(idDoc, None)
     
     def getCollection(self):
         return self.collection
     
+    def getStore(self):
+        return self.store
+    
+    def getMetadata(self):
+        """ Métadonnées de la collection par colonnes (cf MetadataStore),
+            calculées au premier appel puis après chaque modification.
+        """
+        if self.metadata == None: self.metadata = MetadataStore(self.collection.values())
+        return self.metadata
+    
+    def getCitationGraph(self):
+        """ Graphe des citations de la collection (cf CitationGraph), 
+            reconstruit au premier appel après une modification de la collection.
+        """
+        if self.graph == None: self.graph = CitationGraph.fromDocuments(self.collection.values())
+        return self.graph
+    
     def getAllLinksFrom(self):
         """ Permet de récupérer tous les documents cités par chaque Document.
         """
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Apr 20 14:05:12 2021
+
+@author: GIANG Cécile, KHALFAT Célina
+"""
+
+##################### IMPORTATION DES LIBRAIRIES UTILES ####################
+
+import numpy as np
+
+
+########################## CLASSE SPARSEMATRIX ##############################
+
+class SparseMatrix:
+    """ Matrice creuse au format CSR, dans des tableaux NumPy (même format que
+        l'index de IndexerSimple): les colonnes et valeurs non nulles de la
+        ligne i sont aux positions off[i] à off[i+1] de cols et values.
+        Sert au calcul en batch des scores de plusieurs requêtes (produit de
+        la matrice requêtes-termes par la matrice termes-documents).
+        Attributs:
+            * self.off: int64 array, début de chaque ligne
+            * self.cols: int64 array, colonne de chaque valeur
+            * self.values: float array, valeurs non nulles
+            * self.nbCols: int, nombre de colonnes
+    """
+    # Nombre maximal de produits calculés à la fois par dotVector
+    CHUNK = 1 << 22
+
+    def __init__(self, off, cols, values, nbCols):
+        self.off = off
+        self.cols = cols
+        self.values = values
+        self.nbCols = nbCols
+
+    @classmethod
+    def fromRows(cls, rows, nbCols):
+        """ @param rows: list((int array, float array)), colonnes et valeurs de
+                         chaque ligne
+            @param nbCols: int, nombre de colonnes
+            @return : SparseMatrix
+        """
+        off = np.zeros(len(rows) + 1, dtype=np.int64)
+        off[1:] = np.cumsum([ len(cols) for cols, values in rows ])
+        cols = np.concatenate([ np.zeros(0, dtype=np.int64) ] + [ np.asarray(cols, dtype=np.int64) for cols, values in rows ])
+        values = np.concatenate([ np.zeros(0) ] + [ np.asarray(values, dtype=float) for cols, values in rows ])
+        return cls(off, cols, values, nbCols)
+
+    @classmethod
+    def fromCoords(cls, rows, cols, values, nbRows, nbCols):
+        """ Construit la matrice à partir de ses valeurs non nulles données
+            en coordonnées; les valeurs d'une même case sont sommées.
+            @param rows, cols: int array, ligne et colonne de chaque valeur
+            @param values: float array, valeurs
+            @param nbRows, nbCols: int, dimensions de la matrice
+            @return : SparseMatrix, colonnes triées dans chaque ligne
+        """
+        keys, inverse = np.unique(np.asarray(rows, dtype=np.int64) * nbCols + np.asarray(cols, dtype=np.int64), return_inverse=True)
+        values = np.bincount(inverse.ravel(), weights=values, minlength=len(keys))
+        off = np.zeros(nbRows + 1, dtype=np.int64)
+        off[1:] = np.cumsum( np.bincount(keys // max(nbCols, 1), minlength=nbRows) )
+        return cls(off, keys % max(nbCols, 1), values, nbCols)
+
+    def __repr__(self):
+        return 'SparseMatrix(%d x %d, %d valeurs)' % (self.getNbRows(), self.nbCols, len(self.values))
+
+    def getNbRows(self):
+        return len(self.off) - 1
+
+    def getRow(self, i):
+        """ @return cols: int64 array, colonnes (croissantes si la matrice est
+                          un produit) des valeurs non nulles de la ligne i
+            @return values: float array, valeurs de la ligne i
+        """
+        return self.cols[ self.off[i] : self.off[i+1] ], self.values[ self.off[i] : self.off[i+1] ]
+
+    def getRowSums(self):
+        """ @return : float array, somme des valeurs de chaque ligne
+        """
+        return np.bincount( np.repeat(np.arange(self.getNbRows()), np.diff(self.off)), weights=self.values, minlength=self.getNbRows() )
+
+    def dotVector(self, x):
+        """ Produit matrice-vecteur self x x, ou produit par une matrice dense
+            si x a deux dimensions (une colonne par vecteur).
+            @param x: float array, de taille nbCols (ou nbCols x m)
+            @return : float array, de taille nbRows (ou nbRows x m)
+        """
+        nbRows = self.getNbRows()
+        if x.ndim == 1:
+            rows = np.repeat(np.arange(nbRows), np.diff(self.off))
+            return np.bincount(rows, weights=self.values * x[self.cols], minlength=nbRows)
+        
+        # Produits sommés ligne par ligne (reduceat sur les lignes non vides),
+        # par blocs de colonnes de x pour borner la mémoire à CHUNK produits
+        m = x.shape[1]
+        result = np.zeros((nbRows, m))
+        nonEmpty = self.off[:-1] < self.off[1:]
+        if not nonEmpty.any(): return result
+        starts = self.off[:-1][nonEmpty]
+        step = max( 1, self.CHUNK // max(len(self.values), 1) )
+        for j in range(0, m, step):
+            result[nonEmpty, j : j + step] = np.add.reduceat(self.values[:, None] * x[self.cols, j : j + step], starts, axis=0)
+        return result
+
+    def transpose(self):
+        """ @return : SparseMatrix, transposée de la matrice
+        """
+        rows = np.repeat(np.arange(self.getNbRows(), dtype=np.int64), np.diff(self.off))
+        return SparseMatrix.fromCoords(self.cols, rows, self.values, self.nbCols, self.getNbRows())
+
+    def toDense(self):
+        """ @return : float array, matrice dense (pour de petites matrices)
+        """
+        dense = np.zeros((self.getNbRows(), self.nbCols))
+        dense[ np.repeat(np.arange(self.getNbRows()), np.diff(self.off)), self.cols ] = self.values
+        return dense
+
+    def dot(self, other):
+        """ Produit matriciel self x other, sans passer par une matrice dense.
+            Chaque valeur de self est multipliée par la ligne correspondante
+            de other; les produits d'une même case sont sommés dans l'ordre
+            des colonnes de self (comme une boucle terme par terme).
+            @param other: SparseMatrix, autant de lignes que self a de colonnes
+            @return : SparseMatrix, colonnes triées dans chaque ligne
+        """
+        nbRows = self.getNbRows()
+        lengths = other.off[self.cols + 1] - other.off[self.cols]
+        total = int(lengths.sum())
+
+        # Position dans other de chaque produit élémentaire
+        ends = np.cumsum(lengths)
+        positions = np.repeat(other.off[self.cols] - ( ends - lengths ), lengths) + np.arange(total)
+        rows = np.repeat( np.repeat(np.arange(nbRows, dtype=np.int64), np.diff(self.off)), lengths )
+        values = np.repeat(self.values, lengths) * other.values[positions]
+
+        # Somme des produits de chaque case (ligne, colonne)
+        keys, inverse = np.unique(rows * other.nbCols + other.cols[positions], return_inverse=True)
+        values = np.bincount(inverse, weights=values, minlength=len(keys))
+        off = np.zeros(nbRows + 1, dtype=np.int64)
+        off[1:] = np.cumsum( np.bincount(keys // max(other.nbCols, 1), minlength=nbRows) )
+        return SparseMatrix(off, keys % max(other.nbCols, 1), values, other.nbCols)
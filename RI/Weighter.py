@@ -7,9 +7,188 @@ Created on Wed Jan 27 09:29:53 2021
 
 ##################### IMPORTATION DES FICHIERS EXTERNES ####################
 
-import textRepresenter as tr
 from abc import ABC, abstractmethod
 import math
+import numpy as np
+from Sparse import SparseMatrix
+
+
+########################### CLASSE WEIGHTSEGMENT ############################
+
+class WeightSegment(SparseMatrix):
+    """ Poids locaux des documents d'un segment de l'index pour un Weighter
+        (sans les facteurs par terme, cf Weighter.getTermFactors): matrice
+        creuse termes x lignes de l'index (même disposition que l'index 
+        inversé), en float32. Le segment principal est calculé une seule fois
+        tant que le segment principal de l'index ne change pas, et sauvegardé
+        avec l'index (cf IndexerSimple.getWeightSegment).
+        Attributs:
+            * self.off, self.cols, self.values: array, poids du terme t pour
+              les lignes cols[off[t]:off[t+1]] (cf SparseMatrix)
+            * self.squares: float array, somme des carrés des poids de chaque
+              ligne
+    """
+    def __init__(self, off, cols, values, nbCols, squares):
+        super().__init__(off, cols, values, nbCols)
+        self.squares = squares
+    
+    @classmethod
+    def fromPostings(cls, weighter, off, rows, tfs, nbRows):
+        """ Poids des postings donnés au format CSR, en un seul calcul 
+            vectorisé (cf Weighter.getTfWeights).
+            @param weighter: Weighter
+            @param off, rows, tfs: array, postings de chaque terme
+            @param nbRows: int, nombre de lignes (colonnes de la matrice)
+            @return : WeightSegment
+        """
+        terms = np.repeat( np.arange(len(off) - 1, dtype=np.int32), np.diff(off) )
+        values = np.asarray(weighter.getTfWeights(terms, tfs), dtype=float)
+        return cls.fromValues(off, rows, values, nbRows)
+    
+    @classmethod
+    def fromValues(cls, off, rows, values, nbRows):
+        squares = np.bincount(rows, weights=np.square(values), minlength=nbRows)
+        return cls(np.asarray(off, dtype=np.int64), np.asarray(rows, dtype=np.int32), values.astype(np.float32), nbRows, squares)
+    
+    def getTerms(self):
+        """ @return : int array, terme de chaque poids
+        """
+        return np.repeat( np.arange(self.getNbRows()), np.diff(self.off) )
+    
+    def compact(self, delta, alive, nbTerms):
+        """ Segment principal de l'index compacté (cf IndexerSimple.compact):
+            poids des lignes vivantes de ce segment puis de celles du segment
+            delta, renumérotées comme l'index (dans l'ordre des lignes).
+            @param delta: WeightSegment, poids du segment delta (None s'il est vide)
+            @param alive: bool array, lignes vivantes de l'index avant compactage
+            @param nbTerms: int, nombre de termes de l'index
+            @return : WeightSegment
+        """
+        parts = [ self ] if delta == None else [ self, delta ]
+        terms = np.concatenate([ part.getTerms() for part in parts ])
+        cols = np.concatenate([ part.cols for part in parts ])
+        values = np.concatenate([ part.values for part in parts ])
+        
+        # Tri stable par terme: les lignes du delta suivent celles du segment principal
+        keep = alive[cols]
+        terms, cols, values = terms[keep], cols[keep], values[keep]
+        order = np.argsort(terms, kind='stable')
+        off = np.zeros(nbTerms + 1, dtype=np.int64)
+        off[1:] = np.cumsum( np.bincount(terms, minlength=nbTerms) )
+        rows = ( np.cumsum(alive) - 1 ).astype(np.int32)
+        
+        squares = np.zeros(len(alive)) if delta == None else np.array(delta.squares, dtype=float)
+        squares[ : len(self.squares) ] += self.squares
+        return WeightSegment(off, rows[ cols[order] ], values[order], int(alive.sum()), squares[alive])
+    
+    def save(self, writer, name):
+        """ Ecrit le segment dans les sections weights_<name>_* d'un IndexWriter.
+        """
+        writer.addArray('weights_%s_off' % name, self.off)
+        writer.addArray('weights_%s_rows' % name, self.cols)
+        writer.addArray('weights_%s_values' % name, self.values)
+        writer.addArray('weights_%s_squares' % name, self.squares)
+    
+    @classmethod
+    def load(cls, reader, name, nbRows):
+        """ Relit (sans copie) le segment écrit par save dans un IndexReader.
+        """
+        return cls( reader.getArray('weights_%s_off' % name), reader.getArray('weights_%s_rows' % name),
+                    reader.getArray('weights_%s_values' % name), nbRows, reader.getArray('weights_%s_squares' % name) )
+
+
+############################ CLASSE WEIGHTMATRIX ############################
+
+class WeightMatrix:
+    """ Poids des documents d'un Weighter pour une version de l'index, en 
+        deux segments comme l'index: le segment principal (réutilisé tant que
+        l'index n'est pas compacté) et le segment delta (documents ajoutés 
+        depuis, recalculé à chaque version: le coût est proportionnel aux
+        modifications). Les facteurs par terme (idf de Weighter5) sont 
+        appliqués à la lecture et les lignes supprimées écartées des
+        résultats. Elle est partagée par tous les modèles (cf 
+        CollectionStats.getWeightMatrix).
+        Attributs:
+            * self.segments: list(WeightSegment), segments principal et delta
+            * self.factors: float array, facteur de chaque terme (None si
+                            les poids n'en ont pas)
+            * self.alive: bool array, lignes vivantes (None sans tombstones)
+            * self.norms: float array, norme des poids de chaque ligne
+    """
+    def __init__(self, segments, factors, alive, nbRows):
+        self.segments = segments
+        self.factors = factors
+        self.alive = alive
+        
+        squares = np.zeros(nbRows)
+        for segment in segments:
+            if factors is None: weights = segment.squares
+            else: weights = np.bincount(segment.cols, weights=np.square( segment.values * factors[ segment.getTerms() ] ), minlength=segment.nbCols)
+            squares[ : len(weights) ] += weights
+        self.norms = np.sqrt(squares)
+    
+    @classmethod
+    def fromWeighter(cls, weighter):
+        """ Poids des documents de l'index du weighter: segment principal de 
+            l'index (cf IndexerSimple.getWeightSegment) et segment delta. Un
+            weighter sans getTfWeights a un seul segment, calculé terme par 
+            terme (getPostingsWeights) à chaque version.
+            @param weighter: Weighter
+            @return : WeightMatrix
+        """
+        index = weighter.ref_index
+        nbRows = index.getNbRows()
+        
+        if weighter.getTfWeights(np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)) is None:
+            postings = [ weighter.getPostingsWeights(stem) for stem in index.terms ]
+            off = np.zeros(len(postings) + 1, dtype=np.int64)
+            off[1:] = np.cumsum([ len(rows) for rows, w_td in postings ])
+            rows = np.concatenate([ np.zeros(0, dtype=np.int32) ] + [ rows for rows, w_td in postings ])
+            values = np.concatenate([ np.zeros(0) ] + [ np.asarray(w_td, dtype=float) for rows, w_td in postings ])
+            return cls([ WeightSegment.fromValues(off, rows, values, nbRows) ], None, None, nbRows)
+        
+        segments = [ index.getWeightSegment(weighter) ]
+        if index.delta_post: segments.append( WeightSegment.fromPostings(weighter, *index.getDeltaPostings(), nbRows) )
+        alive = index.alive.copy() if index.nbDeleted else None
+        return cls(segments, weighter.getTermFactors(), alive, nbRows)
+    
+    def getRow(self, t):
+        """ @param t: int, identifiant d'un terme
+            @return rows: int array, lignes (vivantes, croissantes) contenant t
+            @return values: float array, poids de t dans chacune de ces lignes
+        """
+        parts = [ segment.getRow(t) for segment in self.segments if t < segment.getNbRows() ]
+        rows = np.concatenate([ np.zeros(0, dtype=np.int32) ] + [ rows for rows, values in parts ])
+        values = np.concatenate([ np.zeros(0) ] + [ values.astype(float) for rows, values in parts ])
+        if self.factors is not None: values *= self.factors[t]
+        if self.alive is not None:
+            keep = self.alive[rows]
+            rows, values = rows[keep], values[keep]
+        return rows, values
+    
+    def dotQuery(self, terms, weights):
+        """ Produit scalaire d'une requête avec chaque ligne: un produit creux
+            par segment.
+            @param terms: int array, identifiants des termes de la requête
+            @param weights: float array, poids de chacun de ces termes
+            @return rows: int array, lignes (vivantes, croissantes) ayant au
+                          moins un terme de la requête
+            @return scores: float array, produit scalaire de chacune
+        """
+        terms, weights = np.asarray(terms, dtype=np.int64), np.asarray(weights, dtype=float)
+        if self.factors is not None: weights = weights * self.factors[terms]
+        
+        parts = []
+        for segment in self.segments:
+            inside = terms < segment.getNbRows()
+            Q = SparseMatrix.fromRows([ ( terms[inside], weights[inside] ) ], segment.getNbRows())
+            parts.append( Q.dot(segment).getRow(0) )
+        rows = np.concatenate([ rows for rows, scores in parts ])
+        scores = np.concatenate([ scores for rows, scores in parts ])
+        if self.alive is not None:
+            keep = self.alive[rows]
+            rows, scores = rows[keep], scores[keep]
+        return rows, scores
 
 
 ############################## CLASSE WEIGHTER ##############################
@@ -21,6 +200,7 @@ class Weighter(ABC):
             * self.ref_index: IndexerSimple, référence de l'indexer
             * self.index: dict(int, int), ensemble des index des Documents de la collection
             * self.index_inv: dict(str, int), ensemble des index des Documents de la collection
+            * self.analyzer: Analyzer, analyseur de l'index (utilisé pour les requêtes)
     """
     def __init__(self, ref_index):
         """ Constructeur de la classe Weighter.
@@ -29,6 +209,7 @@ class Weighter(ABC):
         self.ref_index = ref_index
         self.index = ref_index.getIndex()
         self.index_inverse = ref_index.getIndexInverse()
+        self.analyzer = ref_index.getAnalyzer()
     
     @abstractmethod
     def getWeightsForDoc(self, idDoc):
@@ -48,6 +229,43 @@ class Weighter(ABC):
         """
         pass
     
+    def getTfWeights(self, terms, tfs):
+        """ Poids w_td d'un ensemble de postings, calculés en une fois.
+            Par défaut None: les poids sont alors obtenus terme par terme
+            (getPostingsWeights).
+            @param terms: int array, identifiant du terme de chaque posting
+            @param tfs: int array, tf de chaque posting
+            @return : float array, poids de chaque posting
+        """
+        return None
+    
+    def getTermFactors(self):
+        """ Facteur de chaque terme par lequel sont multipliés les poids de 
+            getTfWeights (dépendant des statistiques de la collection, il 
+            n'est pas stocké dans les segments de poids, cf WeightMatrix).
+            Par défaut None: pas de facteur.
+            @return : float array, facteur de chaque identifiant de terme
+        """
+        return None
+    
+    def getWeightMatrix(self):
+        """ Poids de tous les documents (WeightMatrix), calculés une seule fois
+            par version de l'index.
+        """
+        return self.ref_index.getStats().getWeightMatrix(self)
+    
+    def getPostingsWeights(self, stem):
+        """ Retourne les poids du terme stem pour tous les documents qui le
+            contiennent, sous la forme de deux tableaux parallèles.
+            Par défaut, construit à partir de getWeightsForStem.
+            @param stem: str, mot stemmisé
+            @return rows: int array, lignes (dans l'index) des documents
+            @return w_td: float array, poids de stem dans chacun des documents
+        """
+        w_td = self.getWeightsForStem(stem)
+        docs = np.fromiter(w_td.keys(), dtype=np.int32, count=len(w_td))
+        return self.ref_index.rows[docs], np.fromiter(w_td.values(), dtype=float, count=len(w_td))
+    
 
 ############################## CLASSE WEIGHTER1 ##############################
 
@@ -73,13 +291,18 @@ class Weighter1(Weighter):
         """
         return self.ref_index.getTfsForStem(stem)
     
+    def getPostingsWeights(self, stem):
+        return self.ref_index.getPostings(stem)
+    
+    def getTfWeights(self, terms, tfs):
+        return tfs
+    
     def getWeightsForQuery(self, query):
         """ @param query: str, requête
             @return w_tq: dict(str, 1), vaut 1 pour chaque terme de la quête
         """
         # Stemmisation de la requête
-        ps = tr.PorterStemmer()
-        query_index = ps.getTextRepresentation(query)
+        query_index = self.analyzer.getTextRepresentation(query)
         
         return { word : 1 for word in query_index.keys() }
     
@@ -108,14 +331,19 @@ class Weighter2(Weighter):
         """
         return self.ref_index.getTfsForStem(stem)
     
+    def getPostingsWeights(self, stem):
+        return self.ref_index.getPostings(stem)
+    
+    def getTfWeights(self, terms, tfs):
+        return tfs
+    
     def getWeightsForQuery(self, query):
         """ @param query: str, requête
             @return w_tq: dict(str, int), index du nombre d'occurrences
                           pour chaque terme de la requête
         """
         # Stemmisation de la requête
-        ps = tr.PorterStemmer()
-        return ps.getTextRepresentation(query)
+        return self.analyzer.getTextRepresentation(query)
     
 
 ############################## CLASSE WEIGHTER3 ##############################
@@ -142,17 +370,23 @@ class Weighter3(Weighter):
         """
         return self.ref_index.getTfsForStem(stem)
     
+    def getPostingsWeights(self, stem):
+        return self.ref_index.getPostings(stem)
+    
+    def getTfWeights(self, terms, tfs):
+        return tfs
+    
     def getWeightsForQuery(self, query):
         """ @param query: str, requête
             @return w_tq: dict(str, int), index du nombre d'occurrences
                           pour chaque terme de la requête
         """
         # Stemmisation de la requête
-        ps = tr.PorterStemmer()
-        query_index =  ps.getTextRepresentation(query)
+        query_index =  self.analyzer.getTextRepresentation(query)
         
         # Calcul de idf pour tous les mots de la requête qui sont dans la collection de Documents
-        return {stem : self.ref_index.getIdf()[stem] for stem in query_index.keys() if stem in self.index_inverse.keys()}
+        idf = self.ref_index.getIdf()
+        return {stem : idf[stem] for stem in query_index.keys() if stem in idf}
         
 
 ############################## CLASSE WEIGHTER4 ##############################
@@ -170,16 +404,23 @@ class Weighter4(Weighter):
             @return w_td: dict(str, int), index de la pondération de chaque 
                           mot du Document
         """
-        index_idDoc = self.ref_index.getTfsForDoc(idDoc)
-        return { stem : 1 + math.log(tf) for stem, tf in index_idDoc.items()}
+        terms, tfs = self.ref_index.getDocTerms(idDoc)
+        return dict( zip( [ self.ref_index.terms[t] for t in terms.tolist() ], self.getTfWeights(terms, tfs).tolist() ) )
     
     def getWeightsForStem(self, stem):
         """ @param stem: str, mot stemmisé
             @return w_td: dict(int, int), index inverse de la pondération de
                           chaque terme stem dans la collection de Documents
         """
-        index_inverse = self.ref_index.getTfsForStem(stem)
-        return {idDoc : 1 + math.log(tf) for idDoc, tf in index_inverse.items()}
+        rows, w_td = self.getPostingsWeights(stem)
+        return dict( zip( self.ref_index.docIds[rows].tolist(), w_td.tolist() ) )
+    
+    def getPostingsWeights(self, stem):
+        rows, tfs = self.ref_index.getPostings(stem)
+        return rows, 1 + np.log(tfs)
+    
+    def getTfWeights(self, terms, tfs):
+        return 1 + np.log(tfs)
     
     def getWeightsForQuery(self, query):
         """ @param query: str, requête
@@ -187,11 +428,11 @@ class Weighter4(Weighter):
                           pour chaque terme de la requête
         """
         # Stemmisation de la requête
-        ps = tr.PorterStemmer()
-        query_index =  ps.getTextRepresentation(query)
+        query_index =  self.analyzer.getTextRepresentation(query)
         
         # Calcul de idf pour tous les mots de la requête
-        return {stem : self.ref_index.getIdf()[stem] for stem in query_index.keys() if stem in self.index_inverse.keys()}
+        idf = self.ref_index.getIdf()
+        return {stem : idf[stem] for stem in query_index.keys() if stem in idf}
         
 
 ############################## CLASSE WEIGHTER5 ##############################
@@ -203,27 +444,35 @@ class Weighter5(Weighter):
     """
     def __init__(self, ref_index):
         super().__init__(ref_index)
-        self.idf = ref_index.getIdf()
     
     def getWeightsForDoc(self, idDoc):
         """ @param idDoc: int, identifiant du Document dans l'index
             @return w_td: dict(str, int), index de la pondération de chaque 
                           mot du Document
         """
-        tf_idDoc = self.ref_index.getTfsForDoc(idDoc)
-        idf_idDoc = {stem : self.idf[stem] for stem in tf_idDoc.keys()}
-        
-        return { stem : (1 + math.log(tf_idDoc[stem])) * idf_idDoc[stem] for stem, tf in tf_idDoc.items()}
+        terms, tfs = self.ref_index.getDocTerms(idDoc)
+        w_td = self.getTfWeights(terms, tfs) * self.getTermFactors()[terms]
+        return dict( zip( [ self.ref_index.terms[t] for t in terms.tolist() ], w_td.tolist() ) )
     
     def getWeightsForStem(self, stem):
         """ @param stem: str, mot stemmisé
             @return w_td: dict(int, int), index inverse de la pondération de
                           chaque terme stem dans la collection de Documents
         """
-        tf_stem = self.ref_index.getTfsForStem(stem)
-        idf_stem = self.idf[stem]
-        
-        return { idDoc : (1 + math.log(tf_stem[idDoc])) * idf_stem for idDoc, tf in tf_stem.items()}
+        rows, w_td = self.getPostingsWeights(stem)
+        return dict( zip( self.ref_index.docIds[rows].tolist(), w_td.tolist() ) )
+    
+    def getPostingsWeights(self, stem):
+        rows, tfs = self.ref_index.getPostings(stem)
+        return rows, (1 + np.log(tfs)) * self.ref_index.getIdf().get(stem, 0)
+    
+    def getTfWeights(self, terms, tfs):
+        # L'idf est appliqué à part (getTermFactors): les poids locaux du
+        # segment principal restent valables quand l'idf change
+        return 1 + np.log(tfs)
+    
+    def getTermFactors(self):
+        return self.ref_index.getIdfs()
     
     def getWeightsForQuery(self, query):
         """ @param query: str, requête
@@ -231,12 +480,12 @@ class Weighter5(Weighter):
                           terme de la requête
         """
         # Stemmisation de la requête
-        ps = tr.PorterStemmer()
         
         # Calcul des tf pour tous les mots de la requête
-        query_tf =  ps.getTextRepresentation(query)
+        query_tf =  self.analyzer.getTextRepresentation(query)
         
         # Calcul de idf pour tous les mots de la requête
-        query_idf = {stem : self.ref_index.getIdf()[stem] for stem in query_tf.keys() if stem in self.index_inverse.keys() and self.ref_index.getIdf()[stem] != 0}
+        idf = self.ref_index.getIdf()
+        query_idf = {stem : idf[stem] for stem in query_tf.keys() if idf.get(stem, 0) != 0}
         
         return {stem : (1 + math.log(query_tf[stem])) * query_idf[stem] for stem in query_idf}
\ No newline at end of file
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Collection synthétique (format CACM) partagée par les tests.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+# Les modules de RI sont importés par leur nom
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Parser
+import Indexer
+
+
+MOTS = [ 'compiler', 'parsing', 'grammar', 'matrix', 'sorting', 'algorithm',
+         'memory', 'storage', 'network', 'graph', 'language', 'program',
+         'retrieval', 'index', 'query', 'document', 'system', 'operating',
+         'numerical', 'integration', 'equation', 'linear', 'table', 'hash',
+         'search', 'tree', 'binary', 'list', 'processor', 'computer' ]
+
+REQUETES = [ 'compiler grammar parsing', 'matrix linear equation',
+             'sorting algorithm binary tree', 'retrieval of documents index query',
+             'operating system memory storage', 'hash table search' ]
+
+
+def document(idDoc, rd, nbDocs):
+    """ Texte d'un document au format de la collection, avec ses liens .X.
+    """
+    lignes = [ '.I %d' % idDoc, '.T', ' '.join(rd.choice(MOTS) for _ in range(rd.randint(2, 6))),
+               '.W', ' '.join(rd.choice(MOTS) for _ in range(rd.randint(5, 40))), '.X' ]
+    for _ in range(rd.randint(0, 4)):
+        lignes.append('%d\t5\t%d' % (rd.randint(1, nbDocs), idDoc))
+    lignes.append('%d\t5\t%d' % (idDoc, idDoc))
+    return '\n'.join(lignes) + '\n'
+
+
+def collection(path, nbDocs, seed=0):
+    rd = random.Random(seed)
+    with open(path, 'w') as f:
+        for idDoc in range(1, nbDocs + 1):
+            f.write(document(idDoc, rd, nbDocs))
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def collectionFile(tmp_path_factory):
+    return collection(tmp_path_factory.mktemp('data') / 'coll.txt', 120)
+
+
+@pytest.fixture
+def index(collectionFile):
+    return Indexer.IndexerSimple(Parser.Parser(collectionFile))
+
+
+@pytest.fixture
+def queries():
+    return list(REQUETES)
+
+
+def newDocuments(ids, nbDocs, seed=1):
+    """ Documents (objets Document) d'identifiants ids, liés à la collection.
+    """
+    rd = random.Random(seed)
+    return [ Parser.parseBytes( document(idDoc, rd, nbDocs).encode() )[0] for idDoc in ids ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la compression des postings (Compression).
+"""
+
+import numpy as np
+import pytest
+
+import Compression
+from Compression import BLOCK, CompressedPostings
+
+
+def postings(dfs, nbRows, seed = 0):
+    """ Index inversé CSR aléatoire: dfs[t] lignes distinctes croissantes par terme.
+    """
+    rd = np.random.default_rng(seed)
+    off = np.zeros(len(dfs) + 1, dtype=np.int64)
+    off[1:] = np.cumsum(dfs)
+    rows = np.concatenate([ np.zeros(0, dtype=np.int64) ] + [ np.sort(rd.choice(nbRows, df, replace = False)) for df in dfs ])
+    tfs = np.where( rd.random(off[-1]) < 0.6, 1, rd.integers(1, 1000, off[-1]) )
+    return off, rows.astype(np.int32), tfs.astype(np.int32)
+
+
+def assertDecodes(off, rows, tfs):
+    cpostings = CompressedPostings.encode(off, rows, tfs)
+    for t in range(len(off) - 1):
+        got_rows, got_tfs = cpostings.decode(t)
+        assert np.array_equal(got_rows, rows[ off[t] : off[t+1] ])
+        assert np.array_equal(got_tfs, tfs[ off[t] : off[t+1] ])
+    all_rows, all_tfs = cpostings.decodeAll()
+    assert np.array_equal(all_rows, rows) and np.array_equal(all_tfs, tfs)
+
+
+@pytest.mark.parametrize('dfs', [ [0, 1, 5, 0], [BLOCK - 1, BLOCK, BLOCK + 1, 3 * BLOCK + 7], [0, 0] ])
+def test_round_trip(dfs):
+    assertDecodes(*postings(dfs, 5000))
+
+
+def test_round_trip_31_bits():
+    big = 2**31 - 1
+    off = np.array([0, 3, 3, 4, 4 + BLOCK + 2])
+    rows = np.concatenate([ [0, 2**30, big], [big], np.arange(BLOCK + 1), [big] ]).astype(np.int32)
+    tfs = np.concatenate([ [big, 1, 2**30], [1], np.ones(BLOCK + 1), [big] ]).astype(np.int32)
+    assertDecodes(off, rows, tfs)
+
+
+def test_width_zero_blocks():
+    # Ecarts de 1 à partir de la ligne 0 et tf de 1: largeur 0 sauf le premier écart
+    off = np.array([0, 2 * BLOCK])
+    rows = np.arange(2 * BLOCK, dtype=np.int32)
+    tfs = np.ones(2 * BLOCK, dtype=np.int32)
+    cpostings = CompressedPostings.encode(off, rows, tfs)
+    assert cpostings.blk_wtf.tolist() == [0, 0]
+    assertDecodes(off, rows, tfs)
+
+
+def test_decode_all_in_chunks(monkeypatch):
+    monkeypatch.setattr(CompressedPostings, 'CHUNK', 50)
+    assertDecodes(*postings([7, 300, 0, 40, 129, 1], 2000, seed = 3))
+
+
+def test_pack_unpack():
+    values = np.array([0, 1, 5, 2**31 - 1, 17], dtype=np.uint64)
+    data = np.frombuffer(Compression.pack(values, 31), dtype=np.uint8)
+    assert Compression.unpack(Compression.toWords(data), 0, len(values), 31).tolist() == values.tolist()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des mises à jour incrémentales de IndexerSimple.
+"""
+
+import numpy as np
+import pytest
+
+import Indexer
+import IRModel
+from conftest import newDocuments
+
+
+def state(index):
+    return ( index.version, index.getNbDocs(), index.getNbRows(), index.getTotalLength(), index.dfs.copy(), len(index.getCollection()) )
+
+
+def assertUnchanged(index, before):
+    after = state(index)
+    assert after[:4] == before[:4]
+    assert np.array_equal(after[4], before[4])
+    assert after[5] == before[5]
+
+
+@pytest.mark.parametrize('ids', [ [200, 5], [200, 201, 200] ])
+def test_add_invalid_batch_changes_nothing(index, ids):
+    before = state(index)
+    with pytest.raises(ValueError):
+        index.addDocuments( newDocuments(ids, 120) )
+    assertUnchanged(index, before)
+    assert index.getDocRow(200) < 0
+
+    # L'index reste utilisable
+    model = IRModel.Okapi(index)
+    assert len(model.getRanking('compiler grammar')) > 0
+
+
+@pytest.mark.parametrize('ids', [ [3, 9999], [9999] ])
+def test_delete_invalid_batch_changes_nothing(index, ids):
+    before = state(index)
+    with pytest.raises(KeyError):
+        index.deleteDocuments(ids)
+    assertUnchanged(index, before)
+
+
+def test_delete_duplicates(index):
+    nbDocs = index.getNbDocs()
+    index.deleteDocuments([3, 3, 4])
+    assert index.getNbDocs() == nbDocs - 2
+    assert index.getDocRow(3) < 0 and index.getDocRow(4) < 0
+
+
+@pytest.mark.parametrize('memory', [ 2000, 10**9 ])
+def test_spimi_streams_merge(index, tmp_path, monkeypatch, memory):
+    monkeypatch.setattr(Indexer.IndexerSPIMI, 'CHUNK', 16)
+    spimi = Indexer.IndexerSPIMI(memory = memory, tmpdir = str(tmp_path))
+    merged = []
+    merge = spimi._merge
+    def recorded(runs):
+        for t, rows, tfs in merge(runs):
+            merged.append(len(rows))
+            yield t, rows, tfs
+    monkeypatch.setattr(spimi, '_merge', recorded)
+
+    built = spimi.build(index.getCollection().values(), str(tmp_path / 'spimi.bin'))
+    assert max(merged) <= 16
+    assert built.terms == index.terms
+    for name in [ 'docIds', 'post_off', 'post_rows', 'post_tfs', 'fwd_off', 'fwd_terms', 'fwd_tfs', 'docLen', 'dfs' ]:
+        assert np.array_equal(getattr(built, name), getattr(index, name)), name
+
+
+@pytest.mark.parametrize('compact', [ False, True ])
+def test_updates_match_rebuild(index, queries, compact):
+    index.deleteDocuments([2, 11, 40, 77])
+    index.addDocuments( newDocuments([11, 200, 201], 120) )
+    index.deleteDocuments([200])
+    if compact: index.compact()
+
+    rows = index.getDocRow
+    documents = sorted( index.getCollection().values(), key = lambda document: rows(document.getId()) )
+    rebuilt = Indexer.IndexerSimple.fromDocuments(documents)
+
+    assert index.getNbDocs() == rebuilt.getNbDocs() and index.getTotalLength() == rebuilt.getTotalLength()
+    assert sorted(index.docIds[index.alive].tolist()) == sorted(rebuilt.docIds.tolist())
+    for idDoc in rebuilt.docIds.tolist():
+        assert index.getTfsForDoc(idDoc) == rebuilt.getTfsForDoc(idDoc)
+    df, idf = index.getDf(), index.getIdf()
+    for stem in rebuilt.terms:
+        assert index.getTfsForStem(stem) == rebuilt.getTfsForStem(stem)
+        assert df[stem] == rebuilt.getDf()[stem] and idf[stem] == pytest.approx(rebuilt.getIdf()[stem])
+
+    for model in ( lambda i: IRModel.Okapi(i), lambda i: IRModel.ModeleDirichlet(i) ):
+        for query in queries:
+            expected, got = model(rebuilt).getRanking(query, 10), model(index).getRanking(query, 10)
+            assert list(got.keys()) == list(expected.keys())
+            assert np.allclose(got.scores, expected.scores)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des modèles de recherche (IRModel): élagage WAND et calcul en batch.
+"""
+
+import numpy as np
+import pytest
+
+import IRModel
+import Weighter
+from conftest import newDocuments
+
+
+MODELS = {
+    'vectoriel'  : lambda i: IRModel.Vectoriel(i, Weighter.Weighter2(i)),
+    'cosinus'    : lambda i: IRModel.Vectoriel(i, Weighter.Weighter5(i), True),
+    'langue'     : lambda i: IRModel.ModeleLangue(i),
+    'dirichlet'  : lambda i: IRModel.ModeleDirichlet(i),
+    'deuxetapes' : lambda i: IRModel.ModeleDeuxEtapes(i),
+    'okapi'      : lambda i: IRModel.Okapi(i),
+}
+
+
+def assertSameRanking(got, expected):
+    assert list(got.keys()) == list(expected.keys())
+    assert np.allclose(got.scores, expected.scores)
+
+
+@pytest.mark.parametrize('k', [ 1, 5, 20 ])
+@pytest.mark.parametrize('update', [ False, True ])
+def test_wand_matches_exhaustive(index, queries, k, update):
+    if update:
+        index.deleteDocuments([5, 6, 60])
+        index.addDocuments( newDocuments([300, 301], 120) )
+    exhaustive, pruned = IRModel.Okapi(index), IRModel.Okapi(index, pruning = True)
+    for query in queries:
+        assertSameRanking(pruned.getRankingWAND(query, k), exhaustive.getRanking(query, k))
+        assertSameRanking(pruned.getRanking(query, k), exhaustive.getRanking(query, k))
+
+
+@pytest.mark.parametrize('name', sorted(MODELS))
+@pytest.mark.parametrize('k', [ None, 10 ])
+def test_batch_matches_single(index, queries, name, k):
+    model = MODELS[name](index)
+    queries = queries + queries[:1]
+    batch = model.getScoresBatch(queries, k)
+    assert len(batch) == len(queries)
+    for query, ranking in zip(queries, batch):
+        assertSameRanking(ranking, model.getRanking(query, k))
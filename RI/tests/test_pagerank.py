@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du PageRank personnalisé (PersonalizedPageRank).
+"""
+
+import numpy as np
+
+import Parser
+import IRModel
+import PageRank
+
+
+def test_ranking_after_update(index, queries):
+    ppr = PageRank.PersonalizedPageRank(index, IRModel.Okapi(index), n = 10)
+    for query in queries: ppr.getRanking(query)
+
+    # Document citant des documents existants, pertinent pour les requêtes
+    texte = '.I 500\n.T\ncompiler matrix sorting\n.W\n%s\n.X\n' % ' '.join(queries)
+    texte += ''.join('%d\t5\t500\n' % idDoc for idDoc in (3, 17, 42)) + '500\t5\t500\n'
+    index.addDocuments( Parser.parseBytes(texte.encode()) )
+
+    fresh = PageRank.PersonalizedPageRank(index, IRModel.Okapi(index), n = 10)
+    for query in queries:
+        assert list(ppr.getRanking(query).items()) == list(fresh.getRanking(query).items())
+    assert ppr.citations.getLinksFrom(500).tolist() == [3, 17, 42, 500]
+
+
+def test_solver_caches_are_separate(index, queries):
+    first = PageRank.PersonalizedPageRank(index, IRModel.Okapi(index), n = 10)
+    pushed = [ list(first.getRanking(query).items()) for query in queries ]
+    batched = [ list(ranking.items()) for ranking in first.getScoresBatch(queries) ]
+
+    # Ordre d'appel inverse: chaque méthode renvoie son propre résultat
+    second = PageRank.PersonalizedPageRank(index, IRModel.Okapi(index), n = 10)
+    assert [ list(ranking.items()) for ranking in second.getScoresBatch(queries) ] == batched
+    assert [ list(second.getRanking(query).items()) for query in queries ] == pushed
+
+
+def test_push_matches_batch(index, queries):
+    ppr = PageRank.PersonalizedPageRank(index, IRModel.Okapi(index), n = 10, eps = 1e-12)
+    for query, batch in zip(queries, ppr.getScoresBatch(queries, 10)):
+        push = ppr.getRanking(query, 10)
+        assert list(push.keys()) == list(batch.keys())
+        assert np.allclose(push.scores, batch.scores, atol = 1e-8)
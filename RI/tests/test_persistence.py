@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la sauvegarde et du rechargement de l'index (IndexerSimple.save/load).
+"""
+
+import numpy as np
+import pytest
+
+import Indexer
+import IRModel
+
+
+ARRAYS = [ 'docIds', 'docLen', 'dfs', 'fwd_off', 'fwd_terms', 'fwd_tfs' ]
+
+
+@pytest.mark.parametrize('compress', [ False, True ])
+def test_save_load_round_trip(index, queries, tmp_path, compress):
+    path = str(tmp_path / 'index.bin')
+    index.save(path, compress = compress)
+    loaded = Indexer.IndexerSimple.load(path)
+
+    assert loaded.terms == index.terms
+    for name in ARRAYS:
+        assert np.array_equal(getattr(loaded, name), getattr(index, name)), name
+    for expected, got in zip(index.getPostingsArrays(), loaded.getPostingsArrays()):
+        assert np.array_equal(expected, got)
+    assert np.allclose(loaded.getIdfs(), index.getIdfs())
+    assert loaded.getStrDoc(7) == index.getStrDoc(7)
+    assert loaded.getCitationGraph().getLinksFrom(7).tolist() == index.getCitationGraph().getLinksFrom(7).tolist()
+
+    for model in ( lambda i: IRModel.Okapi(i), lambda i: IRModel.ModeleLangue(i) ):
+        for query in queries:
+            assert list(model(loaded).getRanking(query, 10).items()) == list(model(index).getRanking(query, 10).items())
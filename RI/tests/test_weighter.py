@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des poids des documents par Weighter (WeightSegment, WeightMatrix).
+"""
+
+import numpy as np
+import pytest
+
+import Indexer
+import IRModel
+import Weighter
+from conftest import newDocuments
+
+
+WEIGHTERS = [ Weighter.Weighter1, Weighter.Weighter4, Weighter.Weighter5 ]
+
+
+def modify(index):
+    index.deleteDocuments([3, 8, 15])
+    index.addDocuments( newDocuments([3, 300, 301], 120) )
+
+
+@pytest.mark.parametrize('weighterClass', WEIGHTERS)
+def test_compact_keeps_weights(index, weighterClass):
+    weighter = weighterClass(index)
+    weighter.getWeightMatrix()
+    modify(index)
+    weighter.getWeightMatrix()
+    index.compact()
+
+    name = weighterClass.__name__
+    assert name in index.weights
+    kept = index.weights[name]
+    fresh = Weighter.WeightSegment.fromPostings(weighter, *index.getPostingsArrays(), index.getNbRows())
+    assert np.array_equal(kept.off, fresh.off)
+    assert np.array_equal(kept.cols, fresh.cols)
+    assert np.array_equal(kept.values, fresh.values)
+    assert np.allclose(kept.squares, fresh.squares)
+
+
+@pytest.mark.parametrize('normalized', [ False, True ])
+def test_weights_saved_after_update(index, queries, tmp_path, normalized):
+    model = IRModel.Vectoriel(index, Weighter.Weighter5(index), normalized)
+    model.getRanking(queries[0])
+    modify(index)
+    expected = [ list(model.getRanking(query).items()) for query in queries ]
+
+    index.save(str(tmp_path / 'index.bin'))
+    loaded = Indexer.IndexerSimple.load(str(tmp_path / 'index.bin'))
+    assert 'Weighter5' in loaded.weights
+    model = IRModel.Vectoriel(loaded, Weighter.Weighter5(loaded), normalized)
+    for query, ranking in zip(queries, expected):
+        got = model.getRanking(query)
+        assert list(got.keys()) == [ idDoc for idDoc, score in ranking ]
+        assert np.allclose(got.scores, [ score for idDoc, score in ranking ])
@@ -7,10 +7,19 @@ Created on Wed Jan 27 09:29:53 2021
 
 import re
 from collections import Counter
+from functools import lru_cache
 import porter
 #from utils.porter import porter
 
 
+# Cache des stems, partagé par toutes les instances de PorterStemmer: le
+# vocabulaire est petit devant le nombre de mots d'une collection, chaque mot
+# n'est donc stemmé qu'une fois. La taille du cache est bornée (LRU).
+STEM_CACHE_SIZE = 2**17
+
+stem = lru_cache(maxsize=STEM_CACHE_SIZE)(porter.stem)
+
+
 class TextRepresenter(object):
     '''
     classdocs
@@ -43,8 +52,26 @@ class PorterStemmer(TextRepresenter):
         
         ret=Counter(tab)
         
-        ret={porter.stem(a):b for (a,b) in ret.items()  if a not in self.stopWords}
+        ret={stem(a):b for (a,b) in ret.items()  if a not in self.stopWords}
         return ret
+    
+    def getTextRepresentations(self,texts):
+        """ Représentation d'une liste de textes (mode batch, pour l'indexation):
+            les formes distinctes de l'ensemble des textes sont collectées,
+            chacune est stemmée une seule fois, puis les stems sont reportés
+            dans la représentation de chaque texte.
+            Le résultat est identique à celui de getTextRepresentation sur
+            chaque texte.
+            @param texts: list(str), textes à représenter
+            @return : list(dict(str, int)), représentation de chaque texte
+        """
+        counts=[Counter(i.lower() for i in re.findall(r"\w+",text,re.UNICODE)) for text in texts]
+        
+        forms=set()
+        for c in counts: forms.update(c)
+        stems={a:stem(a) for a in forms if a not in self.stopWords}
+        
+        return [{stems[a]:b for (a,b) in c.items() if a in stems} for c in counts]
 
         
     def _setStopWords(self):
@@ -610,3 +637,79 @@ class PorterStemmer(TextRepresenter):
         self.stopWords.add("gt");
         self.stopWords.add("section");
         self.stopWords.add("cx");
+
+
+# Liste de stop-words par défaut, construite une seule fois
+STOP_WORDS = frozenset(PorterStemmer().stopWords)
+
+
+class Analyzer(TextRepresenter):
+    """ Analyseur de textes (tokenisation, stop-words, stemming) partagé par
+        l'indexation et les requêtes: il est créé une fois par index, sauvegardé
+        avec lui (cf IndexerSimple.save) et utilisé par tous les Weighter et
+        IRModel de cet index, de sorte que documents et requêtes sont toujours
+        analysés de la même façon.
+        Un Analyzer est immuable, et peut donc être partagé entre threads (le
+        cache des stems est lui aussi sûr). Pour changer l'analyse, créer un
+        autre Analyzer (ou une sous-classe redéfinissant analyze).
+        Attributs:
+            * self.pattern: str, expression régulière d'un token
+            * self.tokenizer: re.Pattern, pattern compilé
+            * self.stopWords: frozenset(str), mots ignorés
+            * self.stemming: bool, si True les tokens sont stemmés (Porter)
+    """
+    def __init__(self, stopWords=None, pattern=r"\w+", stemming=True):
+        """ Constructeur de la classe Analyzer.
+            @param stopWords: iterable(str), stop-words (par défaut STOP_WORDS)
+            @param pattern: str, expression régulière d'un token
+            @param stemming: bool, stemming des tokens
+        """
+        self.pattern = pattern
+        self.tokenizer = re.compile(pattern, re.UNICODE)
+        self.stopWords = STOP_WORDS if stopWords == None else frozenset(stopWords)
+        self.stemming = stemming
+    
+    def analyze(self, text):
+        """ Compte les formes (tokens en minuscules) du texte.
+            @param text: str, texte
+            @return : Counter(str), nombre d'occurrences de chaque forme
+        """
+        return Counter(i.lower() for i in self.tokenizer.findall(text))
+    
+    def stem(self, form):
+        return stem(form) if self.stemming else form
+    
+    def getTextRepresentation(self, text):
+        """ @param text: str, texte (document ou requête)
+            @return : dict(str, int), nombre d'occurrences de chaque stem
+        """
+        return {self.stem(a):b for (a,b) in self.analyze(text).items() if a not in self.stopWords}
+    
+    def getTextRepresentations(self, texts):
+        """ Représentation d'une liste de textes en batch: chaque forme
+            distincte n'est stemmée qu'une fois (cf PorterStemmer).
+            @param texts: list(str), textes à représenter
+            @return : list(dict(str, int)), représentation de chaque texte
+        """
+        counts = [self.analyze(text) for text in texts]
+        
+        forms = set()
+        for c in counts: forms.update(c)
+        stems = {a:self.stem(a) for a in forms if a not in self.stopWords}
+        
+        return [{stems[a]:b for (a,b) in c.items() if a in stems} for c in counts]
+    
+    def save(self, writer):
+        """ Ecrit la configuration de l'analyseur dans un IndexWriter.
+        """
+        writer.addStrings('analyzer_stop_words', sorted(self.stopWords))
+        writer.setMeta('analyzer', {'pattern' : self.pattern, 'stemming' : self.stemming})
+    
+    @classmethod
+    def load(cls, reader):
+        """ Relit l'analyseur écrit par save dans un IndexReader (analyseur par
+            défaut pour un index qui n'en contient pas).
+        """
+        config = reader.getMeta('analyzer')
+        if config == None: return cls()
+        return cls(reader.getStrings('analyzer_stop_words'), config['pattern'], config['stemming'])